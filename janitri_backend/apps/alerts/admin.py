@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Alert
+from .models import Alert, AlertRule
 
-admin.site.register(Alert)
\ No newline at end of file
+admin.site.register(Alert)
+admin.site.register(AlertRule)
\ No newline at end of file
@@ -0,0 +1,131 @@
+# apps/alerts/escalation.py
+"""
+Escalation of alerts left unresolved past their severity's SLA.
+
+Each open alert carries next_escalation_at, the time its next escalation
+step is due (None once resolved or fully escalated). A partial index over
+unresolved alerts with a due time makes the periodic scan touch only the
+rows that are due, however many historical alerts exist.
+
+ALERT_ESCALATION_TIERS lists roles from the one a new alert already
+notifies (DOCTOR, see services._notify_doctors) upwards. Escalation starts
+above that tier: step n (escalation_level becomes n) notifies the staff of
+the patient's place with the n-th role after DOCTOR, roles listed before
+DOCTOR are never escalated to. The ADMIN tier falls back to admins without
+a place. Steps are ALERT_ESCALATION_SLA[severity]
+seconds apart. Due rows are claimed with SELECT ... FOR UPDATE SKIP
+LOCKED and advanced in the same transaction, so concurrent workers never
+escalate an alert twice.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Alert
+from .tasks import send_alert_notification_task
+from apps.common.events import group_by_place, publish_on_commit
+from apps.users.directory import get_place_staff
+from apps.users.models import User
+
+logger = logging.getLogger(__name__)
+
+TIERS = tuple(getattr(settings, "ALERT_ESCALATION_TIERS", ("DOCTOR", "ADMIN")))
+SLA_SECONDS = getattr(settings, "ALERT_ESCALATION_SLA", {"CRITICAL": 300, "HIGH": 900, "MEDIUM": 1800, "LOW": 3600})
+BATCH_SIZE = getattr(settings, "ALERT_ESCALATION_BATCH_SIZE", 200)
+MAX_BATCHES = getattr(settings, "ALERT_ESCALATION_MAX_BATCHES", 25)
+# role notified when an alert opens, escalation steps go to the tiers above it
+NOTIFIED_ROLE = "DOCTOR"
+STEPS = TIERS[TIERS.index(NOTIFIED_ROLE) + 1:] if NOTIFIED_ROLE in TIERS else TIERS
+
+
+def sla(severity):
+    return timedelta(seconds=SLA_SECONDS.get(severity, SLA_SECONDS["CRITICAL"]))
+
+
+def first_escalation_at(severity, now):
+    return now + sla(severity) if STEPS else None
+
+
+def _recipients(alerts):
+    """{alert id: [email, ...]} for the tier each alert is escalating to."""
+    staff = get_place_staff({alert.patient.place_id for alert in alerts})
+    global_admins = None
+    recipients = {}
+    for alert in alerts:
+        role = STEPS[alert.escalation_level - 1]
+        emails = [email for email, staff_role in staff.get(alert.patient.place_id, []) if staff_role == role]
+        if not emails and role == "ADMIN":
+            if global_admins is None:
+                global_admins = list(
+                    User.objects.filter(role="ADMIN", place__isnull=True, is_active=True)
+                    .exclude(email="")
+                    .values_list("email", flat=True)
+                )
+            emails = global_admins
+        recipients[alert.id] = emails
+    return recipients
+
+
+def escalate_batch(now=None, batch_size=BATCH_SIZE):
+    """Claim and advance one batch of due alerts. Returns the escalated alerts."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        alerts = list(
+            Alert.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(resolved=False, next_escalation_at__lte=now)
+            .select_related("patient", "record")
+            .order_by("next_escalation_at", "id")[:batch_size]
+        )
+        if not alerts:
+            return []
+
+        for alert in alerts:
+            alert.escalation_level += 1
+            alert.next_escalation_at = now + sla(alert.severity) if alert.escalation_level < len(STEPS) else None
+        Alert.objects.bulk_update(alerts, ["escalation_level", "next_escalation_at"])
+
+        tasks = []
+        recipients = _recipients(alerts)
+        for alert in alerts:
+            if not recipients[alert.id]:
+                logger.warning("Alert %s escalated to %s but nobody has that role", alert.id, STEPS[alert.escalation_level - 1])
+                continue
+            tasks.append(
+                dict(
+                    alert_id=alert.id,
+                    recipients=recipients[alert.id],
+                    patient_name=alert.patient.name,
+                    patient_id=alert.patient_id,
+                    bpm=alert.peak_bpm or (alert.record.bpm if alert.record else None),
+                    recorded_at=alert.last_seen_at or (alert.record.recorded_at if alert.record else alert.created_at),
+                    escalation_level=alert.escalation_level,
+                )
+            )
+
+        def notify():
+            for kwargs in tasks:
+                send_alert_notification_task.delay(**kwargs)
+
+        transaction.on_commit(notify)
+        publish_on_commit(
+            (place_id, "alert.escalated", {"alerts": [
+                {"id": alert.id, "patient": alert.patient_id, "escalation_level": alert.escalation_level}
+                for alert in place_alerts
+            ]})
+            for place_id, place_alerts in group_by_place(alerts, lambda alert: alert.patient.place_id)
+        )
+    return alerts
+
+
+def escalate_due(now=None, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+    escalated = 0
+    for _ in range(max_batches):
+        alerts = escalate_batch(now, batch_size)
+        escalated += len(alerts)
+        if len(alerts) < batch_size:
+            break
+    return escalated
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from apps.alerts.tasks import ALERT_EMAIL_SUBJECT, send_alert_notification_task
+from utils.services.email.pool import get_pool
+from utils.services.email.send_mail import send_email
+from utils.services.email.sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure alert email throughput against a local SMTP sink: one connection per "
+        "message versus the pooled per-alert fan-out (no database access)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alerts", type=int, default=200)
+        parser.add_argument("--recipients", type=int, default=5, help="Doctors notified per alert.")
+
+    def _run(self, label, sink, send):
+        before = dict(sink.stats)
+        started = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - started
+        messages = sink.stats["messages"] - before["messages"]
+        connections = sink.stats["connections"] - before["connections"]
+        self.stdout.write(
+            f"{label}: {messages} message(s) over {connections} connection(s) in {elapsed:.3f} s, "
+            f"{messages / elapsed:,.0f} messages/s"
+        )
+
+    def handle(self, *args, **options):
+        recipients = [f"doctor{i}@example.com" for i in range(options["recipients"])]
+        now = timezone.now()
+        alerts = [
+            dict(patient_name=f"Patient {i}", patient_id=i, bpm=150, recorded_at=now)
+            for i in range(options["alerts"])
+        ]
+
+        def per_message():
+            for alert in alerts:
+                context = dict(alert, recorded_at=now.strftime("%Y-%m-%d %H:%M:%S"))
+                for email in recipients:
+                    send_email(ALERT_EMAIL_SUBJECT, email, "alert_email", dict(context))
+
+        def pooled():
+            for alert_id, alert in enumerate(alerts):
+                send_alert_notification_task(alert_id, recipients, **alert)
+
+        with SMTPSink() as sink, override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST=sink.host,
+            EMAIL_PORT=sink.port,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            pool = get_pool()
+            pool.close()
+            try:
+                self._run("One connection per message", sink, per_message)
+                self._run("Pooled per-alert fan-out", sink, pooled)
+            finally:
+                pool.close()
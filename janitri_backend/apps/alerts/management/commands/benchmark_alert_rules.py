@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.alerts.rules import Rule, RuleEvaluator
+from apps.alerts.windows import COUNT, TIME, LocalWindowStore
+
+
+class Command(BaseCommand):
+    help = "Measure alert rule evaluation throughput on synthetic readings (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readings", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=5000, help="Readings per evaluation call.")
+        parser.add_argument("--places", type=int, default=200, help="Places with their own rules.")
+        parser.add_argument("--patients", type=int, default=2000, help="Patients with their own rules.")
+        parser.add_argument("--windowed", action="store_true", help="Give each place count and time window rules.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        places, patients = options["places"], options["patients"]
+
+        rules = [Rule(1, None, None, "gt", 120, "CRITICAL"), Rule(2, None, None, "lt", 40, "CRITICAL")]
+        for place_id in range(1, places + 1):
+            rules += [
+                Rule(None, None, place_id, "gte", 110, "HIGH"),
+                Rule(None, None, place_id, "gt", 130, "CRITICAL"),
+                Rule(None, None, place_id, "lt", 50, "HIGH"),
+            ]
+            if options["windowed"]:
+                rules += [
+                    Rule(place_id, None, place_id, "gt", 160, "HIGH", "", COUNT, 6, 5),
+                    Rule(-place_id, None, place_id, "lt", 110, "MEDIUM", "", TIME, 60, 3),
+                ]
+        for patient_id in range(1, patients + 1):
+            # neonatal style ranges
+            rules += [Rule(None, patient_id, None, "gt", 180, "CRITICAL"), Rule(None, patient_id, None, "lt", 100, "HIGH")]
+
+        started = time.perf_counter()
+        evaluator = RuleEvaluator(rules)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        n = options["readings"]
+        patient_ids = rng.integers(1, patients * 5, n)
+        place_ids = rng.integers(1, places * 2, n)
+        bpm = rng.integers(30, 200, n)
+        timestamps = np.sort(rng.uniform(0, n / 100, n))
+        store = LocalWindowStore()
+
+        batch = options["batch_size"]
+        matched = 0
+        started = time.perf_counter()
+        for offset in range(0, n, batch):
+            window = slice(offset, offset + batch)
+            matches = evaluator.match(patient_ids[window], place_ids[window], bpm[window], timestamps[window], store)
+            matched += int((matches >= 0).sum())
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Compiled {len(rules)} rule(s) in {compile_ms:.1f} ms")
+        self.stdout.write(f"Evaluated {n} reading(s) in batches of {batch}: {elapsed:.3f} s, {matched} alert(s)")
+        self.stdout.write(self.style.SUCCESS(f"{n / elapsed:,.0f} readings/s"))
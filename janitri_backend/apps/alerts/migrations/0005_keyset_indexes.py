@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0004_alter_alert_record'),
+        ('patients', '0003_alter_patient_created_by'),
+        ('records', '0003_heartraterollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['created_at', 'id'], name='alerts_created_id_idx'),
+        ),
+    ]
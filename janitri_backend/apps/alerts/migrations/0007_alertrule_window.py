@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0006_alertrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertrule',
+            name='min_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='alertrule',
+            name='window_size',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='alertrule',
+            name='window_type',
+            field=models.CharField(choices=[('sample', 'Single reading'), ('count', 'Matches in last N readings'), ('time', 'Mean over last N seconds')], default='sample', max_length=6),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:35
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+DEFAULT_SLA = {"CRITICAL": 300, "HIGH": 900, "MEDIUM": 1800, "LOW": 3600}
+
+
+def schedule_open_alerts(apps, schema_editor):
+    """Give alerts that are open at upgrade time their first escalation, due from their creation."""
+    Alert = apps.get_model("alerts", "Alert")
+    sla = getattr(settings, "ALERT_ESCALATION_SLA", DEFAULT_SLA)
+    for severity, seconds in sla.items():
+        Alert.objects.filter(resolved=False, severity=severity, next_escalation_at__isnull=True).update(
+            next_escalation_at=models.ExpressionWrapper(
+                models.F("created_at") + timedelta(seconds=seconds), output_field=models.DateTimeField()
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0008_alert_coalescing'),
+        ('patients', '0004_keyset_indexes'),
+        ('records', '0005_heartraterecord_ingest_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='escalation_level',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='next_escalation_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('next_escalation_at__isnull', False), ('resolved', False)), fields=['next_escalation_at', 'id'], name='alerts_escalation_due_idx'),
+        ),
+        migrations.RunPython(schedule_open_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alerts', '0010_alert_acknowledgement'),
+        ('records', '0008_heartratearchive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alert',
+            name='record',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alerts', to='records.heartraterecord'),
+        ),
+    ]
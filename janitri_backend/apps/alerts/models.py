@@ -1,13 +1,37 @@
 from django.db import models
 from django.conf import settings
+from apps.common.models import BaseModel
+from utils.constants.choices import ALERT_OPERATOR_CHOICES, ALERT_SEVERITY_CHOICES, ALERT_WINDOW_CHOICES
 
 # Create your models here.
 
 class Alert(models.Model):
     patient = models.ForeignKey("patients.Patient", on_delete=models.CASCADE, related_name="alerts")
-    record = models.OneToOneField("records.HeartRateRecord", on_delete=models.CASCADE, related_name="alerts")
+    # None once the reading has been archived by the retention job
+    record = models.OneToOneField(
+        "records.HeartRateRecord", on_delete=models.SET_NULL, null=True, blank=True, related_name="alerts"
+    )
     message = models.CharField(max_length=255)
+    severity = models.CharField(max_length=10, choices=ALERT_SEVERITY_CHOICES, default="CRITICAL")
+    rule = models.ForeignKey("alerts.AlertRule", on_delete=models.SET_NULL, null=True, blank=True, related_name="alerts")
+    # readings of the same patient and condition are coalesced into one open alert
+    condition_key = models.CharField(max_length=64, null=True, blank=True)
+    occurrences = models.PositiveIntegerField(default=1)
+    peak_bpm = models.PositiveIntegerField(null=True, blank=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    last_notified_at = models.DateTimeField(null=True, blank=True)
+    # number of escalation steps taken and when the next one is due (None when resolved or fully escalated)
+    escalation_level = models.PositiveSmallIntegerField(default=0)
+    next_escalation_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    acknowledged_at = models.DateTimeField(null=True, blank=True)
+    acknowledged_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="alerts_acknowledged"
+    )
     resolved = models.BooleanField(default=False)
     resolved_at = models.DateTimeField(null=True, blank=True)
     resolved_by = models.ForeignKey(
@@ -18,5 +42,58 @@ class Alert(models.Model):
         related_name="alerts_resolved"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="alerts_created_id_idx"),
+            models.Index(
+                fields=["next_escalation_at", "id"],
+                name="alerts_escalation_due_idx",
+                condition=models.Q(resolved=False, next_escalation_at__isnull=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["patient", "condition_key"],
+                condition=models.Q(resolved=False, condition_key__isnull=False),
+                name="alerts_one_open_per_condition",
+            ),
+        ]
+
     def __str__(self):
         return f"Alert for {self.patient.name}: {self.message}"
+
+
+class AlertRule(BaseModel):
+    """
+    Threshold rule on bpm. Rules are scoped to a patient, a place, or
+    everyone (neither set); a reading is checked against the most specific
+    scope that has active rules.
+    """
+    name = models.CharField(max_length=100)
+    place = models.ForeignKey("places.Place", on_delete=models.CASCADE, null=True, blank=True, related_name="alert_rules")
+    patient = models.ForeignKey(
+        "patients.Patient", on_delete=models.CASCADE, null=True, blank=True, related_name="alert_rules"
+    )
+    operator = models.CharField(max_length=3, choices=ALERT_OPERATOR_CHOICES)
+    threshold = models.PositiveIntegerField(help_text="Beats per minute")
+    severity = models.CharField(max_length=10, choices=ALERT_SEVERITY_CHOICES, default="HIGH")
+    message = models.CharField(
+        max_length=200, blank=True, help_text="Optional alert text, may use {bpm} and {threshold}"
+    )
+    # "count": min_count of the last window_size readings match,
+    # "time": mean over the last window_size seconds matches, once it holds min_count readings
+    window_type = models.CharField(max_length=6, choices=ALERT_WINDOW_CHOICES, default="sample")
+    window_size = models.PositiveIntegerField(default=1)
+    min_count = models.PositiveIntegerField(default=1)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(place__isnull=True) | models.Q(patient__isnull=True),
+                name="alerts_rule_single_scope",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name}: bpm {self.operator} {self.threshold} {self.window_type} ({self.severity})"
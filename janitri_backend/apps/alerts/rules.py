@@ -0,0 +1,248 @@
+# apps/alerts/rules.py
+"""
+Alert rule evaluation.
+
+Active AlertRule rows are compiled into numpy arrays and evaluated against
+whole batches of readings at once. Each reading is checked against the most
+specific scope that has rules: its patient's rules, else its place's, else
+the global ones. Without any global rule the legacy ALERT_CRITICAL_HIGH /
+ALERT_CRITICAL_LOW thresholds apply. When several rules match, the most
+severe one wins (the first one on a tie).
+
+Windowed rules (see windows.py) compare the same way but only match once
+the condition holds over their window, using per-patient streaming state.
+
+The compiled evaluator is cached per worker process and rebuilt when the
+rules version in the Django cache changes (bumped on every rule change).
+"""
+
+import operator
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AlertRule
+from .windows import COUNT, SAMPLE, get_window_store, state_field, update_count, update_time
+from utils.constants.choices import ALERT_OPERATOR_CHOICES, ALERT_SEVERITY_CHOICES
+
+CRITICAL_HIGH = getattr(settings, "ALERT_CRITICAL_HIGH", 120)
+CRITICAL_LOW = getattr(settings, "ALERT_CRITICAL_LOW", 40)
+
+VERSION_CACHE_KEY = "alerts:rules:version"
+
+SEVERITY_RANK = {key: rank for rank, (key, _) in enumerate(ALERT_SEVERITY_CHOICES)}
+OPERATOR_CODE = {key: code for code, (key, _) in enumerate(ALERT_OPERATOR_CHOICES)}
+OPERATOR_SYMBOL = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "eq": "=", "ne": "!="}
+OPERATOR_FUNC = {
+    "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le, "eq": operator.eq, "ne": operator.ne,
+}
+
+# outcome of each operator for sign(bpm - threshold) = -1, 0, 1
+_OUTCOMES = np.array([
+    {
+        "gt": (False, False, True),
+        "gte": (False, True, True),
+        "lt": (True, False, False),
+        "lte": (True, True, False),
+        "eq": (False, True, False),
+        "ne": (True, False, True),
+    }[key]
+    for key, _ in ALERT_OPERATOR_CHOICES
+])
+
+
+class Rule:
+    """Plain copy of an AlertRule, detached from the ORM."""
+
+    __slots__ = (
+        "id", "patient_id", "place_id", "operator", "threshold", "severity", "message",
+        "window_type", "window_size", "min_count",
+    )
+
+    def __init__(self, id, patient_id, place_id, operator, threshold, severity, message="",
+                 window_type=SAMPLE, window_size=1, min_count=1):
+        self.id = id
+        self.patient_id = patient_id
+        self.place_id = place_id
+        self.operator = operator
+        self.threshold = threshold
+        self.severity = severity
+        self.message = message
+        self.window_type = window_type
+        self.window_size = window_size
+        self.min_count = min_count
+
+    @property
+    def condition_key(self):
+        """Identifies the condition open alerts are coalesced on."""
+        if self.id is not None:
+            return f"rule:{self.id}"
+        return f"default:{self.operator}:{self.threshold}"
+
+    @property
+    def lower_is_worse(self):
+        return self.operator in ("lt", "lte")
+
+    def describe(self):
+        condition = f"{OPERATOR_SYMBOL[self.operator]} {self.threshold}"
+        if self.window_type == COUNT:
+            return f"{condition} in {self.min_count} of last {self.window_size} readings"
+        if self.window_type != SAMPLE:
+            return f"mean over {self.window_size}s {condition}"
+        return condition
+
+    def format_message(self, bpm):
+        if self.message:
+            return self.message.format(bpm=bpm, threshold=self.threshold)
+        return f"{self.severity.title()} heart rate alert: {bpm} bpm ({self.describe()})"
+
+
+DEFAULT_RULES = (
+    Rule(None, None, None, "gt", CRITICAL_HIGH, "CRITICAL", "Critical high heart rate detected: {bpm} bpm"),
+    Rule(None, None, None, "lt", CRITICAL_LOW, "CRITICAL", "Critical low heart rate detected: {bpm} bpm"),
+)
+
+
+class RuleEvaluator:
+    """Rules grouped by scope and flattened into arrays for vectorized matching."""
+
+    def __init__(self, rules):
+        rules = list(rules)
+        global_rules = [r for r in rules if r.patient_id is None and r.place_id is None]
+        patient_groups, place_groups = {}, {}
+        for rule in rules:
+            if rule.patient_id is not None:
+                patient_groups.setdefault(rule.patient_id, []).append(rule)
+            elif rule.place_id is not None:
+                place_groups.setdefault(rule.place_id, []).append(rule)
+
+        # group 0 is the global scope, then places, then patients
+        groups = [global_rules or list(DEFAULT_RULES)]
+        self.place_keys = np.array(sorted(place_groups), dtype=np.int64)
+        groups.extend(place_groups[key] for key in self.place_keys.tolist())
+        self.patient_keys = np.array(sorted(patient_groups), dtype=np.int64)
+        groups.extend(patient_groups[key] for key in self.patient_keys.tolist())
+        self.place_group_ids = np.arange(1, 1 + len(self.place_keys))
+        self.patient_group_ids = np.arange(1 + len(self.place_keys), len(groups))
+
+        self.rules = [rule for group in groups for rule in group]
+        counts = np.array([len(group) for group in groups], dtype=np.int64)
+        self.group_counts = counts
+        self.group_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        self.operators = np.array([OPERATOR_CODE[r.operator] for r in self.rules], dtype=np.int64)
+        self.thresholds = np.array([r.threshold for r in self.rules], dtype=np.int64)
+        self.ranks = np.array([SEVERITY_RANK[r.severity] for r in self.rules], dtype=np.int64)
+        self.windowed = np.array([r.window_type != SAMPLE for r in self.rules], dtype=bool)
+
+    def _scope(self, keys, group_ids, values, groups):
+        if not len(keys):
+            return
+        pos = np.searchsorted(keys, values).clip(max=len(keys) - 1)
+        hit = keys[pos] == values
+        groups[hit] = group_ids[pos[hit]]
+
+    def _evaluate_windows(self, pairs, pair_reading, pair_rule, hit, patient_ids, bpm, timestamps, store):
+        """Advance the window state of each (reading, windowed rule) pair, oldest reading first."""
+        order = np.lexsort((pair_reading[pairs], timestamps[pair_reading[pairs]])).tolist()
+        readings = pair_reading[pairs].tolist()
+        rule_indexes = pair_rule[pairs].tolist()
+        sample_hits = hit[pairs].tolist()
+        patient_ids, bpm, timestamps = patient_ids.tolist(), bpm.tolist(), timestamps.tolist()
+
+        fields = {}
+        for reading, index in zip(readings, rule_indexes):
+            fields.setdefault(patient_ids[reading], set()).add(state_field(self.rules[index]))
+
+        def advance(states):
+            result = np.zeros(len(readings), dtype=bool)
+            for pos in order:
+                reading, rule = readings[pos], self.rules[rule_indexes[pos]]
+                key = (patient_ids[reading], state_field(rule))
+                if rule.window_type == COUNT:
+                    states[key], result[pos] = update_count(
+                        states.get(key), sample_hits[pos], rule.window_size, rule.min_count, timestamps[reading]
+                    )
+                else:
+                    states[key], mean = update_time(
+                        states.get(key), timestamps[reading], bpm[reading], rule.window_size, rule.min_count
+                    )
+                    result[pos] = mean is not None and OPERATOR_FUNC[rule.operator](mean, rule.threshold)
+            return result
+
+        # rerun from freshly loaded states if a concurrent batch saved first
+        return store.update({patient_id: sorted(names) for patient_id, names in fields.items()}, advance)
+
+    def match(self, patient_ids, place_ids, bpm, timestamps=None, store=None):
+        """
+        Evaluate arrays of readings. Returns an int array with the index into
+        self.rules of the winning rule for each reading, -1 where none matched.
+        timestamps (epoch seconds) are required when windowed rules apply.
+        """
+        patient_ids = np.asarray(patient_ids, dtype=np.int64)
+        bpm = np.asarray(bpm, dtype=np.int64)
+        n = len(bpm)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+
+        groups = np.zeros(n, dtype=np.int64)
+        if place_ids is not None:
+            self._scope(self.place_keys, self.place_group_ids, np.asarray(place_ids, dtype=np.int64), groups)
+        self._scope(self.patient_keys, self.patient_group_ids, patient_ids, groups)
+
+        # expand to one row per (reading, rule of its group)
+        counts = self.group_counts[groups]
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        pair_reading = np.repeat(np.arange(n), counts)
+        pair_rule = self.group_starts[groups][pair_reading] + (np.arange(counts.sum()) - offsets[pair_reading])
+
+        sign = np.sign(bpm[pair_reading] - self.thresholds[pair_rule]) + 1
+        hit = _OUTCOMES[self.operators[pair_rule], sign]
+
+        pairs = np.flatnonzero(self.windowed[pair_rule])
+        if len(pairs):
+            hit[pairs] = self._evaluate_windows(
+                pairs, pair_reading, pair_rule, hit, patient_ids, bpm,
+                np.asarray(timestamps, dtype=np.float64), store or get_window_store(),
+            )
+
+        # most severe hit wins, lower rule index breaks ties
+        width = len(self.rules) + 1
+        score = np.where(hit, (self.ranks[pair_rule] + 1) * width - pair_rule, 0)
+        best = np.maximum.reduceat(score, offsets)
+        rank_plus_one = -(-best // width)
+        return np.where(best > 0, rank_plus_one * width - best, -1)
+
+
+def load_rules():
+    return [
+        Rule(*row)
+        for row in AlertRule.objects.filter(is_active=True)
+        .order_by("id")
+        .values_list(
+            "id", "patient_id", "place_id", "operator", "threshold", "severity", "message",
+            "window_type", "window_size", "min_count",
+        )
+    ]
+
+
+def bump_rules_version():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+_evaluator = None
+_evaluator_version = None
+
+
+def get_evaluator():
+    """The compiled rules of this worker, recompiled when the rules version changes."""
+    global _evaluator, _evaluator_version
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    if _evaluator is None or version != _evaluator_version:
+        _evaluator = RuleEvaluator(load_rules())
+        _evaluator_version = version
+    return _evaluator
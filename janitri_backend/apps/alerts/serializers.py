@@ -1,12 +1,19 @@
+import string
 from rest_framework import serializers
-from .models import Alert
+from django.utils import timezone
+from .escalation import first_escalation_at
+from .models import Alert, AlertRule
+from .windows import COUNT, COUNT_MAX_WINDOW, SAMPLE, TIME, TIME_BUCKETS
 from apps.patients.serializers import PatientSerializer
 from apps.records.serializers import HeartRateRecordSerializer
 from django.contrib.auth import get_user_model
+from apps.common.serializers import DynamicFieldsModelSerializer
 
 User = get_user_model()
 
-class AlertSerializer(serializers.ModelSerializer):
+MESSAGE_PLACEHOLDERS = ("bpm", "threshold")
+
+class AlertSerializer(DynamicFieldsModelSerializer):
     patient_detail = PatientSerializer(source="patient", read_only=True)
     record_detail = HeartRateRecordSerializer(source="record", read_only=True)
     resolved_by_detail = serializers.StringRelatedField(source="resolved_by", read_only=True)
@@ -20,10 +27,127 @@ class AlertSerializer(serializers.ModelSerializer):
             "record",
             "record_detail",
             "message",
+            "severity",
+            "rule",
+            "condition_key",
+            "occurrences",
+            "peak_bpm",
+            "last_seen_at",
+            "last_notified_at",
+            "escalation_level",
+            "next_escalation_at",
             "created_at",
+            "acknowledged_at",
+            "acknowledged_by",
             "resolved",
             "resolved_at",
             "resolved_by",
             "resolved_by_detail",
         ]
-        read_only_fields = ["created_at", "resolved_at", "resolved_by"]
+        read_only_fields = [
+            "created_at", "resolved_at", "resolved_by",
+            "condition_key", "occurrences", "peak_bpm", "last_seen_at", "last_notified_at",
+            "escalation_level", "next_escalation_at", "acknowledged_at", "acknowledged_by",
+        ]
+
+    def create(self, validated_data):
+        if not validated_data.get("resolved"):
+            validated_data["next_escalation_at"] = first_escalation_at(
+                validated_data.get("severity", "CRITICAL"), timezone.now()
+            )
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if validated_data.get("resolved"):
+            validated_data["next_escalation_at"] = None
+        return super().update(instance, validated_data)
+
+
+class AlertBulkActionSerializer(serializers.Serializer):
+    """Alerts to act on: explicit ids, or a filter by patient, place and creation time."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=5000)
+    patient = serializers.IntegerField(required=False, min_value=1)
+    place = serializers.IntegerField(required=False, min_value=1)
+    before = serializers.DateTimeField(required=False, help_text="Only alerts created before this time.")
+
+    def validate(self, attrs):
+        if not attrs.get("ids") and not ({"patient", "place"} & set(attrs)):
+            raise serializers.ValidationError("Provide ids, or a patient or place filter.")
+        return attrs
+
+    def filter(self, queryset):
+        data = self.validated_data
+        if data.get("ids"):
+            queryset = queryset.filter(id__in=data["ids"])
+        if "patient" in data:
+            queryset = queryset.filter(patient_id=data["patient"])
+        if "place" in data:
+            queryset = queryset.filter(patient__place_id=data["place"])
+        if "before" in data:
+            queryset = queryset.filter(created_at__lt=data["before"])
+        return queryset
+
+
+class AlertRuleSerializer(DynamicFieldsModelSerializer):
+    created_by = serializers.StringRelatedField(read_only=True)
+    modified_by = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = AlertRule
+        fields = [
+            "id",
+            "name",
+            "place",
+            "patient",
+            "operator",
+            "threshold",
+            "severity",
+            "message",
+            "window_type",
+            "window_size",
+            "min_count",
+            "is_active",
+            "created_at",
+            "modified_at",
+            "created_by",
+            "modified_by",
+        ]
+        read_only_fields = ["created_at", "modified_at", "created_by", "modified_by"]
+
+    def validate_message(self, value):
+        # parsed, not formatted: attribute / index access, conversions and format specs
+        # (e.g. a huge width) must not reach format_message
+        try:
+            fields = [
+                (name, spec, conversion)
+                for _, name, spec, conversion in string.Formatter().parse(value)
+                if name is not None
+            ]
+        except ValueError:
+            fields = None
+        if fields is None or any(
+            name not in MESSAGE_PLACEHOLDERS or spec or conversion for name, spec, conversion in fields
+        ):
+            raise serializers.ValidationError("Message may only use the {bpm} and {threshold} placeholders.")
+        return value
+
+    def validate(self, attrs):
+        place = attrs.get("place", getattr(self.instance, "place", None))
+        patient = attrs.get("patient", getattr(self.instance, "patient", None))
+        if place and patient:
+            raise serializers.ValidationError("A rule applies to a place or a patient, not both.")
+
+        window_type = attrs.get("window_type", getattr(self.instance, "window_type", SAMPLE))
+        window_size = attrs.get("window_size", getattr(self.instance, "window_size", 1))
+        min_count = attrs.get("min_count", getattr(self.instance, "min_count", 1))
+        if window_type == COUNT:
+            if not 1 <= window_size <= COUNT_MAX_WINDOW:
+                raise serializers.ValidationError({"window_size": f"Must be between 1 and {COUNT_MAX_WINDOW} readings."})
+            if not 1 <= min_count <= window_size:
+                raise serializers.ValidationError({"min_count": "Must be between 1 and window_size."})
+        elif window_type == TIME:
+            if not TIME_BUCKETS <= window_size <= 86400:
+                raise serializers.ValidationError({"window_size": f"Must be between {TIME_BUCKETS} and 86400 seconds."})
+            if min_count < 1:
+                raise serializers.ValidationError({"min_count": "Must be at least 1."})
+        return attrs
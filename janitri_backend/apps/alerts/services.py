@@ -0,0 +1,304 @@
+# apps/alerts/services.py
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models.sql import UpdateQuery
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .escalation import first_escalation_at
+from .models import Alert
+from .rules import get_evaluator
+from .tasks import send_alert_notification_task
+from apps.common.events import group_by_place, publish_on_commit
+from apps.patients.models import Patient
+from apps.users.directory import get_recipients
+
+logger = logging.getLogger(__name__)
+
+RENOTIFY_COOLDOWN = timedelta(seconds=getattr(settings, "ALERT_RENOTIFY_COOLDOWN", 900))
+
+
+class Condition:
+    """Triggered readings of one patient for one rule within a batch."""
+
+    def __init__(self, patient, rule, record):
+        self.patient = patient
+        self.rule = rule
+        self.first = record
+        self.last = record
+        self.count = 0
+        self.peak = record.bpm
+
+    def add(self, record):
+        self.count += 1
+        if record.recorded_at < self.first.recorded_at:
+            self.first = record
+        if record.recorded_at >= self.last.recorded_at:
+            self.last = record
+        self.peak = min(self.peak, record.bpm) if self.rule.lower_is_worse else max(self.peak, record.bpm)
+
+
+def _match(records, patients, store=None):
+    evaluator = get_evaluator()
+    matches = evaluator.match(
+        [record.patient_id for record in records],
+        [patients[record.patient_id].place_id for record in records],
+        [record.bpm for record in records],
+        [record.recorded_at.timestamp() for record in records],
+        store,
+    )
+    conditions = {}
+    for record, index in zip(records, matches.tolist()):
+        if index < 0:
+            continue
+        rule = evaluator.rules[index]
+        key = (record.patient_id, rule.condition_key)
+        if key not in conditions:
+            conditions[key] = Condition(patients[record.patient_id], rule, record)
+        conditions[key].add(record)
+    return conditions
+
+
+def _coalesce(alert, condition):
+    """Fold a batch of triggered readings into an open alert with a single UPDATE."""
+    peak = Least if condition.rule.lower_is_worse else Greatest
+    Alert.objects.filter(pk=alert.pk).update(
+        occurrences=F("occurrences") + condition.count,
+        peak_bpm=peak(F("peak_bpm"), condition.peak),
+        last_seen_at=Greatest(F("last_seen_at"), condition.last.recorded_at),
+    )
+
+
+def _claim_renotify(alert, now):
+    """Atomically take the right to re-notify an open alert once its cooldown passed."""
+    return Alert.objects.filter(pk=alert.pk).filter(
+        Q(last_notified_at__isnull=True) | Q(last_notified_at__lte=now - RENOTIFY_COOLDOWN)
+    ).update(last_notified_at=now) == 1
+
+
+def create_alerts(records, history=False, store=None):
+    """
+    Evaluate a batch of saved HeartRateRecords against the alert rules.
+
+    Readings matching the same rule for a patient with an open alert are
+    coalesced into it (occurrences, peak_bpm, last_seen_at) instead of
+    inserting new rows. New alerts are created with one INSERT; doctors of
+    each place are notified for new alerts, and again for open ones once
+    ALERT_RENOTIFY_COOLDOWN has passed since the last notification.
+
+    With history=True (backfilled readings) alerts are recorded only, already
+    resolved: nobody is notified, nothing is pushed or escalated, and open
+    alerts of live readings are neither coalesced into nor found. Pass a
+    store of their own so history does not advance the live rule windows.
+    """
+    notify = not history
+    if not records:
+        return []
+
+    patients = Patient.objects.filter(id__in={record.patient_id for record in records}).only("id", "name", "place_id")
+    patients = {patient.id: patient for patient in patients}
+    records = [record for record in records if record.patient_id in patients]
+
+    conditions = _match(records, patients, store)
+    if not conditions:
+        return []
+
+    now = timezone.now()
+    open_alerts = {} if history else {
+        (alert.patient_id, alert.condition_key): alert
+        for alert in Alert.objects.filter(
+            resolved=False,
+            patient_id__in={patient_id for patient_id, _ in conditions},
+            condition_key__in={key for _, key in conditions},
+        )
+    }
+    # Alert.record is OneToOne, never point a new alert at a record that already has one
+    linked = set(
+        Alert.objects.filter(record_id__in=[c.first.id for c in conditions.values()]).values_list("record_id", flat=True)
+    )
+
+    notifications = []
+    new = []
+    for key, condition in conditions.items():
+        alert = open_alerts.get(key)
+        if alert is not None:
+            _coalesce(alert, condition)
+            if notify and _claim_renotify(alert, now):
+                notifications.append((condition, alert))
+        elif condition.first.id not in linked:
+            new.append(condition)
+
+    alerts = []
+    if new:
+        try:
+            with transaction.atomic():
+                alerts = Alert.objects.bulk_create([_new_alert(condition, now, history) for condition in new])
+            if notify:
+                notifications.extend(zip(new, alerts))
+        except IntegrityError:
+            # a concurrent batch opened one of these alerts first, coalesce one by one
+            for condition in new:
+                alert, created = _open_or_coalesce(condition, now)
+                if created:
+                    alerts.append(alert)
+                    if notify:
+                        notifications.append((condition, alert))
+    logger.info(
+        "Alerts from %s reading(s): %s new, %s coalesced", len(records), len(alerts), len(conditions) - len(new)
+    )
+
+    if notifications:
+        _notify_doctors(notifications)
+    if alerts and notify:
+        publish_on_commit(
+            (place_id, "alert.created", {"alerts": [_alert_event(alert) for alert in place_alerts]})
+            for place_id, place_alerts in group_by_place(alerts, lambda alert: patients[alert.patient_id].place_id)
+        )
+    return alerts
+
+
+def _alert_event(alert):
+    return {
+        "id": alert.id,
+        "patient": alert.patient_id,
+        "severity": alert.severity,
+        "message": alert.message,
+        "bpm": alert.peak_bpm,
+        "created_at": alert.created_at,
+    }
+
+
+def _new_alert(condition, now, history=False):
+    rule, record = condition.rule, condition.first
+    return Alert(
+        patient_id=record.patient_id,
+        record=record,
+        rule_id=rule.id,
+        severity=rule.severity,
+        message=rule.format_message(record.bpm),
+        condition_key=rule.condition_key,
+        occurrences=condition.count,
+        peak_bpm=condition.peak,
+        last_seen_at=condition.last.recorded_at,
+        last_notified_at=None if history else now,
+        next_escalation_at=None if history else first_escalation_at(rule.severity, now),
+        resolved=history,
+        resolved_at=now if history else None,
+    )
+
+
+def _open_or_coalesce(condition, now):
+    alert = _new_alert(condition, now)
+    try:
+        with transaction.atomic():
+            alert.save()
+        return alert, True
+    except IntegrityError:
+        alert = Alert.objects.filter(
+            resolved=False, patient_id=condition.patient.id, condition_key=condition.rule.condition_key
+        ).first()
+        if alert is not None:
+            _coalesce(alert, condition)
+        return alert, False
+
+
+def _notify_doctors(notifications):
+    """Enqueue one notification task per alert, carrying the emails of its place's doctors."""
+    doctors_by_place = get_recipients({condition.patient.place_id for condition, _ in notifications})
+
+    tasks = []
+    for condition, alert in notifications:
+        patient, record = condition.patient, condition.last
+        recipients = doctors_by_place.get(patient.place_id)
+        if recipients:
+            tasks.append(
+                dict(
+                    alert_id=alert.pk,
+                    recipients=recipients,
+                    patient_name=patient.name,
+                    patient_id=patient.id,
+                    bpm=record.bpm,
+                    recorded_at=record.recorded_at,
+                )
+            )
+
+    def notify():
+        for kwargs in tasks:
+            send_alert_notification_task.delay(**kwargs)
+
+    if tasks:
+        transaction.on_commit(notify)
+
+
+# ---------------- bulk state changes ----------------
+def _update_returning(queryset, values):
+    """
+    Run queryset.update(**values) as one statement and return the (id,
+    patient_id) of the updated rows, using UPDATE ... RETURNING where the
+    database supports it.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor not in ("postgresql", "sqlite"):
+        with transaction.atomic(using=queryset.db):
+            rows = list(queryset.select_for_update().values_list("id", "patient_id"))
+            Alert.objects.filter(id__in=[row[0] for row in rows]).update(**values)
+        return rows
+
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(queryset.db).as_sql()
+    id_column = connection.ops.quote_name("id")
+    patient_column = connection.ops.quote_name("patient_id")
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} RETURNING {id_column}, {patient_column}", params)
+        return cursor.fetchall()
+
+
+def publish_state_change(event_type, rows, user, now):
+    """Push alert.resolved / alert.acknowledged for [(id, patient_id), ...] to each place's subscribers."""
+    if not rows:
+        return
+    place_of = dict(Patient.objects.filter(id__in={patient_id for _, patient_id in rows}).values_list("id", "place_id"))
+    publish_on_commit(
+        (place_id, event_type, {"ids": [alert_id for alert_id, _ in place_rows], "by": user.pk, "at": now})
+        for place_id, place_rows in group_by_place(rows, lambda row: place_of.get(row[1]))
+    )
+
+
+def bulk_resolve(queryset, user, now=None):
+    """Resolve every open alert of queryset with one UPDATE. Returns [(id, patient_id), ...]."""
+    now = now or timezone.now()
+    rows = _update_returning(
+        queryset.filter(resolved=False),
+        {
+            "resolved": True,
+            "resolved_at": now,
+            "resolved_by": user,
+            "next_escalation_at": None,
+        },
+    )
+    publish_state_change("alert.resolved", rows, user, now)
+    return rows
+
+
+def bulk_acknowledge(queryset, user, now=None):
+    """
+    Acknowledge every open, unacknowledged alert of queryset with one UPDATE.
+    Someone is handling them, so they stop escalating.
+    """
+    now = now or timezone.now()
+    rows = _update_returning(
+        queryset.filter(resolved=False, acknowledged_at__isnull=True),
+        {
+            "acknowledged_at": now,
+            "acknowledged_by": user,
+            "next_escalation_at": None,
+        },
+    )
+    publish_state_change("alert.acknowledged", rows, user, now)
+    return rows
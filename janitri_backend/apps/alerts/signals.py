@@ -0,0 +1,14 @@
+# apps/alerts/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AlertRule
+from .rules import bump_rules_version
+
+
+@receiver(post_save, sender=AlertRule)
+@receiver(post_delete, sender=AlertRule)
+def invalidate_alert_rules(sender, instance, **kwargs):
+    """Make every worker recompile its rule evaluator on the next batch."""
+    bump_rules_version()
@@ -1,21 +1,67 @@
 # apps/alerts/tasks.py
 
+import logging
+
 from celery import shared_task
-from utils.services.email.send_mail import send_email  # import your utility
+from django.utils.dateparse import parse_datetime
+
+from apps.common.outbox import defer_failed
+from utils.services.email.pool import get_pool
+from utils.services.email.send_mail import build_email, render_email
+
+logger = logging.getLogger(__name__)
+
+ALERT_EMAIL_SUBJECT = "Critical Heart Rate Alert"
+
 
 @shared_task
-def send_alert_email_task(to_email, patient_name, patient_id, bpm, recorded_at):
-    subject = "Critical Heart Rate Alert"
-    context = {
-        "patient_name": patient_name,
-        "patient_id": patient_id,
-        "bpm": bpm,
-        "recorded_at": recorded_at.strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    # Use your reusable utility
-    send_email(
-        subject=subject,
-        to_email=to_email,
-        template_name="alert_email",
-        context=context
+def send_alert_notification_task(alert_id, recipients, patient_name, patient_id, bpm, recorded_at, escalation_level=0):
+    """
+    Notify every recipient of one alert. The templates are rendered once and
+    the messages go out over this worker's pooled connection, so a burst of
+    alerts shares one SMTP session. Messages that fail are handed to the
+    email outbox for retries. Escalations say so in the subject.
+    """
+    if isinstance(recorded_at, str):
+        recorded_at = parse_datetime(recorded_at)
+    text_content, html_content = render_email(
+        "alert_email",
+        {
+            "patient_name": patient_name,
+            "patient_id": patient_id,
+            "bpm": bpm,
+            "recorded_at": recorded_at.strftime("%Y-%m-%d %H:%M:%S"),
+        },
     )
+    subject = ALERT_EMAIL_SUBJECT
+    if escalation_level:
+        subject = f"[Escalation {escalation_level}] Unresolved {ALERT_EMAIL_SUBJECT}"
+    pool = get_pool()
+    sent, failed = 0, []
+    for email in recipients:
+        try:
+            sent += pool.send_messages([build_email(subject, email, text_content, html_content)])
+        except Exception as e:
+            failed.append(email)
+            error = str(e)
+    if failed:
+        defer_failed(subject, failed, "alert_email", text_content, html_content, error)
+    logger.info("Alert %s: notified %s of %s recipient(s)", alert_id, sent, len(recipients))
+    return sent
+
+
+@shared_task
+def send_alert_email_task(to_email, patient_name, patient_id, bpm, recorded_at):
+    # kept so per-doctor tasks queued before an upgrade are still delivered
+    return send_alert_notification_task(None, [to_email], patient_name, patient_id, bpm, recorded_at)
+
+
+@shared_task
+def escalate_alerts():
+    """Periodic escalation of alerts unresolved past their SLA, see escalation.py."""
+    from .escalation import escalate_due
+
+    escalated = escalate_due()
+    if escalated:
+        logger.info("Escalated %s alert(s)", escalated)
+    return escalated
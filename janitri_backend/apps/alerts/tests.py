@@ -1,10 +1,34 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 # Create your tests here.
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from apps.alerts import escalation
+from apps.alerts.escalation import escalate_due
+from apps.alerts.tasks import send_alert_notification_task
+from apps.alerts.rules import Rule, RuleEvaluator, SEVERITY_RANK, bump_rules_version
+from apps.alerts.windows import (
+    COUNT, KEY as WINDOW_KEY, TIME_BUCKETS, LocalWindowStore, RedisWindowStore, update_count, update_time,
+)
 from apps.patients.models import Patient
 from apps.records.models import HeartRateRecord
-from apps.alerts.models import Alert
+from apps.records.services import bulk_create_records
+from apps.alerts.models import Alert, AlertRule
+from apps.common.models import EmailOutbox
 from apps.places.models import Place
+from apps.users.directory import get_recipients
+from apps.users.models import User
+from utils.redis_client import redis_client
+from utils.services.email.pool import PooledConnection
+from utils.services.email.send_mail import render_email
+from utils.services.email.sink import SMTPSink
 
 class AlertSignalTests(TestCase):
     
@@ -34,3 +58,436 @@ class AlertSignalTests(TestCase):
         alert = Alert.objects.get(record=rec)
         self.assertIn("Critical low", alert.message)
 
+
+
+class AlertRuleEvaluatorTests(TestCase):
+    def test_most_specific_scope_and_most_severe_rule_win(self):
+        evaluator = RuleEvaluator([
+            Rule(1, None, None, "gt", 100, "HIGH"),
+            Rule(2, None, 7, "gte", 150, "MEDIUM"),
+            Rule(3, None, 7, "gte", 170, "CRITICAL"),
+            Rule(4, 42, None, "lt", 100, "HIGH"),
+        ])
+        patients = [1, 1, 2, 2, 2, 42, 42]
+        places = [3, 3, 7, 7, 7, 7, 7]
+        bpm = [90, 110, 110, 160, 180, 160, 90]
+        matched = [evaluator.rules[i].id if i >= 0 else None for i in evaluator.match(patients, places, bpm).tolist()]
+        self.assertEqual(matched, [None, 1, None, 2, 3, None, 4])
+
+    def test_defaults_apply_without_global_rules(self):
+        evaluator = RuleEvaluator([Rule(1, None, 7, "gt", 100, "HIGH")])
+        matched = evaluator.match([1, 1, 1], [3, 3, 3], [130, 30, 80]).tolist()
+        self.assertEqual([evaluator.rules[i].severity for i in matched[:2]], ["CRITICAL", "CRITICAL"])
+        self.assertEqual(matched[2], -1)
+
+    def test_matches_naive_evaluation(self):
+        import operator
+        import random
+
+        ops = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le,
+               "eq": operator.eq, "ne": operator.ne}
+        rng = random.Random(1)
+        rules = [
+            Rule(i, rng.choice([None, 1, 2]), None, rng.choice(list(ops)), rng.randint(40, 160),
+                 rng.choice(["LOW", "MEDIUM", "HIGH", "CRITICAL"]))
+            for i in range(30)
+        ]
+        for rule in rules[:10]:
+            rule.patient_id = None
+            rule.place_id = rng.choice([None, 5])
+        evaluator = RuleEvaluator(rules)
+        readings = [(rng.randint(1, 3), rng.choice([5, 6]), rng.randint(20, 200)) for _ in range(500)]
+        matched = evaluator.match(*zip(*readings)).tolist()
+
+        for (patient, place, bpm), index in zip(readings, matched):
+            scope = [r for r in rules if r.patient_id == patient] or \
+                [r for r in rules if r.place_id == place and r.patient_id is None] or \
+                [r for r in rules if r.place_id is None and r.patient_id is None]
+            hits = [r for r in scope if ops[r.operator](bpm, r.threshold)]
+            expected = max(hits, key=lambda r: SEVERITY_RANK[r.severity], default=None)
+            self.assertEqual(evaluator.rules[index] if index >= 0 else None, expected)
+
+
+class AlertRuleTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="NICU")
+        self.patient = Patient.objects.create(name="Baby Doe", age=1, gender="F", place=self.place)
+
+    def tearDown(self):
+        # rules vanish with the test transaction without sending signals
+        bump_rules_version()
+
+    def test_place_rule_changes_alerting(self):
+        url = reverse("alert-rules-list")
+        response = self.client.post(url, {
+            "name": "Neonatal high", "place": self.place.id, "operator": "gt", "threshold": 180,
+            "severity": "CRITICAL", "message": "Neonatal tachycardia: {bpm} bpm",
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # 150 is critical for adults but within range under the place rule
+        record = HeartRateRecord.objects.create(patient=self.patient, bpm=150)
+        self.assertFalse(Alert.objects.filter(record=record).exists())
+        alert = Alert.objects.get(record=HeartRateRecord.objects.create(patient=self.patient, bpm=190))
+        self.assertEqual((alert.severity, alert.message), ("CRITICAL", "Neonatal tachycardia: 190 bpm"))
+        self.assertEqual(alert.rule_id, response.data["data"]["id"])
+
+        # deactivating the rule falls back to the default thresholds
+        detail = reverse("alert-rules-detail", args=[alert.rule_id])
+        self.client.patch(detail, {"is_active": False}, format="json")
+        record = HeartRateRecord.objects.create(patient=self.patient, bpm=150)
+        self.assertTrue(Alert.objects.filter(record=record).exists())
+
+    def test_rule_cannot_target_place_and_patient(self):
+        response = self.client.post(reverse("alert-rules-list"), {
+            "name": "Both", "place": self.place.id, "patient": self.patient.id, "operator": "gt", "threshold": 100,
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_message_placeholder(self):
+        messages = [
+            "{patient} is unwell",
+            "{bpm.foo}",
+            "{bpm.__class__}",
+            "{bpm.real}",
+            "{bpm[0]}",
+            "{bpm:>999999999}",
+            "{bpm!r}",
+            "{} bpm",
+            "{bpm",
+            "bpm}",
+        ]
+        for message in messages:
+            with self.subTest(message=message):
+                response = self.client.post(reverse("alert-rules-list"), {
+                    "name": "Bad", "operator": "gt", "threshold": 100, "message": message,
+                }, format="json")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_valid_message_placeholders(self):
+        response = self.client.post(reverse("alert-rules-list"), {
+            "name": "Good", "operator": "gt", "threshold": 100, "message": "{bpm} bpm over {threshold} {{sic}}",
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class WindowedAlertRuleTests(TestCase):
+    def test_count_window(self):
+        state, matches = None, []
+        for hit in [1, 1, 0, 1, 1, 1, 0, 0]:
+            state, condition = update_count(state, hit, 6, 5)
+            matches.append(condition)
+        self.assertEqual(matches, [False, False, False, False, False, True, False, False])
+
+    def test_count_window_ignores_late_readings(self):
+        state = None
+        for t in range(10, 60, 10):
+            state, condition = update_count(state, 1, 6, 5, t)
+        self.assertTrue(condition)
+        # measured before the last reading, the window already moved past it
+        self.assertEqual(update_count(state, 0, 6, 5, 25), (state, False))
+        state, condition = update_count(state, 0, 6, 5, 60)
+        self.assertTrue(condition)
+
+    def test_time_window_mean(self):
+        state = None
+        for t, bpm in [(0, 100), (10, 120), (20, 110)]:
+            state, mean = update_time(state, t, bpm, 60, 3)
+        self.assertEqual(mean, 110)
+        # 70 s later only the new reading remains in the window
+        state, mean = update_time(state, 90, 150, 60, 1)
+        self.assertEqual(mean, 150)
+        self.assertEqual(len(state.split(",")), 1 + 2 * TIME_BUCKETS)
+
+    def test_evaluator_keeps_state_between_batches(self):
+        evaluator = RuleEvaluator([Rule(1, None, None, "gt", 160, "HIGH", "", COUNT, 6, 5)])
+        store = LocalWindowStore()
+        first = evaluator.match([1, 1, 1], [1, 1, 1], [170, 170, 170], [1, 2, 3], store)
+        second = evaluator.match([1, 1, 2], [1, 1, 1], [170, 170, 170], [4, 5, 5], store)
+        self.assertEqual(first.tolist(), [-1, -1, -1])
+        self.assertEqual(second.tolist(), [-1, 0, -1])
+
+    def test_concurrent_batches_do_not_lose_updates(self):
+        evaluator = RuleEvaluator([Rule(1, None, None, "gt", 160, "HIGH", "", COUNT, 6, 2)])
+        redis_client.delete(WINDOW_KEY.format(1))
+        store, attempts = RedisWindowStore(), []
+        update = store.update
+
+        def racing_update(fields_by_patient, advance):
+            def racing_advance(states):
+                if not attempts:
+                    # another worker saves its batch between this batch's load and save
+                    evaluator.match([1], [1], [170], [1], RedisWindowStore())
+                attempts.append(dict(states))
+                return advance(states)
+            return update(fields_by_patient, racing_advance)
+
+        store.update = racing_update
+        try:
+            matched = evaluator.match([1], [1], [170], [2], store)
+        finally:
+            redis_client.delete(WINDOW_KEY.format(1))
+        # retried on top of the other batch's reading: 2 of the last 6 match
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(matched.tolist(), [0])
+
+    def test_sustained_condition_through_ingest(self):
+        place = Place.objects.create(name="Ward")
+        patient = Patient.objects.create(name="Jane Doe", age=30, gender="F", place=place)
+        redis_client.delete(WINDOW_KEY.format(patient.id))
+        AlertRule.objects.create(
+            name="Sustained tachycardia", place=place, operator="gt", threshold=160,
+            window_type=COUNT, window_size=6, min_count=5,
+        )
+        try:
+            for bpm in [170, 170, 90, 170, 170]:
+                HeartRateRecord.objects.create(patient=patient, bpm=bpm)
+            self.assertFalse(Alert.objects.exists())
+            record = HeartRateRecord.objects.create(patient=patient, bpm=175)
+            alert = Alert.objects.get(record=record)
+            self.assertIn("5 of last 6 readings", alert.message)
+        finally:
+            bump_rules_version()
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class AlertCoalescingTests(TestCase):
+    def setUp(self):
+        self.place = Place.objects.create(name="Ward")
+        self.patient = Patient.objects.create(name="Jane Doe", age=30, gender="F", place=self.place)
+        User.objects.create_user(
+            email="doctor@test.com", password="x", first_name="Doc", role="DOCTOR", place=self.place
+        )
+
+    def _record(self, bpm):
+        with self.captureOnCommitCallbacks(execute=True):
+            return HeartRateRecord.objects.create(patient=self.patient, bpm=bpm)
+
+    def test_sustained_readings_update_one_open_alert(self):
+        first = self._record(130)
+        self._record(150)
+        self._record(140)
+        alert = Alert.objects.get()
+        self.assertEqual(alert.record, first)
+        self.assertEqual((alert.occurrences, alert.peak_bpm), (3, 150))
+        self.assertEqual(alert.last_seen_at, HeartRateRecord.objects.latest("recorded_at", "id").recorded_at)
+        # notified once, the open alert is still within its cooldown
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_low_condition_tracks_lowest_bpm(self):
+        self._record(35)
+        self._record(30)
+        self._record(38)
+        alert = Alert.objects.get()
+        self.assertEqual((alert.occurrences, alert.peak_bpm), (3, 30))
+        self.assertIn("Critical low", alert.message)
+
+    def test_renotify_after_cooldown(self):
+        self._record(130)
+        Alert.objects.update(last_notified_at=timezone.now() - timedelta(hours=1))
+        self._record(135)
+        self.assertEqual(Alert.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_resolved_alert_is_not_reused(self):
+        self._record(130)
+        Alert.objects.update(resolved=True)
+        self._record(130)
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual(Alert.objects.filter(resolved=False).count(), 1)
+
+    def test_batch_is_coalesced_per_condition(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_create_records([{"patient": self.patient.id, "bpm": bpm} for bpm in (130, 140, 30, 80, 125)])
+        high = Alert.objects.get(condition_key__startswith="default:gt")
+        low = Alert.objects.get(condition_key__startswith="default:lt")
+        self.assertEqual((high.occurrences, high.peak_bpm), (3, 140))
+        self.assertEqual((low.occurrences, low.peak_bpm), (1, 30))
+
+
+class AlertNotificationFanOutTests(TestCase):
+    def setUp(self):
+        self.place = Place.objects.create(name="Ward")
+        self.patients = [
+            Patient.objects.create(name=f"Patient {i}", age=30, gender="F", place=self.place) for i in range(3)
+        ]
+        for i in range(2):
+            User.objects.create_user(
+                email=f"doctor{i}@test.com", password="x", first_name="Doc", role="DOCTOR", place=self.place
+            )
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_one_task_and_one_render_per_alert(self):
+        with mock.patch("apps.alerts.tasks.render_email", wraps=render_email) as render, \
+                mock.patch.object(send_alert_notification_task, "delay", wraps=send_alert_notification_task.delay) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_create_records([{"patient": patient.id, "bpm": 150} for patient in self.patients])
+        self.assertEqual(delay.call_count, 3)
+        self.assertEqual(render.call_count, 3)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual({m.to[0] for m in mail.outbox}, {"doctor0@test.com", "doctor1@test.com"})
+        self.assertTrue(all(len(m.to) == 1 for m in mail.outbox))
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_fan_out_does_not_query_users(self):
+        get_recipients([self.place.id])
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            bulk_create_records([{"patient": patient.id, "bpm": 150} for patient in self.patients])
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertFalse([q for q in queries if User._meta.db_table in q["sql"]])
+
+    def test_burst_shares_one_smtp_connection(self):
+        with SMTPSink() as sink, override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST=sink.host,
+            EMAIL_PORT=sink.port,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            pool = PooledConnection(max_messages=4)
+            with mock.patch("apps.alerts.tasks.get_pool", return_value=pool):
+                for alert_id in range(3):
+                    send_alert_notification_task(
+                        alert_id, ["a@test.com", "b@test.com"], "Jane", 1, 150, timezone.now()
+                    )
+                pool.close()
+        self.assertEqual(sink.stats["messages"], 6)
+        # recycled once after max_messages
+        self.assertEqual(sink.stats["connections"], 2)
+        self.assertEqual(pool.opened, 2)
+
+    def test_failed_recipients_are_deferred_to_outbox(self):
+        pool = PooledConnection()
+        with mock.patch("apps.alerts.tasks.get_pool", return_value=pool), \
+                mock.patch.object(pool, "send_messages", side_effect=[1, OSError("smtp down")]):
+            sent = send_alert_notification_task(1, ["a@test.com", "b@test.com"], "Jane", 1, 150, timezone.now())
+        self.assertEqual(sent, 1)
+        deferred = EmailOutbox.objects.get()
+        self.assertEqual((deferred.to_email, deferred.attempts, deferred.status), ("b@test.com", 1, "PENDING"))
+        self.assertIn("Jane", deferred.text_body)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class AlertEscalationTests(APITestCase):
+    def setUp(self):
+        self.place = Place.objects.create(name="Ward")
+        self.patient = Patient.objects.create(name="Jane Doe", age=30, gender="F", place=self.place)
+        for role in ("NURSE", "DOCTOR"):
+            User.objects.create_user(
+                email=f"{role.lower()}@test.com", password="x", first_name=role, role=role, place=self.place
+            )
+        User.objects.create_user(email="admin@test.com", password="x", first_name="Admin", role="ADMIN")
+        with self.captureOnCommitCallbacks(execute=True):
+            HeartRateRecord.objects.create(patient=self.patient, bpm=150)
+        self.alert = Alert.objects.get()
+        self.created_to = [m.to for m in mail.outbox]
+        mail.outbox.clear()
+
+    def _escalate(self, seconds):
+        with self.captureOnCommitCallbacks(execute=True):
+            escalated = escalate_due(now=self.alert.created_at + timedelta(seconds=seconds))
+        self.alert.refresh_from_db()
+        return escalated
+
+    def test_escalates_one_tier_per_sla(self):
+        sla = escalation.sla("CRITICAL").total_seconds()
+        # a new alert emails the doctors, escalation goes up from there
+        self.assertEqual(self.created_to, [["doctor@test.com"]])
+        self.assertEqual(escalation.STEPS, ("ADMIN",))
+        self.assertEqual(self._escalate(sla - 60), 0)
+
+        self.assertEqual(self._escalate(sla + 1), 1)
+        self.assertEqual(self.alert.escalation_level, 1)
+        self.assertEqual([m.to for m in mail.outbox], [["admin@test.com"]])
+        self.assertIn("Escalation 1", mail.outbox[0].subject)
+        self.assertIsNone(self.alert.next_escalation_at)
+        self.assertEqual(self._escalate(10 * sla), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_escalation_without_a_reading_has_no_bpm(self):
+        Alert.objects.filter(pk=self.alert.pk).update(record=None, peak_bpm=None)
+        self._escalate(escalation.sla("CRITICAL").total_seconds() + 1)
+        self.assertIn("Heart Rate: not recorded", mail.outbox[0].body)
+        self.assertNotIn("None", mail.outbox[0].body)
+
+    def test_each_step_notifies_the_next_tier(self):
+        sla = escalation.sla("CRITICAL").total_seconds()
+        User.objects.create_user(
+            email="ward-admin@test.com", password="x", first_name="Ward", role="ADMIN", place=self.place
+        )
+        with mock.patch.object(escalation, "STEPS", ("NURSE", "ADMIN")):
+            self.assertEqual(self._escalate(sla + 1), 1)
+            # the next step is one SLA after this one, not after creation
+            self.assertEqual(self._escalate(sla + 2), 0)
+            self._escalate(2 * sla + 2)
+        self.assertEqual([m.to for m in mail.outbox], [["nurse@test.com"], ["ward-admin@test.com"]])
+        self.assertEqual(self.alert.escalation_level, 2)
+        self.assertIsNone(self.alert.next_escalation_at)
+
+    def test_resolved_alert_is_not_escalated(self):
+        user = User.objects.get(email="doctor@test.com")
+        self.client.force_authenticate(user=user)
+        response = self.client.post(reverse("alerts-resolve-alert", args=[self.alert.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._escalate(86400), 0)
+        self.assertIsNone(self.alert.next_escalation_at)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claims_rows_with_skip_locked(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("SKIP LOCKED claiming needs PostgreSQL")
+        with CaptureQueriesContext(connection) as queries:
+            self._escalate(86400)
+        self.assertTrue(any("FOR UPDATE OF" in q["sql"] and "SKIP LOCKED" in q["sql"] for q in queries))
+
+
+class AlertBulkActionTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="nurse@test.com", password="x", first_name="Nurse", role="NURSE")
+        self.client.force_authenticate(user=self.user)
+        self.ward = Place.objects.create(name="Ward")
+        self.icu = Place.objects.create(name="ICU")
+        self.alerts = []
+        for place in (self.ward, self.ward, self.icu):
+            patient = Patient.objects.create(name="P", age=30, gender="F", place=place)
+            record = HeartRateRecord.objects.create(patient=patient, bpm=150)
+            self.alerts.append(Alert.objects.get(record=record))
+
+    def test_bulk_resolve_by_ids_in_one_update(self):
+        ids = [self.alerts[0].id, self.alerts[2].id]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("alerts-bulk-resolve"), {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"], {"updated": 2, "ids": sorted(ids)})
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("UPDATE")]), 1)
+        resolved = Alert.objects.filter(resolved=True)
+        self.assertEqual(set(resolved.values_list("id", flat=True)), set(ids))
+        self.assertTrue(all(a.resolved_by == self.user and a.next_escalation_at is None for a in resolved))
+
+        # already resolved alerts are not touched again
+        response = self.client.post(reverse("alerts-bulk-resolve"), {"ids": ids}, format="json")
+        self.assertEqual(response.data["data"]["updated"], 0)
+
+    def test_bulk_acknowledge_by_place_and_time(self):
+        Alert.objects.filter(id=self.alerts[1].id).update(created_at=timezone.now() + timedelta(hours=1))
+        response = self.client.post(
+            reverse("alerts-bulk-acknowledge"),
+            {"place": self.ward.id, "before": timezone.now().isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.data["data"], {"updated": 1, "ids": [self.alerts[0].id]})
+        alert = Alert.objects.get(id=self.alerts[0].id)
+        self.assertEqual(alert.acknowledged_by, self.user)
+        self.assertFalse(alert.resolved)
+        self.assertIsNone(alert.next_escalation_at)
+
+    def test_selection_is_required(self):
+        response = self.client.post(reverse("alerts-bulk-resolve"), {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Alert.objects.filter(resolved=True).exists())
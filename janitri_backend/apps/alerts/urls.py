@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AlertViewSet
+from .views import AlertViewSet, AlertRuleViewSet
 
 router = DefaultRouter()
 router.register(r'alerts', AlertViewSet, basename='alerts')
+router.register(r'alert-rules', AlertRuleViewSet, basename='alert-rules')
 
 urlpatterns = [
     path('', include(router.urls))
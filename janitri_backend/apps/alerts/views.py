@@ -1,33 +1,53 @@
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
+from django.http import Http404
 from django.utils import timezone
 from utils.responses import success_response, error_response
-from .models import Alert
-from .serializers import AlertSerializer
+from .models import Alert, AlertRule
+from .serializers import AlertSerializer, AlertBulkActionSerializer, AlertRuleSerializer
+from .services import bulk_acknowledge, bulk_resolve, publish_state_change
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from apps.common.pagination import StandardResultsSetPagination
+from apps.common.pagination import StandardResultsSetPagination, KeysetPaginationMixin
+from apps.common.mixins import EagerLoadingMixin
+from apps.common.serializers import FIELD_SELECTION_PARAMETERS
 
-class AlertViewSet(viewsets.ModelViewSet):
+class AlertViewSet(EagerLoadingMixin, KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Alert.objects.all().order_by("-created_at")
     serializer_class = AlertSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ("-created_at", "-id")
     filter_backends = [DjangoFilterBackend, OrderingFilter]
-    filterset_fields = ['patient', 'resolved', 'resolved_by']
+    filterset_fields = ['patient', 'resolved', 'resolved_by', 'severity']
     ordering_fields = ['created_at', 'resolved_at']
     ordering = ['-created_at']
 
     @extend_schema(
         parameters=[
+            *FIELD_SELECTION_PARAMETERS,
             OpenApiParameter(
                 name="ordering",
                 description="Order by any of: created_at, resolved_at. Use '-' prefix for descending.",
                 required=False,
                 type=str,
             ),
+            OpenApiParameter(
+                name="pagination",
+                description="Use 'cursor' for keyset pagination (no count, constant cost for deep pages).",
+                required=False,
+                type=str,
+                enum=["page", "cursor"],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Cursor from a previous next/previous link (keyset pagination).",
+                required=False,
+                type=str,
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
@@ -42,9 +62,12 @@ class AlertViewSet(viewsets.ModelViewSet):
 
             serializer = self.get_serializer(queryset, many=True)
             return success_response(message="Alerts retrieved successfully", data=serializer.data)
+        except NotFound as e:
+            return error_response(str(e.detail), status=404)
         except Exception as e:
             return error_response("Error retrieving alerts", str(e), status=500)
 
+    @extend_schema(parameters=FIELD_SELECTION_PARAMETERS)
     def retrieve(self, request, *args, **kwargs):
         try:
             alert = self.get_object()
@@ -111,7 +134,9 @@ class AlertViewSet(viewsets.ModelViewSet):
             alert.resolved = True
             alert.resolved_at = timezone.now()
             alert.resolved_by = request.user
+            alert.next_escalation_at = None
             alert.save()
+            publish_state_change("alert.resolved", [(alert.id, alert.patient_id)], request.user, alert.resolved_at)
 
             serializer = self.get_serializer(alert)
             return success_response(message="Alert marked as resolved", data=serializer.data)
@@ -119,3 +144,124 @@ class AlertViewSet(viewsets.ModelViewSet):
             return error_response("Alert not found", status=404)
         except Exception as e:
             return error_response("Error resolving alert", str(e), status=500)
+
+    def _bulk_action(self, request, apply, verb):
+        serializer = AlertBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return error_response("Validation error", serializer.errors, status=400)
+        try:
+            rows = apply(serializer.filter(Alert.objects.all()), request.user)
+            return success_response(
+                message=f"{len(rows)} alert(s) {verb}",
+                data={"updated": len(rows), "ids": sorted(alert_id for alert_id, _ in rows)},
+            )
+        except Exception as e:
+            return error_response("Error updating alerts", str(e), status=500)
+
+    @extend_schema(
+        description=(
+            "Resolve many open alerts with one UPDATE: pass `ids`, or filter by `patient`, "
+            "`place` and `before` (created before). Already resolved alerts are left as they are."
+        ),
+        request=AlertBulkActionSerializer,
+        responses={200: dict},
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-resolve")
+    def bulk_resolve(self, request):
+        return self._bulk_action(request, bulk_resolve, "resolved")
+
+    @extend_schema(
+        description=(
+            "Acknowledge many open alerts with one UPDATE, selected like bulk-resolve. "
+            "Acknowledged alerts stop escalating."
+        ),
+        request=AlertBulkActionSerializer,
+        responses={200: dict},
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-acknowledge")
+    def bulk_acknowledge(self, request):
+        return self._bulk_action(request, bulk_acknowledge, "acknowledged")
+
+
+class AlertRuleViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
+    queryset = AlertRule.objects.all()
+    serializer_class = AlertRuleSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['place', 'patient', 'severity', 'is_active']
+    ordering_fields = ['name', 'threshold', 'created_at']
+    ordering = ['-created_at']
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user, modified_by=self.request.user)
+
+    def perform_update(self, serializer):
+        serializer.save(modified_by=self.request.user)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="ordering",
+                description="Order by any of: name, threshold, created_at. Use '-' prefix for descending.",
+                required=False,
+                type=str,
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        try:
+            queryset = self.filter_queryset(self.get_queryset())
+
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.paginator.get_paginated_response(serializer.data)
+
+            serializer = self.get_serializer(queryset, many=True)
+            return success_response(message="Alert rules retrieved successfully", data=serializer.data)
+        except Exception as e:
+            return error_response("Error retrieving alert rules", str(e), status=500)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            rule = self.get_object()
+            serializer = self.get_serializer(rule)
+            return success_response("Alert rule retrieved successfully", serializer.data)
+        except Http404:
+            return error_response("Alert rule not found", status=404)
+        except Exception as e:
+            return error_response("Error retrieving alert rule", str(e), status=500)
+
+    def create(self, request, *args, **kwargs):
+        try:
+            serializer = self.get_serializer(data=request.data)
+            if not serializer.is_valid():
+                return error_response("Validation error", serializer.errors, status=400)
+            self.perform_create(serializer)
+            return success_response("Alert rule created successfully", serializer.data, status=201)
+        except Exception as e:
+            return error_response("Error creating alert rule", str(e), status=500)
+
+    def update(self, request, *args, **kwargs):
+        try:
+            rule = self.get_object()
+            serializer = self.get_serializer(rule, data=request.data, partial=kwargs.get("partial", False))
+            if not serializer.is_valid():
+                return error_response("Validation error", serializer.errors, status=400)
+            self.perform_update(serializer)
+            return success_response("Alert rule updated successfully", serializer.data)
+        except Http404:
+            return error_response("Alert rule not found", status=404)
+        except Exception as e:
+            return error_response("Error updating alert rule", str(e), status=500)
+
+    def destroy(self, request, *args, **kwargs):
+        try:
+            rule = self.get_object()
+            rule.delete()
+            return success_response("Alert rule deleted successfully", status=204)
+        except Http404:
+            return error_response("Alert rule not found", status=404)
+        except Exception as e:
+            return error_response("Error deleting alert rule", str(e), status=500)
@@ -0,0 +1,187 @@
+# apps/alerts/windows.py
+"""
+Streaming state for windowed (sustained condition) alert rules.
+
+Two window types keep a small, fixed-size state per (patient, rule):
+
+* count: "k of the last n readings match" -- an n-bit mask of the last n
+  comparison outcomes (n <= 64), one shift and one popcount per reading.
+  A reading measured before the last one shifted in arrived late; the
+  window has moved past it, so it is not counted.
+* time: "mean over the last T seconds" -- a ring of TIME_BUCKETS
+  (sum, count) slots of T / TIME_BUCKETS seconds each. A reading clears at
+  most TIME_BUCKETS expired slots and sums TIME_BUCKETS slots. Late
+  readings are added to the slot of their measurement time, or ignored
+  once it has left the window.
+
+States are small strings stored in one Redis hash per patient (or in a
+process-local dict with ALERT_WINDOW_STATE = "local"), loaded, advanced
+and saved once per batch. Batches of the same patient may be evaluated by
+several workers at once, so the Redis store runs that read-modify-write as
+an optimistic transaction: the batch's hashes are WATCHed, and a batch that
+lost the race to another one reloads the states and advances them again.
+Hashes expire ALERT_WINDOW_STATE_TTL seconds after the patient's last
+reading.
+"""
+
+from django.conf import settings
+from redis.exceptions import WatchError
+
+from utils.redis_client import redis_client
+
+SAMPLE = "sample"
+COUNT = "count"
+TIME = "time"
+
+COUNT_MAX_WINDOW = 64
+TIME_BUCKETS = getattr(settings, "ALERT_WINDOW_TIME_BUCKETS", 12)
+STATE_TTL = getattr(settings, "ALERT_WINDOW_STATE_TTL", 86400)
+KEY = "alerts:window:{}"
+
+
+def state_field(rule):
+    """Hash field of a rule's state; changing the window starts from a fresh state."""
+    return f"{rule.id}:{rule.window_type}:{rule.window_size}"
+
+
+# ---------------- count windows ----------------
+def update_count(state, matched, window_size, min_count, timestamp=None):
+    """Shift one comparison outcome into the mask. Returns (state, condition)."""
+    mask, _, last = (state or "0").partition(",")
+    mask = int(mask)
+    if timestamp is None:
+        timestamp = float(last) if last else None
+    elif last and timestamp < float(last):
+        return state, False
+    mask = ((mask << 1) | int(matched)) & ((1 << window_size) - 1)
+    state = str(mask) if timestamp is None else f"{mask},{timestamp!r}"
+    return state, bin(mask).count("1") >= min_count
+
+
+# ---------------- time windows ----------------
+def _decode_time(state):
+    if not state:
+        return None, [0] * TIME_BUCKETS, [0] * TIME_BUCKETS
+    head, *slots = state.split(",")
+    if len(slots) != 2 * TIME_BUCKETS:
+        return None, [0] * TIME_BUCKETS, [0] * TIME_BUCKETS
+    return int(head), [int(v) for v in slots[0::2]], [int(v) for v in slots[1::2]]
+
+
+def _encode_time(head, sums, counts):
+    return ",".join([str(head)] + [f"{s},{c}" for s, c in zip(sums, counts)])
+
+
+def update_time(state, timestamp, bpm, window_size, min_count):
+    """
+    Add one reading to the ring. Returns (state, mean) where mean is None
+    until the window holds at least min_count readings.
+    """
+    head, sums, counts = _decode_time(state)
+    width = window_size / TIME_BUCKETS
+    slot = int(timestamp // width)
+
+    if head is None:
+        head = slot
+    elif slot > head:
+        for expired in range(max(head + 1, slot - TIME_BUCKETS + 1), slot + 1):
+            sums[expired % TIME_BUCKETS] = 0
+            counts[expired % TIME_BUCKETS] = 0
+        head = slot
+
+    if slot > head - TIME_BUCKETS:  # older readings fall outside the window
+        sums[slot % TIME_BUCKETS] += bpm
+        counts[slot % TIME_BUCKETS] += 1
+
+    total = sum(counts)
+    mean = sum(sums) / total if total >= min_count else None
+    return _encode_time(head, sums, counts), mean
+
+
+# ---------------- state stores ----------------
+class RedisWindowStore:
+    def __init__(self, client=redis_client):
+        self.client = client
+
+    def load(self, fields_by_patient):
+        """{patient_id: [field, ...]} -> {(patient_id, field): state}"""
+        patients = list(fields_by_patient)
+        pipe = self.client.pipeline(transaction=False)
+        for patient_id in patients:
+            pipe.hmget(KEY.format(patient_id), fields_by_patient[patient_id])
+        states = {}
+        for patient_id, values in zip(patients, pipe.execute()):
+            for field, value in zip(fields_by_patient[patient_id], values):
+                if value is not None:
+                    states[(patient_id, field)] = value
+        return states
+
+    def save(self, states):
+        pipe = self.client.pipeline(transaction=False)
+        self._queue_save(pipe, states)
+        pipe.execute()
+
+    def update(self, fields_by_patient, advance):
+        """
+        Load the states, advance(states) them in place and save them, retried
+        from the load whenever another batch wrote one of the patients' hashes
+        in between. Returns what the last advance returned.
+        """
+        keys = [KEY.format(patient_id) for patient_id in fields_by_patient]
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*keys)
+                    # read on another connection; a write after the WATCH still fails the EXEC
+                    states = self.load(fields_by_patient)
+                    result = advance(states)
+                    pipe.multi()
+                    self._queue_save(pipe, states)
+                    pipe.execute()
+                    return result
+                except WatchError:
+                    continue
+
+    @staticmethod
+    def _queue_save(pipe, states):
+        by_patient = {}
+        for (patient_id, field), value in states.items():
+            by_patient.setdefault(patient_id, {})[field] = value
+        for patient_id, mapping in by_patient.items():
+            pipe.hset(KEY.format(patient_id), mapping=mapping)
+            pipe.expire(KEY.format(patient_id), STATE_TTL)
+
+
+class LocalWindowStore:
+    """Process-local state, for single-process deployments and tests."""
+
+    def __init__(self):
+        self.states = {}
+
+    def load(self, fields_by_patient):
+        return {
+            (patient_id, field): self.states[(patient_id, field)]
+            for patient_id, fields in fields_by_patient.items()
+            for field in fields
+            if (patient_id, field) in self.states
+        }
+
+    def save(self, states):
+        self.states.update(states)
+
+    def update(self, fields_by_patient, advance):
+        states = self.load(fields_by_patient)
+        result = advance(states)
+        self.save(states)
+        return result
+
+
+_store = None
+
+
+def get_window_store():
+    global _store
+    if _store is None:
+        local = getattr(settings, "ALERT_WINDOW_STATE", "redis") == "local"
+        _store = LocalWindowStore() if local else RedisWindowStore()
+    return _store
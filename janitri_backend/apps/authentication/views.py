@@ -1,3 +1,4 @@
+from datetime import timedelta
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -13,8 +14,8 @@ from .serializers import (
     ResetPasswordSerializer,
     RefreshTokenSerializer
 )
-from utils.services.email.send_mail import send_email
-from utils.resource.otp.otp_handler import generate_otp, store_otp, verify_otp, delete_otp
+from apps.common.outbox import queue_email
+from utils.resource.otp.otp_handler import OTP_EXPIRY, generate_otp, store_otp, verify_otp, delete_otp
 
 User = get_user_model()
 
@@ -115,14 +116,15 @@ class AuthViewSet(viewsets.ViewSet):
                 context = {
                     "user": user,
                     "otp": otp,
-                    "expiry_minutes": 5,
+                    "expiry_minutes": OTP_EXPIRY // 60,
                 }
 
-                send_email(
+                queue_email(
                     subject="Your Password Reset OTP",
                     to_email=email,
                     template_name="password_reset",
                     context=context,
+                    expires_in=timedelta(seconds=OTP_EXPIRY),
                 )
 
                 return success_response("OTP sent to your email")
@@ -1,3 +1,14 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import EmailOutbox
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    # bodies may hold passwords or one-time codes, they are never shown
+    exclude = ("text_body", "html_body")
+    list_display = ("subject", "to_email", "status", "attempts", "next_attempt_at", "expires_at", "sent_at")
+    list_filter = ("status", "template_name")
+    search_fields = ("to_email", "subject")
+    readonly_fields = ("subject", "to_email", "template_name", "attempts", "last_error", "expires_at", "created_at", "sent_at")
@@ -0,0 +1,113 @@
+# apps/common/events.py
+"""
+Server-push events per place over Redis pub/sub.
+
+Writers publish each event once to the channel of its place after their
+transaction commits. Every connected dashboard holds its own subscription
+(see stream_place_events), so delivery fans out inside Redis and a
+subscriber never touches the database.
+
+Event types and payloads:
+
+* reading: {"readings": [{"patient", "bpm", "recorded_at"}, ...]}
+* alert.created: {"alerts": [{"id", "patient", "severity", "message", "bpm", "created_at"}, ...]}
+* alert.resolved / alert.acknowledged: {"ids": [...], "by": user id, "at": time}
+* alert.escalated: {"alerts": [{"id", "patient", "escalation_level"}, ...]}
+
+Pub/sub is fire and forget: a dashboard that reconnects should reload
+/api/place/{id}/latest-vitals/ and open alerts once, then follow events.
+"""
+
+import asyncio
+import json
+import logging
+
+import redis.asyncio
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "events:place:{}"
+KEEPALIVE_SECONDS = getattr(settings, "PLACE_EVENTS_KEEPALIVE_SECONDS", 15)
+RETRY_MS = 3000
+
+
+def encode(event_type, data):
+    return json.dumps({"type": event_type, "data": data}, cls=DjangoJSONEncoder)
+
+
+def publish(events, client=redis_client):
+    """Publish (place_id, event_type, data) tuples with one round trip. Never raises."""
+    events = [event for event in events if event[0] is not None]
+    if not events:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for place_id, event_type, data in events:
+            pipe.publish(CHANNEL.format(place_id), encode(event_type, data))
+        pipe.execute()
+    except Exception:
+        # push is best effort, never fail the write that caused it
+        logger.exception("Could not publish %s place event(s)", len(events))
+
+
+def publish_on_commit(events):
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: publish(events))
+
+
+def group_by_place(items, place_of):
+    """[(place_id, [item, ...]), ...] for items grouped by place_of(item)."""
+    grouped = {}
+    for item in items:
+        grouped.setdefault(place_of(item), []).append(item)
+    return list(grouped.items())
+
+
+# ---------------- subscriber ----------------
+def async_client():
+    return redis.asyncio.StrictRedis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD or None,
+        decode_responses=True,
+    )
+
+
+def format_sse(message=None, event=None, comment=None):
+    if comment is not None:
+        return f": {comment}\n\n"
+    return f"event: {event}\ndata: {message}\n\n"
+
+
+async def stream_place_events(place_id, client=None, keepalive=KEEPALIVE_SECONDS):
+    """
+    Yield Server-Sent Events for one place until the client disconnects.
+    A comment line is sent every `keepalive` seconds so proxies keep the
+    connection open.
+    """
+    client = client or async_client()
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(CHANNEL.format(place_id))
+        yield f"retry: {RETRY_MS}\n\n"
+        loop = asyncio.get_running_loop()
+        last_sent = loop.time()
+        while True:
+            message = await pubsub.get_message(timeout=1.0)
+            if message is not None:
+                event_type = json.loads(message["data"]).get("type", "message")
+                yield format_sse(message["data"], event=event_type)
+                last_sent = loop.time()
+            elif loop.time() - last_sent >= keepalive:
+                yield format_sse(comment="keepalive")
+                last_sent = loop.time()
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from utils.services.email.sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Run a local SMTP stand-in that accepts and discards mail, for offline email throughput tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=1025)
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options["host"], options["port"])
+        self.stdout.write(
+            f"SMTP sink listening on {sink.host}:{sink.port} "
+            f"(EMAIL_HOST={sink.host} EMAIL_PORT={sink.port} EMAIL_USE_TLS=False), Ctrl-C to stop"
+        )
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.server.server_close()
+            stats = sink.stats
+            self.stdout.write(
+                f"{stats['connections']} connection(s), {stats['messages']} message(s), "
+                f"{stats['recipients']} recipient(s)"
+            )
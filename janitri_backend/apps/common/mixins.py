@@ -0,0 +1,21 @@
+from .serializers import get_eager_lookups, get_field_selection
+
+
+class EagerLoadingMixin:
+    """
+    Viewset mixin that joins and prefetches everything the serializer
+    renders, so list and retrieve run a fixed number of queries no matter
+    how many rows are on the page. Relations dropped by ?fields= / ?expand=
+    are not loaded at all.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selects, prefetches = get_eager_lookups(
+            self.get_serializer_class(), selection=get_field_selection(self.request)
+        )
+        if selects:
+            queryset = queryset.select_related(*selects)
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
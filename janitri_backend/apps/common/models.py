@@ -1,5 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from utils.constants.choices import EMAIL_OUTBOX_STATUS_CHOICES
 
 # Create your models here.
 
@@ -23,3 +26,36 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be sent. Rows are written in the same transaction as
+    the change that caused them and sent by apps.common.tasks.drain_email_outbox.
+    """
+
+    subject = models.CharField(max_length=255)
+    to_email = models.EmailField()
+    template_name = models.CharField(max_length=100)
+    text_body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=EMAIL_OUTBOX_STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # messages with one-time codes are dropped instead of sent after this
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at", "id"],
+                name="common_outbox_due_idx",
+                condition=models.Q(status="PENDING"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
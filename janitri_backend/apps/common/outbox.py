@@ -0,0 +1,143 @@
+# apps/common/outbox.py
+"""
+Transactional outbox for outgoing email.
+
+queue_email renders the templates and stores the message as an EmailOutbox
+row inside the caller's transaction, so a request never waits on the mail
+server and a rolled back request sends nothing. After commit a drain task
+is kicked; the periodic drain picks up anything the kick missed.
+
+The drainer locks due rows with SKIP LOCKED, so several workers can drain
+at once without sending a message twice, and sends each batch over the
+pooled SMTP connection. A failed message is retried with exponential
+backoff and marked DEAD after EMAIL_OUTBOX_MAX_ATTEMPTS. Messages queued
+with an expiry (one-time codes) are marked DEAD instead of being sent once
+it has passed. Bodies of sent and dead messages are cleared, they may hold
+credentials or one-time codes.
+
+Alert notifications are sent directly by their own task (see
+apps/alerts/tasks.py) and only land here when that send fails.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+from utils.services.email.pool import get_pool
+from utils.services.email.send_mail import build_email, render_email
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+SENT = "SENT"
+DEAD = "DEAD"
+
+BATCH_SIZE = getattr(settings, "EMAIL_OUTBOX_BATCH_SIZE", 100)
+MAX_BATCHES = getattr(settings, "EMAIL_OUTBOX_MAX_BATCHES", 20)
+MAX_ATTEMPTS = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 8)
+BACKOFF_SECONDS = getattr(settings, "EMAIL_OUTBOX_BACKOFF_SECONDS", 30)
+BACKOFF_MAX_SECONDS = getattr(settings, "EMAIL_OUTBOX_BACKOFF_MAX_SECONDS", 3600)
+
+
+def queue_email(subject, to_email, template_name, context, expires_in=None):
+    """
+    Store an email for sending once the current transaction commits. With
+    expires_in (a timedelta) it is dropped if it could not be sent in time.
+    """
+    text_content, html_content = render_email(template_name, context)
+    message = EmailOutbox.objects.create(
+        subject=subject,
+        to_email=to_email,
+        template_name=template_name,
+        text_body=text_content,
+        html_body=html_content,
+        expires_at=timezone.now() + expires_in if expires_in is not None else None,
+    )
+    transaction.on_commit(_kick_drain)
+    return message
+
+
+def defer_failed(subject, recipients, template_name, text_content, html_content, error):
+    """Hand messages that failed a direct send to the outbox, counted as their first attempt."""
+    retry_at = timezone.now() + backoff(1)
+    EmailOutbox.objects.bulk_create([
+        EmailOutbox(
+            subject=subject,
+            to_email=email,
+            template_name=template_name,
+            text_body=text_content,
+            html_body=html_content,
+            attempts=1,
+            next_attempt_at=retry_at,
+            last_error=str(error)[:1000],
+        )
+        for email in recipients
+    ])
+    logger.warning("Deferred %s email(s) to the outbox: %s", len(recipients), error)
+
+
+def _kick_drain():
+    from .tasks import drain_email_outbox
+
+    try:
+        drain_email_outbox.delay()
+    except Exception as e:
+        # the periodic drain still sends it
+        logger.warning("Could not enqueue email outbox drain: %s", e)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def _send_batch(batch, now):
+    pool = get_pool()
+    for message in batch:
+        if message.expires_at is not None and message.expires_at <= now:
+            message.status = DEAD
+            message.last_error = f"Expired at {message.expires_at.isoformat()} before it could be sent."
+            message.text_body = message.html_body = ""
+            logger.warning("Email %s to %s expired unsent after %s attempts", message.id, message.to_email, message.attempts)
+            continue
+        message.attempts += 1
+        try:
+            pool.send_messages([build_email(message.subject, message.to_email, message.text_body, message.html_body)])
+        except Exception as e:
+            message.last_error = str(e)[:1000]
+            if message.attempts >= MAX_ATTEMPTS:
+                message.status = DEAD
+                message.text_body = message.html_body = ""
+                logger.error("Email %s to %s is dead after %s attempts: %s", message.id, message.to_email, message.attempts, e)
+            else:
+                message.next_attempt_at = now + backoff(message.attempts)
+        else:
+            message.status = SENT
+            message.sent_at = now
+            message.text_body = message.html_body = message.last_error = ""
+    EmailOutbox.objects.bulk_update(
+        batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at", "text_body", "html_body"]
+    )
+
+
+def drain(batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+    """Send due messages in batches until none are left or max_batches were sent."""
+    stats = {SENT: 0, DEAD: 0, "retrying": 0}
+    for _ in range(max_batches):
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                EmailOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status=PENDING, next_attempt_at__lte=now)
+                .order_by("next_attempt_at", "id")[:batch_size]
+            )
+            if batch:
+                _send_batch(batch, now)
+        for message in batch:
+            stats[message.status if message.status != PENDING else "retrying"] += 1
+        if len(batch) < batch_size:
+            break
+    return stats
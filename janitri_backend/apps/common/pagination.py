@@ -1,5 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from math import ceil
 from utils.responses import success_response
 
@@ -31,3 +38,163 @@ class StandardResultsSetPagination(PageNumberPagination):
         # Wrap in success_response
         return success_response(message="Success", data=paginated_data)
 
+
+class KeysetResultsSetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination on an indexed (timestamp, id) key.
+    Never runs COUNT(*) or OFFSET, so deep pages cost the same as the first.
+    Responses keep the success_response envelope, without count/total_pages.
+    A view may define merge_keyset_page(page, after, descending, limit) to
+    merge rows from another source into the first `limit` rows past the
+    cursor key `after` (a (value, pk) pair, None on the first page).
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ("-created_at", "-id")
+
+    def get_ordering(self, request, view):
+        ordering = tuple(getattr(view, "keyset_ordering", self.ordering))
+        # honour ?ordering=<field> / -<field> on the keyset's leading field
+        requested = request.query_params.get("ordering", "").strip()
+        if requested.lstrip("-") == ordering[0].lstrip("-"):
+            prefix = "-" if requested.startswith("-") else ""
+            ordering = tuple(prefix + field.lstrip("-") for field in ordering)
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return data["v"], data["id"], bool(data.get("r"))
+        except (ValueError, KeyError, TypeError):
+            raise NotFound("Invalid cursor.")
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.key_field)
+        data = {"v": value.isoformat() if hasattr(value, "isoformat") else value, "id": obj.pk, "r": int(reverse)}
+        cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, view)
+        self.key_field = ordering[0].lstrip("-")
+        descending = ordering[0].startswith("-")
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+        if reverse:
+            # walking back towards the start: flip the scan direction, then the page
+            descending = not descending
+            ordering = tuple(field[1:] if field.startswith("-") else "-" + field for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        after = None
+        if cursor:
+            value, pk, _ = cursor
+            try:
+                value = queryset.model._meta.get_field(self.key_field).to_python(value)
+            except ValidationError:
+                raise NotFound("Invalid cursor.")
+            op = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{self.key_field}__{op}e": value})
+                & (Q(**{f"{self.key_field}__{op}": value}) | Q(**{f"pk__{op}": pk}))
+            )
+            after = (value, pk)
+
+        page = list(queryset[:self.page_size + 1])
+        # views can add rows kept outside the table, e.g. archived readings
+        merge = getattr(view, "merge_keyset_page", None)
+        if merge is not None:
+            page = merge(page, after, descending, self.page_size + 1)
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_link = self.previous_link = None
+        if page:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(page[-1], reverse=False)
+            if cursor and (has_more or not reverse):
+                self.previous_link = self.encode_cursor(page[0], reverse=True)
+        return page
+
+    def get_next_link(self):
+        return self.next_link
+
+    def get_previous_link(self):
+        return self.previous_link
+
+    def get_paginated_response(self, data):
+        paginated_data = {
+            "page_size": self.page_size,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        return success_response(message="Success", data=paginated_data)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opaque cursor from a previous response's next/previous link.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class KeysetPaginationMixin:
+    """
+    Lets a viewset switch from page-number to keyset pagination with
+    `?pagination=cursor` (or any `?cursor=`), or for every request when the
+    view's class name is listed in settings.KEYSET_PAGINATION_VIEWS.
+    """
+    keyset_pagination_class = KeysetResultsSetPagination
+    keyset_ordering = ("-created_at", "-id")
+
+    def use_keyset_pagination(self):
+        params = self.request.query_params
+        mode = params.get("pagination")
+        if mode:
+            return mode == "cursor"
+        if KeysetResultsSetPagination.cursor_query_param in params:
+            return True
+        return self.__class__.__name__ in getattr(settings, "KEYSET_PAGINATION_VIEWS", [])
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.pagination_class is None:
+                self._paginator = None
+            elif self.use_keyset_pagination():
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
@@ -1,4 +1,170 @@
+from django.db.models import Prefetch
+from drf_spectacular.utils import OpenApiParameter
 from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
 
 class StatusUpdateSerializer(serializers.Serializer):
     is_active = serializers.BooleanField(required=True)
+
+
+# ---------------- sparse fieldsets ----------------
+FIELD_SELECTION_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        description=(
+            "Comma separated fields to return, e.g. 'id,bpm,patient_detail.name'. "
+            "Nested objects are left out unless listed here or in 'expand'."
+        ),
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(
+        name="expand",
+        description="Comma separated nested objects to embed, e.g. 'record_detail.patient_detail'.",
+        required=False,
+        type=str,
+    ),
+]
+
+
+def parse_field_paths(value):
+    """Turn 'a,b.c,b.d' into the tree {"a": {}, "b": {"c": {}, "d": {}}}."""
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for part in path.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def get_field_selection(request):
+    """
+    Read ?fields= / ?expand= from a GET request.
+
+    Returns (only, expand) trees, or None when neither parameter is given,
+    in which case serializers keep their full legacy nesting.
+    """
+    if request is None or request.method not in ("GET", "HEAD"):
+        return None
+    params = request.query_params
+    if "fields" not in params and "expand" not in params:
+        return None
+    only = parse_field_paths(params["fields"]) if params.get("fields") else None
+    return only, parse_field_paths(params.get("expand", ""))
+
+
+def _is_nested(field):
+    return isinstance(field, serializers.BaseSerializer)
+
+
+def select_field(name, nested, selection):
+    """
+    Decide whether a field is rendered under selection.
+    Returns (keep, child_selection) where child_selection applies to a nested serializer.
+    """
+    if selection is None:
+        return True, None
+    only, expand = selection
+    if nested:
+        keep = name in expand or (only is not None and name in only)
+    else:
+        keep = only is None or name in only
+    if not keep or not nested:
+        return keep, None
+    return True, ((only or {}).get(name) or None, expand.get(name, {}))
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets and opt-in expansion.
+
+    With ?fields= only the listed fields are rendered, with ?expand= the
+    listed nested serializers are embedded; nested objects are dropped
+    unless asked for. Without either parameter every field is rendered as
+    before. The selection is read from the request by the outermost
+    serializer and handed down to nested ones.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._field_selection = kwargs.pop("field_selection", None)
+        super().__init__(*args, **kwargs)
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self._field_selection
+        if selection is None and self._is_root():
+            selection = get_field_selection(self.context.get("request"))
+        if selection is None:
+            return fields
+
+        for name, field in list(fields.items()):
+            keep, child_selection = select_field(name, _is_nested(field), selection)
+            if not keep:
+                del fields[name]
+                continue
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(child, DynamicFieldsMixin):
+                child._field_selection = child_selection
+        return fields
+
+
+class DynamicFieldsModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    pass
+
+
+# ---------------- eager loading ----------------
+def _lookup(prefix, field, name):
+    source = field.source or name
+    if source == "*":
+        return None
+    return prefix + source.replace(".", "__")
+
+
+def get_eager_lookups(serializer_class, prefix="", selection=None):
+    """
+    Walk a serializer's declared fields and return the (select_related,
+    prefetch_related) lookups needed to serialize it without N+1 queries.
+
+    Nested serializers become select_related joins (recursing into their own
+    fields), nested many=True serializers become Prefetch objects whose
+    querysets are eager loaded the same way, and StringRelatedField-style
+    fields join their target. PK related fields read the *_id column only.
+    selection is a (fields, expand) pair from get_field_selection; fields
+    it leaves out are not loaded.
+    """
+    selects, prefetches = [], []
+    for name, field in serializer_class._declared_fields.items():
+        keep, child_selection = select_field(name, _is_nested(field), selection)
+        if not keep:
+            continue
+
+        lookup = _lookup(prefix, field, name)
+        if lookup is None:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            child = type(field.child)
+            if not hasattr(child, "Meta"):
+                continue
+            child_selects, child_prefetches = get_eager_lookups(child, selection=child_selection)
+            queryset = child.Meta.model.objects.select_related(*child_selects).prefetch_related(*child_prefetches)
+            prefetches.append(Prefetch(lookup, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            selects.append(lookup)
+            child_selects, child_prefetches = get_eager_lookups(
+                type(field), prefix=lookup + "__", selection=child_selection
+            )
+            selects.extend(child_selects)
+            prefetches.extend(child_prefetches)
+        elif isinstance(field, ManyRelatedField):
+            prefetches.append(lookup)
+        elif isinstance(field, RelatedField) and not isinstance(field, PrimaryKeyRelatedField):
+            selects.append(lookup)
+    return selects, prefetches
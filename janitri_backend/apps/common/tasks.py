@@ -0,0 +1,17 @@
+# apps/common/tasks.py
+
+import logging
+from celery import shared_task
+
+from . import outbox
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def drain_email_outbox():
+    """Send due EmailOutbox messages, see apps/common/outbox.py."""
+    stats = outbox.drain()
+    if any(stats.values()):
+        logger.info("Email outbox drain %s", stats)
+    return stats
@@ -1,3 +1,267 @@
+from unittest import mock
+from django.core import mail
 from django.test import TestCase
 
 # Create your tests here.
+from django.db import connection, transaction
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from apps.alerts.models import Alert
+from apps.common import outbox
+from apps.common.models import EmailOutbox
+from apps.common.tasks import drain_email_outbox
+from apps.devices.models import Device
+from apps.patients.models import Guardian, Patient
+from apps.places.models import Place
+from apps.records.models import HeartRateRecord
+from apps.users.models import User
+from utils.services.email.pool import PooledConnection
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+        # identical timestamps force the id tie-breaker to do its job
+        HeartRateRecord.objects.bulk_create([HeartRateRecord(patient=self.patient, bpm=60 + i) for i in range(25)])
+
+    def _walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.data["data"]
+            seen.extend(item["id"] for item in data["results"])
+            if not data["next"]:
+                return seen, data
+            response = self.client.get(data["next"])
+
+    def test_cursor_pages_cover_all_records_once(self):
+        url = reverse("heart-rate-record-list")
+        seen, last_page = self._walk(url, {"pagination": "cursor", "page_size": 10})
+        expected = list(HeartRateRecord.objects.order_by("-recorded_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+        self.assertNotIn("count", last_page)
+
+    def test_previous_link_returns_previous_page(self):
+        url = reverse("heart-rate-record-list")
+        first = self.client.get(url, {"pagination": "cursor", "page_size": 10}).data["data"]
+        second = self.client.get(first["next"]).data["data"]
+        back = self.client.get(second["previous"]).data["data"]
+        self.assertEqual([r["id"] for r in back["results"]], [r["id"] for r in first["results"]])
+
+    def test_cursor_pagination_does_not_count(self):
+        url = reverse("heart-rate-record-list")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {"pagination": "cursor"})
+        self.assertFalse(any("COUNT(" in q["sql"].upper() for q in queries.captured_queries))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("alerts-list"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class QueryBudgetTests(APITestCase):
+    """List and retrieve must run a fixed number of queries whatever the page size."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic", created_by=self.admin_user, modified_by=self.admin_user)
+        for i in range(12):
+            patient = Patient.objects.create(
+                name=f"Patient {i}", age=30, gender="M", place=self.place,
+                created_by=self.admin_user, modified_by=self.admin_user,
+            )
+            Guardian.objects.create(name=f"Guardian {i}", phone="9876543210", relation="Father", patient=patient,
+                                    created_by=self.admin_user)
+            Device.objects.create(device_id=f"DEV-{i}", place=self.place, assigned_to=patient, created_by=self.admin_user)
+            # 150 bpm raises an alert through the post_save hook
+            record = HeartRateRecord.objects.create(patient=patient, bpm=150)
+            HeartRateRecord.objects.create(patient=patient, bpm=80)
+            Alert.objects.filter(record=record).update(resolved=True, resolved_by=self.admin_user)
+
+    def _count(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries.captured_queries)
+
+    def assertListBudget(self, url_name, budget):
+        url = reverse(url_name)
+        small = self._count(url, {"page_size": 2})
+        large = self._count(url, {"page_size": 10})
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, budget)
+
+    def test_alert_list(self):
+        self.assertTrue(Alert.objects.exists())
+        self.assertListBudget("alerts-list", 4)
+
+    def test_heart_rate_record_list(self):
+        # one more for the archive boundary (X-Archived-Before)
+        self.assertListBudget("heart-rate-record-list", 4)
+
+    def test_patient_list(self):
+        self.assertListBudget("patient-list", 3)
+
+    def test_device_list(self):
+        self.assertListBudget("device-list", 3)
+
+    def test_retrieve(self):
+        alert = Alert.objects.first()
+        self.assertLessEqual(self._count(reverse("alerts-detail", args=[alert.id])), 3)
+        record = HeartRateRecord.objects.first()
+        self.assertLessEqual(self._count(reverse("heart-rate-record-detail", args=[record.id])), 2)
+        device = Device.objects.first()
+        self.assertLessEqual(self._count(reverse("device-detail", args=[device.id])), 2)
+
+
+class FieldSelectionTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+        Guardian.objects.create(name="Jane", phone="9876543210", relation="Mother", patient=self.patient)
+        self.record = HeartRateRecord.objects.create(patient=self.patient, bpm=150)
+        self.url = reverse("alerts-list")
+
+    def _first(self, params=None):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["data"]["results"][0]
+
+    def test_without_params_keeps_full_nesting(self):
+        alert = self._first()
+        self.assertIn("patient_detail", alert)
+        self.assertIn("patient_detail", alert["record_detail"])
+        self.assertEqual(alert["patient_detail"]["guardians"][0]["name"], "Jane")
+
+    def test_fields_limits_output(self):
+        alert = self._first({"fields": "id,message"})
+        self.assertEqual(set(alert), {"id", "message"})
+
+    def test_expand_embeds_only_requested_relations(self):
+        alert = self._first({"expand": "record_detail"})
+        self.assertIn("record_detail", alert)
+        self.assertNotIn("patient_detail", alert)
+        self.assertNotIn("patient_detail", alert["record_detail"])
+
+        alert = self._first({
+            "expand": "record_detail.patient_detail",
+            "fields": "id,record_detail.bpm,record_detail.patient_detail.name",
+        })
+        self.assertEqual(alert["record_detail"], {"bpm": 150, "patient_detail": {"name": "John Doe"}})
+
+    def test_unexpanded_relations_are_not_queried(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {"fields": "id,patient,message"})
+        sql = " ".join(q["sql"] for q in queries.captured_queries)
+        self.assertNotIn("patients_guardian", sql)
+        self.assertNotIn("places_place", sql)
+        self.assertNotIn("records_heartraterecord", sql)
+
+
+class EmailOutboxTests(APITestCase):
+    def _register(self):
+        return self.client.post(reverse("users-register"), {
+            "email": "newuser@test.com",
+            "password": "newpass123",
+            "first_name": "New",
+            "last_name": "User",
+            "phone": "9876543210",
+        })
+
+    def test_request_queues_email_and_drainer_sends_it(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self._register()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = EmailOutbox.objects.get()
+        self.assertEqual((message.to_email, message.status), ("newuser@test.com", outbox.PENDING))
+        self.assertEqual(len(mail.outbox), 0)
+
+        with mock.patch.object(drain_email_outbox, "delay") as delay:
+            for callback in callbacks:
+                callback()
+        delay.assert_called_once_with()
+        outbox.drain()
+        message.refresh_from_db()
+        self.assertEqual(message.status, outbox.SENT)
+        self.assertEqual((message.text_body, message.html_body), ("", ""))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["newuser@test.com"])
+
+    def test_rolled_back_request_sends_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            outbox.queue_email("Hi", "a@test.com", "welcome_email", {})
+            raise RuntimeError
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_smtp_failure_does_not_fail_request(self):
+        with mock.patch.object(PooledConnection, "send_messages", side_effect=OSError("smtp down")):
+            with mock.patch.object(drain_email_outbox, "delay"), self.captureOnCommitCallbacks(execute=True):
+                response = self._register()
+            outbox.drain()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = EmailOutbox.objects.get()
+        self.assertEqual((message.status, message.attempts), (outbox.PENDING, 1))
+        self.assertIn("smtp down", message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+    def test_retries_back_off_then_dead_letter(self):
+        message = EmailOutbox.objects.create(
+            subject="Hi", to_email="a@test.com", template_name="welcome_email", text_body="password: x", html_body="x"
+        )
+        with mock.patch.object(PooledConnection, "send_messages", side_effect=OSError("smtp down")):
+            for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+                EmailOutbox.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+                outbox.drain()
+                message.refresh_from_db()
+                self.assertEqual(message.attempts, attempt)
+        self.assertEqual(message.status, outbox.DEAD)
+        self.assertEqual((message.text_body, message.html_body), ("", ""))
+        self.assertEqual(outbox.backoff(1).total_seconds(), outbox.BACKOFF_SECONDS)
+        self.assertEqual(outbox.backoff(2).total_seconds(), 2 * outbox.BACKOFF_SECONDS)
+        # nothing left to send
+        self.assertEqual(outbox.drain(), {outbox.SENT: 0, outbox.DEAD: 0, "retrying": 0})
+
+    def test_expired_message_is_dead_lettered_not_sent(self):
+        from datetime import timedelta
+        from utils.resource.otp.otp_handler import OTP_EXPIRY
+
+        User.objects.create_user(email="user@test.com", password="x", first_name="U")
+        with mock.patch.object(drain_email_outbox, "delay"), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("auth-forgot-password"), {"email": "user@test.com"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = EmailOutbox.objects.get()
+        self.assertAlmostEqual(
+            (message.expires_at - message.created_at).total_seconds(), OTP_EXPIRY, delta=5
+        )
+
+        # the mail server was down until after the code expired
+        EmailOutbox.objects.filter(pk=message.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.drain(), {outbox.SENT: 0, outbox.DEAD: 1, "retrying": 0})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (outbox.DEAD, 0))
+        self.assertEqual((message.text_body, message.html_body), ("", ""))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_admin_does_not_show_bodies(self):
+        admin_user = User.objects.create_superuser(email="admin@test.com", first_name="A", password="x")
+        message = outbox.queue_email("Hi", "a@test.com", "welcome_email_with_credentials", {"password": "s3cret-pass"})
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse("admin:common_emailoutbox_change", args=[message.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotContains(response, "s3cret-pass")
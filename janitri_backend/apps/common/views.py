@@ -11,6 +11,9 @@ class ChoiceTypeEnum(str, Enum):
     role = "role"
     gender = "gender"
     relation = "relation"
+    alert_severity = "alert_severity"
+    alert_operator = "alert_operator"
+    alert_window = "alert_window"
 
 @extend_schema(
     parameters=[
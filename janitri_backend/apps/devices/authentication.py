@@ -0,0 +1,83 @@
+# apps/devices/authentication.py
+
+import hmac
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+
+from .cache import get_device_assignment
+from .models import hash_api_key
+
+
+class DeviceIdentity:
+    """The authenticated device, built from the cached assignment (no model instance)."""
+
+    def __init__(self, device_id, data):
+        self.device_id = device_id
+        self.id = data["id"]
+        self.place_id = data["place_id"]
+        self.assigned_to_id = data["assigned_to_id"]
+
+    def refresh(self):
+        """Re-resolve the assignment so long streams follow patient re-assignment."""
+        data = get_device_assignment(self.device_id)
+        if not data or not data["is_active"]:
+            self.assigned_to_id = None
+            return self
+        self.place_id = data["place_id"]
+        self.assigned_to_id = data["assigned_to_id"]
+        return self
+
+
+class DeviceKeyAuthentication(BaseAuthentication):
+    """
+    Authenticate a device with `Authorization: Device <device_id>:<api_key>`.
+    request.user stays anonymous and request.auth is the DeviceIdentity.
+    """
+    keyword = "Device"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed("Invalid device authorization header.")
+
+        try:
+            device_id, api_key = auth[1].decode().split(":", 1)
+        except (UnicodeError, ValueError):
+            raise AuthenticationFailed("Invalid device authorization header.")
+
+        data = get_device_assignment(device_id)
+        if not data or not data["api_key_hash"]:
+            raise AuthenticationFailed("Invalid device credentials.")
+        if not hmac.compare_digest(data["api_key_hash"], hash_api_key(api_key)):
+            raise AuthenticationFailed("Invalid device credentials.")
+        if not data["is_active"]:
+            raise AuthenticationFailed("Device is inactive.")
+
+        return AnonymousUser(), DeviceIdentity(device_id, data)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class IsAuthenticatedDevice(BasePermission):
+    """Allow only requests authenticated by DeviceKeyAuthentication."""
+    def has_permission(self, request, view):
+        return isinstance(request.auth, DeviceIdentity)
+
+
+class DeviceKeyAuthenticationScheme(OpenApiAuthenticationExtension):
+    target_class = "apps.devices.authentication.DeviceKeyAuthentication"
+    name = "deviceKeyAuth"
+
+    def get_security_definition(self, auto_schema):
+        return {
+            "type": "apiKey",
+            "in": "header",
+            "name": "Authorization",
+            "description": "Device <device_id>:<api_key>",
+        }
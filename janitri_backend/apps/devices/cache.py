@@ -0,0 +1,35 @@
+# apps/devices/cache.py
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Device
+
+ASSIGNMENT_CACHE_TTL = getattr(settings, "DEVICE_ASSIGNMENT_CACHE_TTL", 300)
+
+
+def _cache_key(device_id):
+    return f"device:assignment:{device_id}"
+
+
+def get_device_assignment(device_id):
+    """
+    Resolve a device_id to its ingest identity without touching the database
+    on the hot path. Returns a dict with id, api_key_hash, is_active,
+    place_id and assigned_to_id, or None for unknown devices.
+    Unknown devices are cached too so bad clients cannot hammer the DB.
+    """
+    key = _cache_key(device_id)
+    data = cache.get(key)
+    if data is None:
+        data = (
+            Device.objects.filter(device_id=device_id)
+            .values("id", "api_key_hash", "is_active", "place_id", "assigned_to_id")
+            .first()
+        ) or {}
+        cache.set(key, data, ASSIGNMENT_CACHE_TTL)
+    return data or None
+
+
+def invalidate_device_assignment(device_id):
+    cache.delete(_cache_key(device_id))
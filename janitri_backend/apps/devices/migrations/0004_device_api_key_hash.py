@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='api_key_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the device ingest key', max_length=64),
+        ),
+    ]
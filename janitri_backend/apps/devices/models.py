@@ -1,6 +1,13 @@
+import hashlib
+import secrets
 from django.db import models
 from apps.common.models import BaseModel
 
+
+def hash_api_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
 # Create your models here.
 
 class Device(BaseModel):
@@ -8,7 +15,13 @@ class Device(BaseModel):
     place = models.ForeignKey("places.Place", on_delete=models.CASCADE, related_name="devices")
     assigned_to = models.OneToOneField("patients.Patient", on_delete=models.SET_NULL, null=True, blank=True, related_name="device")
     is_active = models.BooleanField(default=True)
-    
+    api_key_hash = models.CharField(max_length=64, blank=True, default="", help_text="SHA-256 of the device ingest key")
 
     def __str__(self):
         return f"Device {self.device_id}"
+
+    def rotate_api_key(self):
+        """Generate a new ingest key, store only its hash and return the plain key."""
+        key = secrets.token_urlsafe(32)
+        self.api_key_hash = hash_api_key(key)
+        return key
@@ -4,8 +4,9 @@ from apps.places.models import Place
 from apps.patients.models import Patient
 from apps.places.serializers import PlaceSerializer
 from apps.patients.serializers import PatientSerializer
+from apps.common.serializers import DynamicFieldsModelSerializer
 
-class DeviceSerializer(serializers.ModelSerializer):
+class DeviceSerializer(DynamicFieldsModelSerializer):
     place_detail = PlaceSerializer(source="place", read_only=True)
     assigned_to_detail = PatientSerializer(source="assigned_to", read_only=True)
     created_by = serializers.StringRelatedField(read_only=True)
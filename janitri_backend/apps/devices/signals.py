@@ -0,0 +1,30 @@
+# devices/signals.py
+
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Device
+from .cache import invalidate_device_assignment
+from apps.patients.models import Patient
+
+
+@receiver(post_init, sender=Device)
+def remember_device_id(sender, instance, **kwargs):
+    instance._original_device_id = instance.device_id
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_cache(sender, instance, **kwargs):
+    """Drop the cached device -> patient assignment whenever a device changes."""
+    invalidate_device_assignment(instance.device_id)
+    if instance._original_device_id and instance._original_device_id != instance.device_id:
+        invalidate_device_assignment(instance._original_device_id)
+    instance._original_device_id = instance.device_id
+
+
+@receiver(pre_delete, sender=Patient)
+def invalidate_assigned_device_cache(sender, instance, **kwargs):
+    # Device.assigned_to is SET_NULL'd with a queryset update, which skips post_save
+    for device_id in Device.objects.filter(assigned_to=instance).values_list("device_id", flat=True):
+        invalidate_device_assignment(device_id)
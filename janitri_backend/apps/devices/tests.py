@@ -72,3 +72,95 @@ class DeviceTests(APITestCase):
         self.device.refresh_from_db()
         self.assertIsNone(self.device.assigned_to)
 
+    def _device_auth(self, device, api_key):
+        self.client.force_authenticate(user=None)
+        return {"HTTP_AUTHORIZATION": f"Device {device.device_id}:{api_key}"}
+
+    def test_device_stream_ingest(self):
+        from apps.records.models import HeartRateRecord
+
+        api_key = self.device.rotate_api_key()
+        self.device.save()
+        body = "\n".join(['{"bpm": 80}', "81", "not json", '{"bpm": -4}', '{"bpm": 82}']) + "\n"
+        response = self.client.post(
+            reverse("device-ingest"), data=body, content_type="application/x-ndjson",
+            **self._device_auth(self.device, api_key),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["accepted"], 3)
+        self.assertEqual(response.data["data"]["rejected"], 2)
+        self.assertEqual(HeartRateRecord.objects.filter(patient=self.patient).count(), 3)
+
+    def test_device_stream_replay_is_idempotent(self):
+        from apps.records.models import HeartRateRecord
+
+        api_key = self.device.rotate_api_key()
+        self.device.save()
+        body = "\n".join([
+            '{"bpm": 80, "sequence": 1, "recorded_at": "2025-01-01T10:00:00Z"}',
+            '{"bpm": 81, "sequence": 2, "recorded_at": 1735725601}',
+            '{"bpm": 82, "sequence": 3, "recorded_at": "soon"}',
+        ]) + "\n"
+        for expected in (2, 0):
+            response = self.client.post(
+                reverse("device-ingest"), data=body, content_type="application/x-ndjson",
+                **self._device_auth(self.device, api_key),
+            )
+            self.assertEqual(response.data["data"]["accepted"], expected)
+        self.assertEqual(response.data["data"]["duplicates"], 2)
+        self.assertEqual(response.data["data"]["rejected"], 1)
+        records = HeartRateRecord.objects.filter(device=self.device).order_by("sequence")
+        self.assertEqual([(r.sequence, r.recorded_at.isoformat()) for r in records], [
+            (1, "2025-01-01T10:00:00+00:00"), (2, "2025-01-01T10:00:01+00:00"),
+        ])
+
+    def test_device_stream_rejects_out_of_range_epochs(self):
+        from apps.records.models import HeartRateRecord
+
+        api_key = self.device.rotate_api_key()
+        self.device.save()
+        body = "\n".join([
+            '{"bpm": 80}', '{"bpm": 81, "recorded_at": 1e20}', '{"bpm": 82, "recorded_at": Infinity}', '{"bpm": 83}',
+        ]) + "\n"
+        response = self.client.post(
+            reverse("device-ingest"), data=body, content_type="application/x-ndjson",
+            **self._device_auth(self.device, api_key),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["data"]["accepted"], response.data["data"]["rejected"]), (2, 2))
+        self.assertEqual([e["line"] for e in response.data["data"]["errors"]], [2, 3])
+        self.assertEqual(HeartRateRecord.objects.filter(patient=self.patient).count(), 2)
+
+    def test_device_stream_sequence_needs_recorded_at(self):
+        from apps.records.models import HeartRateRecord
+
+        api_key = self.device.rotate_api_key()
+        self.device.save()
+        for _ in range(2):
+            response = self.client.post(
+                reverse("device-ingest"), data='{"bpm": 80, "sequence": 1}\n', content_type="application/x-ndjson",
+                **self._device_auth(self.device, api_key),
+            )
+            self.assertEqual((response.data["data"]["accepted"], response.data["data"]["rejected"]), (0, 1))
+        self.assertFalse(HeartRateRecord.objects.filter(device=self.device).exists())
+
+    def test_device_stream_ingest_invalid_key(self):
+        self.device.rotate_api_key()
+        self.device.save()
+        response = self.client.post(
+            reverse("device-ingest"), data="80\n", content_type="application/x-ndjson",
+            **self._device_auth(self.device, "wrong-key"),
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_device_stream_ingest_follows_assignment(self):
+        api_key = self.device.rotate_api_key()
+        self.device.assigned_to = None
+        self.device.save()
+        response = self.client.post(
+            reverse("device-ingest"), data="80\n81\n", content_type="application/x-ndjson",
+            **self._device_auth(self.device, api_key),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["accepted"], 0)
+        self.assertEqual(response.data["data"]["rejected"], 2)
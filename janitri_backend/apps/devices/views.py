@@ -4,14 +4,31 @@ from utils.responses import success_response, error_response
 from .models import Device
 from .serializers import DeviceSerializer
 from apps.common.pagination import StandardResultsSetPagination
+from apps.common.mixins import EagerLoadingMixin
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from apps.common.serializers import StatusUpdateSerializer
+from apps.common.serializers import StatusUpdateSerializer, FIELD_SELECTION_PARAMETERS
 from rest_framework.decorators import action
+from .authentication import DeviceKeyAuthentication, IsAuthenticatedDevice
+from apps.records.services import ingest_stream
+from apps.records.writebehind import IngestBacklogFull, RETRY_AFTER_SECONDS
 
 
-class DeviceViewSet(viewsets.ModelViewSet):
+def iter_request_lines(request):
+    """
+    Iterate the raw request body line by line without buffering it.
+    Chunked uploads have no Content-Length, so read straight from wsgi.input
+    when the server has de-chunked it for us.
+    """
+    django_request = request._request
+    environ = getattr(django_request, "environ", {})
+    if not django_request.META.get("CONTENT_LENGTH") and environ.get("wsgi.input_terminated"):
+        return iter(environ["wsgi.input"].readline, b"")
+    return iter(django_request)
+
+
+class DeviceViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Device.objects.all()
     serializer_class = DeviceSerializer
     permission_classes = [IsAuthenticated]
@@ -29,6 +46,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
 
     @extend_schema(
         parameters=[
+            *FIELD_SELECTION_PARAMETERS,
             OpenApiParameter(
                 name="ordering",
                 description="Order by any of: device_id, is_active, created_at. Use '-' prefix for descending.",
@@ -52,6 +70,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return error_response("Error retrieving devices", str(e), status=500)
 
+    @extend_schema(parameters=FIELD_SELECTION_PARAMETERS)
     def retrieve(self, request, *args, **kwargs):
         try:
             device = self.get_object()
@@ -125,4 +144,54 @@ class DeviceViewSet(viewsets.ModelViewSet):
                 data={"id": device.id, "is_active": device.is_active}
             )
         except Exception as e:
-            return error_response("Error changing device status", str(e), status=500)
\ No newline at end of file
+            return error_response("Error changing device status", str(e), status=500)
+
+    @extend_schema(
+        description="Generate a new ingest key for the device (returned once)",
+        request=None,
+        responses={200: dict},
+    )
+    @action(detail=True, methods=["post"], url_path="rotate-key")
+    def rotate_key(self, request, pk=None):
+        try:
+            device = self.get_object()
+            api_key = device.rotate_api_key()
+            device.modified_by = request.user
+            device.save(update_fields=["api_key_hash", "modified_by", "modified_at"])
+            return success_response(
+                message="Device key rotated. Store it now, it will not be shown again.",
+                data={"id": device.id, "device_id": device.device_id, "api_key": api_key},
+            )
+        except Device.DoesNotExist:
+            return error_response("Device not found", status=404)
+        except Exception as e:
+            return error_response("Error rotating device key", str(e), status=500)
+
+    @extend_schema(
+        description=(
+            "Long-lived ingest channel for devices. Authenticate with "
+            "`Authorization: Device <device_id>:<api_key>` and stream newline-delimited "
+            "readings such as `{\"bpm\": 82}`. Rows are committed in micro-batches to the "
+            "patient the device is assigned to."
+        ),
+        request={"application/x-ndjson": str},
+        responses={200: dict},
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="ingest",
+        authentication_classes=[DeviceKeyAuthentication],
+        permission_classes=[IsAuthenticatedDevice],
+    )
+    def ingest(self, request):
+        try:
+            stats = ingest_stream(iter_request_lines(request), request.auth)
+            return success_response(message="Stream ingested", data=stats)
+        except IngestBacklogFull as e:
+            # batches before the full one are queued, resent readings with a sequence and recorded_at are skipped
+            response = error_response(str(e), status=503)
+            response["Retry-After"] = str(RETRY_AFTER_SECONDS)
+            return response
+        except Exception as e:
+            return error_response("Error ingesting stream", str(e), status=500)
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_alter_patient_created_by'),
+        ('places', '0003_place_email_place_is_active'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at', 'id'], name='patients_created_id_idx'),
+        ),
+    ]
@@ -9,6 +9,11 @@ class Patient(BaseModel):
     age = models.PositiveIntegerField()
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="patients_created_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -3,10 +3,11 @@ from .models import Patient, Guardian
 from apps.places.serializers import PlaceSerializer
 from apps.common.validators import phone_validator
 from utils.constants.choices import GENDER_CHOICES, RELATION_CHOICES
+from apps.common.serializers import DynamicFieldsModelSerializer
 # --------- Guardian Serializer ---------
 
 
-class GuardianSerializer(serializers.ModelSerializer):
+class GuardianSerializer(DynamicFieldsModelSerializer):
     created_by = serializers.StringRelatedField(read_only=True)
     modified_by = serializers.StringRelatedField(read_only=True)
     phone = serializers.CharField(validators=[phone_validator])
@@ -45,7 +46,7 @@ class GuardianSerializer(serializers.ModelSerializer):
 
 
 # --------- Patient Serializer ---------
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(DynamicFieldsModelSerializer):
     guardians = GuardianSerializer(many=True, read_only=True)
     place_detail = PlaceSerializer(source="place", read_only=True)
     created_by = serializers.StringRelatedField(read_only=True)
@@ -1,19 +1,23 @@
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
 from utils.responses import success_response, error_response
 from .models import Patient, Guardian
 from .serializers import PatientSerializer, GuardianSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from apps.common.pagination import StandardResultsSetPagination
+from apps.common.pagination import StandardResultsSetPagination, KeysetPaginationMixin
+from apps.common.mixins import EagerLoadingMixin
+from apps.common.serializers import FIELD_SELECTION_PARAMETERS
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(EagerLoadingMixin, KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ("-created_at", "-id")
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['place', 'age', 'gender']
     ordering_fields = ['age', 'created_at', 'name']  # allowed ordering via query params
@@ -28,12 +32,26 @@ class PatientViewSet(viewsets.ModelViewSet):
     
     @extend_schema(
         parameters=[
+            *FIELD_SELECTION_PARAMETERS,
             OpenApiParameter(
                 name='ordering',
                 description='Order by any of: name, age, created_at. Use "-" prefix for descending.',
                 required=False,
                 type=str,
             ),
+            OpenApiParameter(
+                name="pagination",
+                description="Use 'cursor' for keyset pagination (no count, constant cost for deep pages).",
+                required=False,
+                type=str,
+                enum=["page", "cursor"],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Cursor from a previous next/previous link (keyset pagination).",
+                required=False,
+                type=str,
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
@@ -49,9 +67,12 @@ class PatientViewSet(viewsets.ModelViewSet):
             # If pagination not applied
             serializer = self.get_serializer(queryset, many=True)
             return success_response(message="Patients retrieved successfully", data=serializer.data)
+        except NotFound as e:
+            return error_response(str(e.detail), status=404)
         except Exception as e:
             return error_response(message="Error retrieving patients", errors=str(e), status=500)
 
+    @extend_schema(parameters=FIELD_SELECTION_PARAMETERS)
     def retrieve(self, request, *args, **kwargs):
         try:
             patient = self.get_object()
@@ -109,7 +130,7 @@ class PatientViewSet(viewsets.ModelViewSet):
             return error_response("Error deleting patient", str(e), status=500)
 
 
-class GuardianViewSet(viewsets.ModelViewSet):
+class GuardianViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Guardian.objects.all()
     serializer_class = GuardianSerializer
     permission_classes = [IsAuthenticated]
@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from .models import Place
 from apps.common.validators import phone_validator
+from apps.common.serializers import DynamicFieldsModelSerializer
 
-class PlaceSerializer(serializers.ModelSerializer):
+class PlaceSerializer(DynamicFieldsModelSerializer):
     phone = serializers.CharField(required=False, validators=[phone_validator])
     created_by = serializers.StringRelatedField(read_only=True)
     modified_by = serializers.StringRelatedField(read_only=True)
@@ -1,11 +1,24 @@
+import asyncio
+import json
+from datetime import timedelta
 from django.test import TestCase
+from django.utils import timezone
 
 # Create your tests here.
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.alerts.models import Alert
+from apps.alerts.services import bulk_resolve
+from apps.common.events import CHANNEL, publish
 from apps.places.models import Place
+from apps.patients.models import Patient
+from apps.records.models import HeartRateRecord
+from apps.records.services import bulk_create_records
+from apps.records.vitals import get_place_vitals, invalidate_place_vitals, update_latest_vitals
 from apps.users.models import User
+from utils.redis_client import redis_client
 
 class PlaceTests(APITestCase):
     def setUp(self):
@@ -64,3 +77,116 @@ class PlaceTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreaterEqual(len(response.data.get("data", [])), 1)
+
+
+class LatestVitalsTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.alice = Patient.objects.create(name="Alice", age=30, gender="F", place=self.place)
+        self.bob = Patient.objects.create(name="Bob", age=40, gender="M", place=self.place)
+        self.url = reverse("place-latest-vitals", args=[self.place.id])
+        invalidate_place_vitals(self.place.id)
+
+    def _vitals(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {row["name"]: row for row in response.data["data"]}
+
+    def test_latest_vitals_follow_ingest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            HeartRateRecord.objects.create(patient=self.alice, bpm=70)
+            HeartRateRecord.objects.create(patient=self.alice, bpm=150)
+        vitals = self._vitals()
+        self.assertEqual(vitals["Alice"]["bpm"], 150)
+        self.assertTrue(vitals["Alice"]["open_alert"])
+        self.assertIsNone(vitals["Bob"]["bpm"])
+        self.assertFalse(vitals["Bob"]["open_alert"])
+
+    def test_older_reading_does_not_replace_newer(self):
+        now = timezone.now()
+        update_latest_vitals([HeartRateRecord(patient=self.bob, bpm=80, recorded_at=now)])
+        update_latest_vitals([HeartRateRecord(patient=self.bob, bpm=60, recorded_at=now - timedelta(minutes=5))])
+        self.assertEqual(get_place_vitals(self.place.id)[self.bob.id][1], 80)
+
+    def test_cold_cache_is_loaded_from_database(self):
+        HeartRateRecord.objects.create(patient=self.bob, bpm=88)
+        invalidate_place_vitals(self.place.id)
+        with self.assertNumQueries(3):  # place, patients with alert flag, warm-up
+            vitals = self._vitals()
+        self.assertEqual(vitals["Bob"]["bpm"], 88)
+        with self.assertNumQueries(2):
+            self._vitals()
+
+    def test_unknown_place(self):
+        response = self.client.get(reverse("place-latest-vitals", args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PlaceEventsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="nurse@test.com", password="x", first_name="Nurse", role="NURSE")
+        self.place = Place.objects.create(name="Ward")
+        self.patient = Patient.objects.create(name="Jane", age=30, gender="F", place=self.place)
+        self.url = reverse("place-events", args=[self.place.id])
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.pubsub = redis_client.pubsub()
+        self.pubsub.subscribe(CHANNEL.format(self.place.id))
+
+    def tearDown(self):
+        self.pubsub.close()
+
+    def _events(self):
+        events = []
+        while True:
+            message = self.pubsub.get_message(timeout=0.1)
+            if message is None:
+                return events
+            if message["type"] == "message":
+                events.append(json.loads(message["data"]))
+
+    def test_ingest_publishes_readings_and_new_alerts_once_per_place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_create_records([{"patient": self.patient.id, "bpm": bpm} for bpm in (80, 150)])
+        events = self._events()
+        self.assertEqual([e["type"] for e in events], ["alert.created", "reading"])
+        self.assertEqual([r["bpm"] for r in events[1]["data"]["readings"]], [80, 150])
+        self.assertEqual(events[0]["data"]["alerts"][0]["patient"], self.patient.id)
+
+    def test_bulk_resolve_publishes_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            HeartRateRecord.objects.create(patient=self.patient, bpm=150)
+        alert = Alert.objects.get()
+        self._events()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_resolve(Alert.objects.all(), self.user)
+        events = self._events()
+        self.assertEqual(events[0]["type"], "alert.resolved")
+        self.assertEqual(events[0]["data"]["ids"], [alert.id])
+
+    async def test_stream_delivers_published_events(self):
+        response = await self.async_client.get(self.url, {"token": self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+
+        publish([(self.place.id, "reading", {"readings": [{"patient": 1, "bpm": 90}]})])
+        chunk = (await asyncio.wait_for(anext(stream), timeout=5)).decode()
+        self.assertTrue(chunk.startswith("event: reading\ndata: "))
+        self.assertEqual(json.loads(chunk.split("data: ", 1)[1])["data"]["readings"][0]["bpm"], 90)
+        await stream.aclose()
+
+    async def test_stream_requires_token_and_existing_place(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        for header in ("Bearer ", "Bearer two parts"):
+            response = await self.async_client.get(self.url, headers={"Authorization": header})
+            self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            reverse("place-events", args=[self.place.id + 100]), headers={"Authorization": f"Bearer {self.token}"}
+        )
+        self.assertEqual(response.status_code, 404)
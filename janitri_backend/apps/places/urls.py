@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PlaceViewSet
+from .views import PlaceViewSet, place_events
 
 router = DefaultRouter()
 router.register(r'place', PlaceViewSet, basename='place')
 
 urlpatterns = [
+    path('place/<int:place_id>/events/', place_events, name='place-events'),
     path('', include(router.urls))
 ]
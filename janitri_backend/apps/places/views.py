@@ -1,4 +1,9 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework.permissions import IsAuthenticated
 from utils.responses import success_response, error_response
 from .models import Place
@@ -7,12 +12,16 @@ from .serializers import PlaceSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from apps.common.pagination import StandardResultsSetPagination
+from apps.common.mixins import EagerLoadingMixin
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework.decorators import action
 from apps.common.serializers import StatusUpdateSerializer
+from apps.records.serializers import LatestVitalSerializer
+from apps.records.vitals import latest_vitals_for_place
+from apps.common.events import stream_place_events
 
 
-class PlaceViewSet(viewsets.ModelViewSet):
+class PlaceViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Place.objects.all()
     serializer_class = PlaceSerializer
     permission_classes = [IsAuthenticated]
@@ -139,3 +148,61 @@ class PlaceViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return error_response("Error changing place status", str(e), status=500)
 
+
+    @extend_schema(
+        description=(
+            "Latest heart rate of every patient in the place with its time and whether "
+            "the patient has an unresolved alert. Served from the latest vitals cache."
+        ),
+        responses={200: LatestVitalSerializer(many=True)},
+    )
+    @action(detail=True, methods=["get"], url_path="latest-vitals")
+    def latest_vitals(self, request, pk=None):
+        try:
+            place = self.get_object()
+            rows = latest_vitals_for_place(place.id)
+            return success_response(
+                message="Latest vitals retrieved successfully",
+                data=LatestVitalSerializer(rows, many=True).data,
+            )
+        except Http404:
+            return error_response("Place not found", status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return error_response("Error retrieving latest vitals", str(e), status=500)
+
+
+async def _authenticate(request):
+    """JWT from the Authorization header, or ?token= since EventSource cannot set headers."""
+    authentication = JWTAuthentication()
+    try:
+        raw_token = request.GET.get("token")
+        if not raw_token:
+            header = authentication.get_header(request)
+            # a malformed header, e.g. "Bearer " without a token, raises AuthenticationFailed
+            raw_token = authentication.get_raw_token(header) if header else None
+        if not raw_token:
+            return None
+        validated = authentication.get_validated_token(raw_token)
+        user = await sync_to_async(authentication.get_user)(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+async def place_events(request, place_id):
+    """
+    Server-Sent Events stream of new readings and alert changes of one place
+    (see apps/common/events.py). Serve under ASGI so connections do not hold
+    worker threads.
+    """
+    if request.method != "GET":
+        return JsonResponse({"status": "error", "message": "Method not allowed", "errors": {}}, status=405)
+    if await _authenticate(request) is None:
+        return JsonResponse({"status": "error", "message": "Authentication required", "errors": {}}, status=401)
+    if not await Place.objects.filter(pk=place_id).aexists():
+        return JsonResponse({"status": "error", "message": "Place not found", "errors": {}}, status=404)
+
+    response = StreamingHttpResponse(stream_place_events(place_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx must not buffer the stream
+    return response
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import HeartRateRecord
+from .models import HeartRateArchive, HeartRateRecord, WaveformSegment
 
-admin.site.register(HeartRateRecord)
\ No newline at end of file
+admin.site.register(HeartRateRecord)
+admin.site.register(WaveformSegment)
+admin.site.register(HeartRateArchive)
@@ -0,0 +1,240 @@
+# apps/records/aggregation.py
+"""
+Time-bucketed heart rate aggregates computed by PostgreSQL in one statement.
+
+Readings in [start, end) are grouped by bucket and by patient, place or
+nothing, and count / avg / min / max / percentile_cont(bpm) are computed per
+group. Buckets are either calendar units (date_trunc in the project time
+zone, like the rollups) or fixed widths in seconds counted from `start`
+(width_bucket over the epoch). Rows come back ordered by group and bucket
+through a server-side cursor and are serialised one at a time as NDJSON or
+CSV, so a result of any size is streamed without being held in memory.
+
+Months moved out by the retention job (see archive.py) are no longer in
+the raw table. Day, week and month buckets read them from the daily
+rollups instead: every local day up to the first midnight after the
+archived months is counted whole from its rollup, and the raw table is
+read from there on. Rollups keep no distribution, so percentiles are null
+for buckets that include such days. Finer buckets cannot be answered for
+archived ranges, see archived_before().
+"""
+
+import csv
+import heapq
+import io
+import json
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Aggregate, Avg, Count, F, FloatField, Func, IntegerField, Max, Min, Sum, Value
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from . import archive
+from .models import HeartRateRecord, HeartRateRollup
+from .readings import Epoch
+from .rollups import DAY, RESOLUTIONS, bucket_start
+from apps.patients.models import Patient
+
+UNITS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=28),  # shortest month, for the bucket limit
+}
+PATIENT = "patient"
+PLACE = "place"
+ALL = "all"
+GROUPS = (PATIENT, PLACE, ALL)
+NDJSON = "ndjson"
+CSV = "csv"
+OUTPUTS = {NDJSON: "application/x-ndjson", CSV: "text/csv"}
+ROLLUP_UNITS = ("day", "week", "month")
+
+MAX_BUCKETS = getattr(settings, "HEART_RATE_AGGREGATE_MAX_BUCKETS", 100000)
+MAX_PERCENTILES = 5
+CHUNK_SIZE = 2000
+
+
+class PercentileCont(Aggregate):
+    """percentile_cont(fraction) WITHIN GROUP (ORDER BY expression), PostgreSQL only."""
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        # validated number, formatted as a literal: WITHIN GROUP needs it before the ORDER BY
+        super().__init__(expression, fraction=repr(float(fraction)), **extra)
+
+
+class WidthBucket(Func):
+    function = "WIDTH_BUCKET"
+    output_field = IntegerField()
+
+
+def bucket_count(start, end, unit=None, seconds=None):
+    """Upper bound of buckets per group for a range."""
+    width = timedelta(seconds=seconds) if seconds else UNITS[unit]
+    return math.ceil((end - start) / width)
+
+
+def archived_before(patients=None, place=None):
+    """End of the newest archived month of the selected patients, or None."""
+    if place is None:
+        return archive.archived_before(patients or None)
+    selected = Patient.objects.filter(place_id=place)
+    if patients:
+        selected = selected.filter(id__in=patients)
+    return archive.archived_before(selected.values_list("id", flat=True))
+
+
+def _filter(queryset, patients, place):
+    if patients:
+        queryset = queryset.filter(patient_id__in=patients)
+    if place is not None:
+        queryset = queryset.filter(patient__place_id=place)
+    return queryset
+
+
+def _group_columns(group):
+    """(values() fields, values() expressions, order_by) for the group column."""
+    if group == PATIENT:
+        return [PATIENT], {}, ["patient_id"]
+    if group == PLACE:
+        return [], {PLACE: F("patient__place_id")}, [PLACE]
+    return [], {}, []
+
+
+def aggregate_rows(start, end, unit="hour", seconds=None, patients=None, place=None, group=PATIENT,
+                   percentiles=(50,), archived=None):
+    """
+    Iterator of result dicts: bucket (start time), the group column (patient
+    or place id, absent for "all"), count, avg, min, max and p<q> for each q
+    in percentiles.
+
+    archived is the end of the archived months (see archived_before); for
+    ranges starting before it unit must be one of ROLLUP_UNITS.
+    """
+    if archived is None or archived <= start:
+        rows = _raw_rows(start, end, unit, seconds, patients, place, group, percentiles)
+    else:
+        # first whole local day after the archived (UTC) months, as rebuild_rollups keeps them
+        split = bucket_start(archived - timedelta(microseconds=1), DAY) + RESOLUTIONS[DAY]
+        rows = _rollup_rows(start, min(end, split), unit, patients, place, group, percentiles)
+        if split < end:
+            recent = _raw_rows(split, end, unit, seconds, patients, place, group, percentiles)
+            rows = _merge(rows, recent, group, percentiles)
+
+    for row in rows:
+        row["avg"] = round(row["avg"], 2)
+        for q in percentiles:
+            if row[f"p{q}"] is not None:
+                row[f"p{q}"] = round(row[f"p{q}"], 2)
+        yield row
+
+
+def _raw_rows(start, end, unit, seconds, patients, place, group, percentiles):
+    records = _filter(HeartRateRecord.objects.filter(recorded_at__gte=start, recorded_at__lt=end), patients, place)
+
+    if seconds:
+        low = start.timestamp()
+        count = bucket_count(start, end, seconds=seconds)
+        bucket = WidthBucket(Epoch("recorded_at"), Value(low), Value(low + count * seconds), Value(count))
+    else:
+        bucket = Trunc("recorded_at", unit, tzinfo=timezone.get_current_timezone())
+
+    fields, columns, order = _group_columns(group)
+    aggregates = {
+        "count": Count("id"),
+        "avg": Avg("bpm"),
+        "min": Min("bpm"),
+        "max": Max("bpm"),
+        **{f"p{q}": PercentileCont("bpm", q / 100) for q in percentiles},
+    }
+    rows = (
+        records.values(*fields, bucket=bucket, **columns)
+        .annotate(**aggregates)
+        .order_by(*order, "bucket")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for row in rows:
+        if seconds:
+            # width_bucket numbers buckets from 1
+            row["bucket"] = start + timedelta(seconds=(row["bucket"] - 1) * seconds)
+        yield row
+
+
+def _rollup_rows(start, end, unit, patients, place, group, percentiles):
+    """Rows of whole local days in [start, end) from the daily rollups, without percentiles."""
+    rollups = _filter(
+        HeartRateRollup.objects.filter(resolution=DAY, bucket_start__gte=bucket_start(start, DAY), bucket_start__lt=end),
+        patients, place,
+    )
+    fields, columns, order = _group_columns(group)
+    bucket = Trunc("bucket_start", unit, tzinfo=timezone.get_current_timezone())
+    rows = (
+        rollups.values(*fields, bucket=bucket, **columns)
+        .annotate(readings=Sum("count"), total=Sum("sum_bpm"), low=Min("min_bpm"), high=Max("max_bpm"))
+        .order_by(*order, "bucket")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for row in rows:
+        count = row.pop("readings")
+        row.update(count=count, avg=row.pop("total") / count, min=row.pop("low"), max=row.pop("high"))
+        row.update((f"p{q}", None) for q in percentiles)
+        yield row
+
+
+def _merge(archived, recent, group, percentiles):
+    """Merge two ordered row streams, folding a bucket present in both into one row."""
+    column = group if group in (PATIENT, PLACE) else None
+
+    def key(row):
+        return (row[column] if column else 0, row["bucket"])
+
+    previous = None
+    for row in heapq.merge(archived, recent, key=key):
+        if previous is not None and key(previous) == key(row):
+            count = previous["count"] + row["count"]
+            previous.update(
+                avg=(previous["avg"] * previous["count"] + row["avg"] * row["count"]) / count,
+                count=count,
+                min=min(previous["min"], row["min"]),
+                max=max(previous["max"], row["max"]),
+                **{f"p{q}": None for q in percentiles},
+            )
+            continue
+        if previous is not None:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+
+def fieldnames(group, percentiles):
+    group_columns = [group] if group in (PATIENT, PLACE) else []
+    return ["bucket", *group_columns, "count", "avg", "min", "max", *(f"p{q}" for q in percentiles)]
+
+
+def to_ndjson(rows):
+    for row in rows:
+        yield json.dumps({**row, "bucket": row["bucket"].isoformat()}) + "\n"
+
+
+def to_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        writer.writerow({**row, "bucket": row["bucket"].isoformat()})
+        yield flush()
@@ -0,0 +1,153 @@
+# apps/records/analytics.py
+"""
+Heart rate statistics and variability of one patient over a time window.
+
+The window is loaded once as NumPy arrays (see readings.load_readings) and
+every metric is computed with array operations, no per-reading Python:
+
+* count, mean, std, min, max and percentiles of bpm.
+* baseline: mean of the readings within EXCURSION_BPM of the median,
+  rounded to 5 bpm (accelerations and decelerations do not pull it).
+* variability: short term is the mean absolute change between consecutive
+  readings, long term the mean per-minute bpm range.
+* accelerations / decelerations: runs of readings at least EXCURSION_BPM
+  above / below baseline lasting at least EXCURSION_SECONDS.
+* time_in_range: seconds below, within and above NORMAL_RANGE. Each reading
+  counts until the next one, at most MAX_GAP_SECONDS, so signal loss is not
+  counted as monitored time.
+
+Results are cached per patient and window. Windows are widened to whole
+CACHE_GRANULARITY seconds so repeated dashboard requests share a key. A
+window that reaches into the future is cached for LIVE_TTL, a closed one
+for CACHE_TTL; editing a reading bumps the patient's generation, which
+drops all of its cached windows at once.
+"""
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .readings import load_readings
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+NORMAL_RANGE = tuple(getattr(settings, "HEART_RATE_NORMAL_RANGE", (110, 160)))
+EXCURSION_BPM = getattr(settings, "HEART_RATE_EXCURSION_BPM", 15)
+EXCURSION_SECONDS = getattr(settings, "HEART_RATE_EXCURSION_SECONDS", 15)
+MAX_GAP_SECONDS = getattr(settings, "HEART_RATE_ANALYTICS_MAX_GAP_SECONDS", 60)
+
+CACHE_GRANULARITY = getattr(settings, "HEART_RATE_ANALYTICS_CACHE_GRANULARITY", 60)
+CACHE_TTL = getattr(settings, "HEART_RATE_ANALYTICS_CACHE_TTL", 3600)
+LIVE_TTL = getattr(settings, "HEART_RATE_ANALYTICS_LIVE_TTL", 60)
+KEY = "records:analytics:{}:{}:{}:{}"
+GENERATION_KEY = "records:analytics:gen:{}"
+
+
+def _round(value, digits=2):
+    return round(float(value), digits)
+
+
+def _run_durations(mask, durations):
+    """Total duration of each run of consecutive True values in mask."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    elapsed = np.concatenate(([0.0], np.cumsum(durations)))
+    return elapsed[ends] - elapsed[starts]
+
+
+def compute_metrics(t, bpm):
+    """Metrics of readings at epoch seconds t (ascending) with values bpm."""
+    n = len(t)
+    low, high = NORMAL_RANGE
+    if n == 0:
+        return {
+            "count": 0, "mean": None, "std": None, "min": None, "max": None,
+            "percentiles": {f"p{q}": None for q in PERCENTILES},
+            "baseline": None,
+            "variability": {"short_term": None, "long_term": None},
+            "accelerations": 0, "decelerations": 0,
+            "time_in_range": {"low": low, "high": high, "monitored": 0.0, "below": 0.0, "within": 0.0, "above": 0.0},
+        }
+
+    # each reading lasts until the next one, gaps longer than MAX_GAP_SECONDS are signal loss
+    gaps = np.diff(t)
+    durations = np.minimum(np.append(gaps, 1.0 if n == 1 else np.median(gaps)), MAX_GAP_SECONDS)
+    contiguous = gaps <= MAX_GAP_SECONDS
+
+    median = np.median(bpm)
+    stable = bpm[np.abs(bpm - median) <= EXCURSION_BPM]
+    baseline = int(5 * round(stable.mean() / 5)) if len(stable) else int(5 * round(median / 5))
+
+    minute = ((t - t[0]) // 60).astype(np.int64)
+    minute_starts = np.flatnonzero(np.diff(minute, prepend=-1))
+    minute_ranges = np.maximum.reduceat(bpm, minute_starts) - np.minimum.reduceat(bpm, minute_starts)
+    steps = np.abs(np.diff(bpm))[contiguous]
+
+    accelerations = _run_durations(bpm >= baseline + EXCURSION_BPM, durations)
+    decelerations = _run_durations(bpm <= baseline - EXCURSION_BPM, durations)
+
+    return {
+        "count": n,
+        "mean": _round(bpm.mean()),
+        "std": _round(bpm.std()),
+        "min": int(bpm.min()),
+        "max": int(bpm.max()),
+        "percentiles": {f"p{q}": _round(v) for q, v in zip(PERCENTILES, np.percentile(bpm, PERCENTILES))},
+        "baseline": baseline,
+        "variability": {
+            "short_term": _round(steps.mean()) if len(steps) else None,
+            "long_term": _round(minute_ranges.mean()),
+        },
+        "accelerations": int((accelerations >= EXCURSION_SECONDS).sum()),
+        "decelerations": int((decelerations >= EXCURSION_SECONDS).sum()),
+        "time_in_range": {
+            "low": low,
+            "high": high,
+            "monitored": _round(durations.sum(), 1),
+            "below": _round(durations[bpm < low].sum(), 1),
+            "within": _round(durations[(bpm >= low) & (bpm <= high)].sum(), 1),
+            "above": _round(durations[bpm > high].sum(), 1),
+        },
+    }
+
+
+def align_window(start, end):
+    """Widen [start, end) to whole CACHE_GRANULARITY seconds, as epoch seconds."""
+    return (
+        math.floor(start.timestamp() / CACHE_GRANULARITY) * CACHE_GRANULARITY,
+        math.ceil(end.timestamp() / CACHE_GRANULARITY) * CACHE_GRANULARITY,
+    )
+
+
+def _generation(patient_id):
+    return cache.get(GENERATION_KEY.format(patient_id), 0)
+
+
+def invalidate_patients(patient_ids):
+    """Drop every cached window of these patients."""
+    for patient_id in set(patient_ids):
+        key = GENERATION_KEY.format(patient_id)
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # expired between add and incr
+                cache.add(key, 1, None)
+
+
+def get_analytics(patient_id, start, end):
+    """Metrics for a patient in [start, end) widened by align_window, cached."""
+    start_s, end_s = align_window(start, end)
+    key = KEY.format(patient_id, _generation(patient_id), start_s, end_s)
+    result = cache.get(key)
+    if result is None:
+        window_start = datetime.fromtimestamp(start_s, tz=dt_timezone.utc)
+        window_end = datetime.fromtimestamp(end_s, tz=dt_timezone.utc)
+        t, bpm = load_readings(patient_id, window_start, window_end)
+        result = {"from": window_start, "to": window_end, **compute_metrics(t, bpm)}
+        cache.set(key, result, LIVE_TTL if window_end > timezone.now() else CACHE_TTL)
+    return result
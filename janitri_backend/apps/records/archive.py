@@ -0,0 +1,380 @@
+# apps/records/archive.py
+"""
+Retention of raw heart rate readings.
+
+Readings recorded before the retention cutoff (the first day of the month
+ARCHIVE_AFTER_DAYS ago, UTC) are moved out of HeartRateRecord one
+patient-month at a time:
+
+1. The month's rows are written to one compressed columnar file (NumPy
+   .npz, one array per column) in the "heart_rate_archive" storage. If the
+   month was archived before, e.g. a late import added readings to it, the
+   old file is merged in so a month always has exactly one file.
+2. The file is read back and checked before its HeartRateArchive row is
+   saved; raw rows are only deleted once the archive is known to be good.
+3. The archived rows are deleted in batches of DELETE_BATCH, one short
+   transaction each, through the ORM so Alert.record (and any other FK)
+   gets its on_delete. The post_delete handler skips these rows: their
+   rollups are kept and they are not anyone's latest reading.
+
+A run that stops half way is simply run again: rows still in the table are
+merged into the existing file (by id) and deleted.
+
+readings.load_readings merges archived rows back in, so the chart and
+analytics endpoints answer ranges older than the hot window unchanged. The
+record list of a patient continues into the archive files (MergedRecords for
+page numbers, iter_records for cursors), and a record is read back by id
+with find_record; each archive stores its id range to find the candidates.
+Rollups of archived months are kept; rebuild_rollups does not touch them.
+"""
+
+import hashlib
+import io
+import logging
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import HeartRateArchive, HeartRateRecord
+
+logger = logging.getLogger(__name__)
+
+STORAGE = "heart_rate_archive"
+AFTER_DAYS = getattr(settings, "HEART_RATE_ARCHIVE_AFTER_DAYS", None)
+DELETE_BATCH = getattr(settings, "HEART_RATE_ARCHIVE_DELETE_BATCH", 5000)
+
+_deleting = ContextVar("heart_rate_archive_deleting", default=False)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+# recorded_at is microseconds since the epoch, -1 / "" stand for NULL device, sequence and ingest_key
+COLUMNS = np.dtype([
+    ("id", np.int64),
+    ("recorded_at", np.int64),
+    ("bpm", np.int64),
+    ("device", np.int64),
+    ("sequence", np.int64),
+    ("ingest_key", "U32"),
+])
+
+
+def get_storage():
+    return storages[STORAGE]
+
+
+# ---------------- months ----------------
+def cutoff(days=AFTER_DAYS, now=None):
+    """Readings before this moment are archived: the first day of the month `days` days ago."""
+    now = now or timezone.now()
+    day = (now - timedelta(days=days)).astimezone(dt_timezone.utc)
+    return datetime(day.year, day.month, 1, tzinfo=dt_timezone.utc)
+
+
+def month_bounds(month):
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def pending_months(before):
+    """(patient_id, month) pairs with raw readings recorded before `before`, oldest first."""
+    rows = (
+        HeartRateRecord.objects.filter(recorded_at__lt=before)
+        .annotate(month=TruncMonth("recorded_at", tzinfo=dt_timezone.utc))
+        .values_list("month", "patient_id")
+        .distinct()
+        .order_by("month", "patient_id")
+    )
+    return [(patient_id, month.date() if isinstance(month, datetime) else month) for month, patient_id in rows]
+
+
+# ---------------- files ----------------
+def to_micros(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def dumps(rows):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **{name: rows[name] for name in COLUMNS.names})
+    return buffer.getvalue()
+
+
+def loads(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as columns:
+        count = len(columns["id"])
+        rows = np.empty(count, dtype=COLUMNS)
+        for name in COLUMNS.names:
+            rows[name] = columns[name]
+    return rows
+
+
+def read_file(archive):
+    with get_storage().open(archive.path, "rb") as f:
+        return loads(f.read())
+
+
+def _fetch_rows(patient_id, start, end):
+    rows = (
+        HeartRateRecord.objects.filter(patient_id=patient_id, recorded_at__gte=start, recorded_at__lt=end)
+        .values_list("id", "recorded_at", "bpm", "device_id", "sequence", "ingest_key")
+        .iterator(chunk_size=DELETE_BATCH)
+    )
+    return np.fromiter(
+        (
+            (pk, to_micros(recorded_at), bpm, -1 if device is None else device,
+             -1 if sequence is None else sequence, ingest_key or "")
+            for pk, recorded_at, bpm, device, sequence, ingest_key in rows
+        ),
+        dtype=COLUMNS,
+    )
+
+
+def _merge(*parts):
+    """Rows of all parts sorted by (recorded_at, id), each id once."""
+    rows = np.concatenate(parts)
+    rows = rows[np.unique(rows["id"], return_index=True)[1]]
+    return rows[np.lexsort((rows["id"], rows["recorded_at"]))]
+
+
+# ---------------- archiving ----------------
+def archive_month(patient_id, month, batch_size=DELETE_BATCH):
+    """Archive and delete one patient-month of raw readings. Returns (archived, deleted)."""
+    start, end = month_bounds(month)
+    rows = _fetch_rows(patient_id, start, end)
+    if not len(rows):
+        return 0, 0
+
+    ids = rows["id"].tolist()
+    existing = HeartRateArchive.objects.filter(patient_id=patient_id, month=start.date()).first()
+    rows = _merge(read_file(existing), rows) if existing is not None else _merge(rows)
+
+    data = dumps(rows)
+    checksum = hashlib.sha256(data).hexdigest()
+    storage = get_storage()
+    path = storage.save(f"heart_rate/{patient_id}/{start:%Y-%m}-{checksum[:12]}.npz", ContentFile(data))
+    with storage.open(path, "rb") as f:
+        stored = f.read()
+    if hashlib.sha256(stored).hexdigest() != checksum or len(loads(stored)) != len(rows):
+        storage.delete(path)
+        raise RuntimeError(f"Archive {path} did not read back intact, no readings were deleted.")
+
+    HeartRateArchive.objects.update_or_create(
+        patient_id=patient_id,
+        month=start.date(),
+        defaults={
+            "path": path,
+            "count": len(rows),
+            "start_at": from_micros(rows["recorded_at"][0]),
+            "end_at": from_micros(rows["recorded_at"][-1]),
+            "first_id": int(rows["id"].min()),
+            "last_id": int(rows["id"].max()),
+            "size": len(data),
+            "checksum": checksum,
+        },
+    )
+    if existing is not None and existing.path != path:
+        storage.delete(existing.path)
+
+    deleted = delete_records(ids, batch_size)
+    logger.info("Archived %s readings of patient %s for %s to %s", len(rows), patient_id, f"{start:%Y-%m}", path)
+    return len(rows), deleted
+
+
+def deleting():
+    """True while delete_records runs, post_delete handlers use it to skip archived readings."""
+    return _deleting.get()
+
+
+def delete_records(ids, batch_size=DELETE_BATCH):
+    """Delete archived readings by id, batch_size per transaction."""
+    deleted = 0
+    token = _deleting.set(True)
+    try:
+        for first in range(0, len(ids), batch_size):
+            batch = ids[first:first + batch_size]
+            with transaction.atomic():
+                _, per_model = HeartRateRecord.objects.filter(id__in=batch).delete()
+            deleted += per_model.get(HeartRateRecord._meta.label, 0)
+    finally:
+        _deleting.reset(token)
+    return deleted
+
+
+def archive_records(before=None, batch_size=DELETE_BATCH, progress=None):
+    """
+    Archive every patient-month recorded before `before` (default: cutoff()).
+    progress(patient_id, month, archived, deleted) is called after each month.
+    """
+    if before is None:
+        if AFTER_DAYS is None:
+            raise ValueError("HEART_RATE_ARCHIVE_AFTER_DAYS is not set.")
+        before = cutoff()
+    stats = {"months": 0, "archived": 0, "deleted": 0}
+    for patient_id, month in pending_months(before):
+        archived, deleted = archive_month(patient_id, month, batch_size)
+        stats["months"] += 1
+        stats["archived"] += archived
+        stats["deleted"] += deleted
+        if progress:
+            progress(patient_id, month, archived, deleted)
+    return stats
+
+
+# ---------------- reading ----------------
+def load_archived(patient_id, start, end):
+    """Archived rows (COLUMNS) of a patient in [start, end), oldest first."""
+    archives = HeartRateArchive.objects.filter(patient_id=patient_id, start_at__lt=end, end_at__gte=start).order_by("month")
+    parts = []
+    lo, hi = to_micros(start), to_micros(end)
+    for archive in archives:
+        rows = read_file(archive)
+        times = rows["recorded_at"]
+        parts.append(rows[np.searchsorted(times, lo, "left"):np.searchsorted(times, hi, "left")])
+    return np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS)
+
+
+def to_records(rows, patient_id):
+    """Unsaved HeartRateRecord instances of archived rows, for serializers."""
+    return [
+        HeartRateRecord(
+            id=int(row["id"]),
+            patient_id=patient_id,
+            bpm=int(row["bpm"]),
+            recorded_at=from_micros(row["recorded_at"]),
+            device_id=None if row["device"] == -1 else int(row["device"]),
+            sequence=None if row["sequence"] == -1 else int(row["sequence"]),
+            ingest_key=str(row["ingest_key"]) or None,
+        )
+        for row in rows
+    ]
+
+
+def iter_records(patient_id, descending=True, after=None):
+    """
+    Archived readings of a patient as HeartRateRecord instances ordered by
+    (recorded_at, id), newest first if descending. `after` is a
+    (recorded_at, id) key to continue from, exclusive. Month files are only
+    read when the iteration reaches them.
+    """
+    archives = HeartRateArchive.objects.filter(patient_id=patient_id)
+    if after is not None:
+        archives = archives.filter(**{"start_at__lte" if descending else "end_at__gte": after[0]})
+    for month in archives.order_by("-month" if descending else "month"):
+        rows = read_file(month)
+        if after is not None:
+            time, pk = to_micros(after[0]), after[1]
+            if descending:
+                keep = (rows["recorded_at"] < time) | ((rows["recorded_at"] == time) & (rows["id"] < pk))
+            else:
+                keep = (rows["recorded_at"] > time) | ((rows["recorded_at"] == time) & (rows["id"] > pk))
+            rows = rows[keep]
+        yield from to_records(rows[::-1] if descending else rows, patient_id)
+
+
+class MergedRecords:
+    """
+    A patient's records ordered by (recorded_at, id), the table's rows
+    followed (newest first) or preceded (oldest first) by the archived ones.
+    It can be counted and sliced, so Django's Paginator pages it like a
+    queryset. Readings before `boundary` (archived_before) are read one month
+    at a time: the month's archive file plus any rows still in the table for
+    it, e.g. late imports waiting for the next archive run.
+    """
+
+    def __init__(self, queryset, patient_id, boundary, descending=True):
+        self.descending = descending
+        keys = ("-recorded_at", "-id") if descending else ("recorded_at", "id")
+        self.recent = queryset.filter(recorded_at__gte=boundary).order_by(*keys)
+        self._recent_count = None
+
+        late = defaultdict(list)
+        for record in queryset.filter(recorded_at__lt=boundary).order_by(*keys):
+            late[month_of(record.recorded_at)].append(record)
+        archives = {month.month: month for month in HeartRateArchive.objects.filter(patient_id=patient_id)}
+        # (size, archive or None, table rows) per month, in list order
+        self.months = [
+            ((archives[month].count if month in archives else 0) + len(late[month]), archives.get(month), late[month])
+            for month in sorted(set(late) | set(archives), reverse=descending)
+        ]
+
+    def count(self):
+        if self._recent_count is None:
+            self._recent_count = self.recent.count()
+        return self._recent_count + sum(size for size, _, _ in self.months)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:self.count()])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        count = self.count()  # also fills _recent_count
+        start = index.start or 0
+        stop = count if index.stop is None else index.stop
+        recent = [(self._recent_count, lambda lo, hi: list(self.recent[lo:hi]))]
+        months = [
+            (size, lambda lo, hi, month=month, late=late: self._month_records(month, late)[lo:hi])
+            for size, month, late in self.months
+        ]
+
+        records, offset = [], 0
+        for size, fetch in (recent + months if self.descending else months + recent):
+            lo, hi = max(start - offset, 0), min(stop - offset, size)
+            if lo < hi:
+                records.extend(fetch(lo, hi))
+            offset += size
+            if offset >= stop:
+                break
+        return records
+
+    def _month_records(self, month, late):
+        if month is None:
+            return late
+        ids = {record.id for record in late}
+        # a month being archived can briefly be in both places
+        records = late + [record for record in to_records(read_file(month), month.patient_id) if record.id not in ids]
+        records.sort(key=lambda record: (record.recorded_at, record.id), reverse=self.descending)
+        return records
+
+
+def month_of(value):
+    return value.astimezone(dt_timezone.utc).date().replace(day=1)
+
+
+def find_record(record_id, patient_id):
+    """The archived reading with this id of a patient, or None."""
+    archives = HeartRateArchive.objects.filter(patient_id=patient_id, first_id__lte=record_id, last_id__gte=record_id)
+    for month in archives:
+        rows = read_file(month)
+        rows = rows[rows["id"] == record_id]
+        if len(rows):
+            return to_records(rows, patient_id)[0]
+    return None
+
+
+def may_hold(record_id):
+    """Whether some archive's id range covers record_id, the reading may be archived."""
+    return HeartRateArchive.objects.filter(first_id__lte=record_id, last_id__gte=record_id).exists()
+
+
+def archived_before(patient_ids=None):
+    """End of the newest archived month of these patients (all if None), or None."""
+    archives = HeartRateArchive.objects.all()
+    if patient_ids is not None:
+        archives = archives.filter(patient_id__in=patient_ids)
+    newest = archives.order_by("-month").values_list("month", flat=True).first()
+    return month_bounds(newest)[1] if newest else None
@@ -0,0 +1,289 @@
+# apps/records/backfill.py
+"""
+Import of historical heart rate readings from hospital exports.
+
+Files are CSV (header: patient, bpm, recorded_at[, device, sequence]) or
+NDJSON objects with the same keys, optionally gzipped, and are streamed
+row by row. External patient and device identifiers are resolved through
+lookup tables loaded into memory once, so parsing does no queries.
+
+On PostgreSQL each chunk is sent with COPY FROM STDIN into a temporary
+staging table and moved into HeartRateRecord with INSERT ... SELECT ... ON
+CONFLICT DO NOTHING, so an interrupted import can simply be run again:
+readings with a device and sequence are skipped if already stored. Other
+databases insert chunks through services.insert_records.
+
+The per-reading hooks do not run. Rollups of the imported days are rebuilt
+once at the end, alert evaluation is skipped or deferred to a Celery task
+that records alerts without notifying anyone. Those alerts are stored
+already resolved and kept apart from the open alerts and rule windows of
+live readings.
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+import time
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .analytics import invalidate_patients
+from .models import HeartRateRecord
+from .rollups import rebuild_rollups
+from .services import insert_records, parse_recorded_at
+from .vitals import invalidate_place_vitals
+from apps.alerts.services import create_alerts
+from apps.alerts.windows import LocalWindowStore
+from apps.devices.models import Device
+from apps.patients.models import Patient
+
+logger = logging.getLogger(__name__)
+
+CSV = "csv"
+NDJSON = "ndjson"
+FORMATS = (CSV, NDJSON)
+SKIP = "skip"
+DEFER = "defer"
+ALERT_MODES = (SKIP, DEFER)
+
+CHUNK_SIZE = getattr(settings, "HEART_RATE_BACKFILL_CHUNK_SIZE", 50000)
+ALERT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+FIELDS = ("patient", "bpm", "recorded_at", "device", "sequence")
+STAGE_TABLE = "heart_rate_backfill_stage"
+
+
+# ---------------- reading ----------------
+def detect_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    return NDJSON if name.endswith((".ndjson", ".jsonl")) else CSV
+
+
+def read_rows(path, fmt=None):
+    """
+    Yield (line number, row dict) from a CSV or NDJSON file without loading
+    it. NDJSON lines that are not JSON objects yield an empty row.
+    """
+    fmt = fmt or detect_format(path)
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="", encoding="utf-8") as f:
+        if fmt == CSV:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else {}
+
+
+class Lookup:
+    """In-memory maps from external patient / device identifiers to ids."""
+
+    def __init__(self, patient_map=None):
+        if patient_map is None:
+            self.patients = {str(pk): pk for pk in Patient.objects.values_list("id", flat=True)}
+        else:
+            existing = set(Patient.objects.filter(id__in=set(patient_map.values())).values_list("id", flat=True))
+            missing = sorted({str(key) for key, pk in patient_map.items() if pk not in existing})
+            if missing:
+                raise ValueError(f"Patient map points at unknown patients for: {', '.join(missing[:10])}")
+            self.patients = dict(patient_map)
+        self.devices = dict(Device.objects.values_list("device_id", "id"))
+
+    def patient(self, value):
+        try:
+            return self.patients[str(value).strip()]
+        except KeyError:
+            raise ValueError(f"Unknown patient {value!r}.")
+
+    def device(self, value):
+        try:
+            return self.devices[str(value).strip()]
+        except KeyError:
+            raise ValueError(f"Unknown device {value!r}.")
+
+
+def load_patient_map(path):
+    """{external id: patient id} from a CSV file with columns external_id, patient_id."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["external_id"].strip(): int(row["patient_id"]) for row in csv.DictReader(f)}
+
+
+def _blank(value):
+    return value is None or value == ""
+
+
+def parse_row(row, lookup, tz=dt_timezone.utc):
+    """(patient_id, bpm, recorded_at, device_id, sequence) of one row, or raise ValueError."""
+    try:
+        bpm = int(row["bpm"])
+        recorded_at = row["recorded_at"]
+        patient = row["patient"]
+    except KeyError as e:
+        raise ValueError(f"Missing {e.args[0]}.")
+    except (TypeError, ValueError):
+        raise ValueError("bpm must be an integer.")
+    if not 0 <= bpm <= 2147483647:
+        raise ValueError("bpm must be a non-negative integer.")
+    if isinstance(recorded_at, str):
+        try:
+            recorded_at = float(recorded_at)  # epoch seconds in a CSV column
+        except ValueError:
+            pass
+    recorded_at = parse_recorded_at(recorded_at, tz)
+
+    device = None if _blank(row.get("device")) else lookup.device(row["device"])
+    sequence = None
+    if not _blank(row.get("sequence")):
+        try:
+            sequence = int(row["sequence"])
+        except (TypeError, ValueError):
+            raise ValueError("sequence must be an integer.")
+        if sequence < 0 or device is None:
+            raise ValueError("sequence must be a non-negative integer and requires a device.")
+    return lookup.patient(patient), bpm, recorded_at, device, sequence
+
+
+# ---------------- writing ----------------
+class CopyWriter:
+    """PostgreSQL: COPY each chunk into a staging table, then INSERT ... ON CONFLICT DO NOTHING."""
+
+    def __init__(self):
+        quote = connection.ops.quote_name
+        columns = ", ".join(quote(HeartRateRecord._meta.get_field(name).column) for name in FIELDS)
+        with connection.cursor() as cursor:
+            # same column names and types as the target table
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGE_TABLE} AS "
+                f"SELECT {columns} FROM {quote(HeartRateRecord._meta.db_table)} WITH NO DATA"
+            )
+        self.copy_sql = f"COPY {STAGE_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        self.insert_sql = (
+            f"INSERT INTO {quote(HeartRateRecord._meta.db_table)} ({columns}) "
+            f"SELECT {columns} FROM {STAGE_TABLE} ON CONFLICT DO NOTHING"
+        )
+
+    def write(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for patient_id, bpm, recorded_at, device_id, sequence in rows:
+            # unquoted empty fields are NULL in COPY's csv format
+            writer.writerow((patient_id, bpm, recorded_at.isoformat(), device_id or "", "" if sequence is None else sequence))
+        buffer.seek(0)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {STAGE_TABLE}")
+            cursor.cursor.copy_expert(self.copy_sql, buffer)
+            cursor.execute(self.insert_sql)
+            return cursor.rowcount
+
+
+class InsertWriter:
+    """Other databases: multi-row INSERTs through insert_records."""
+
+    def write(self, rows):
+        records = [
+            HeartRateRecord(patient_id=p, bpm=b, recorded_at=r, device_id=d, sequence=s) for p, b, r, d, s in rows
+        ]
+        return len(insert_records(records))
+
+
+def get_writer():
+    return CopyWriter() if connection.vendor == "postgresql" else InsertWriter()
+
+
+# ---------------- import ----------------
+def run(paths, lookup, fmt=None, chunk_size=CHUNK_SIZE, alerts=SKIP, rollups=True, tz=dt_timezone.utc,
+        progress=None):
+    """
+    Import files in chunks of chunk_size readings. progress(stats) is called
+    after every chunk. Returns the stats dict.
+    """
+    writer = get_writer()
+    stats = {"rows": 0, "inserted": 0, "duplicates": 0, "rejected": 0, "seconds": 0.0, "errors": []}
+    patient_ids = set()
+    span = [None, None]
+    started = time.monotonic()
+
+    def flush(chunk):
+        inserted = writer.write(chunk)
+        stats["inserted"] += inserted
+        stats["duplicates"] += len(chunk) - inserted
+        stats["seconds"] = time.monotonic() - started
+        if progress:
+            progress(stats)
+        chunk.clear()
+
+    chunk = []
+    for path in paths:
+        for line_no, row in read_rows(path, fmt):
+            stats["rows"] += 1
+            try:
+                reading = parse_row(row, lookup, tz)
+            except (ValueError, TypeError, AttributeError, OverflowError) as e:
+                stats["rejected"] += 1
+                if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+                    stats["errors"].append({"file": path, "line": line_no, "error": str(e)})
+                continue
+            chunk.append(reading)
+            patient_ids.add(reading[0])
+            recorded_at = reading[2]
+            if span[0] is None or recorded_at < span[0]:
+                span[0] = recorded_at
+            if span[1] is None or recorded_at > span[1]:
+                span[1] = recorded_at
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+    if chunk:
+        flush(chunk)
+    stats["seconds"] = time.monotonic() - started
+
+    if stats["inserted"]:
+        _after_import(sorted(patient_ids), span[0], span[1], alerts, rollups)
+    return stats
+
+
+def _after_import(patient_ids, start, end, alerts, rollups):
+    from .tasks import evaluate_backfill_alerts
+
+    if rollups:
+        rebuild_rollups(start, end, patient_ids)
+    invalidate_patients(patient_ids)
+    for place_id in set(Patient.objects.filter(id__in=patient_ids).values_list("place_id", flat=True)):
+        invalidate_place_vitals(place_id)
+    if alerts == DEFER:
+        evaluate_backfill_alerts.delay(patient_ids, start.isoformat(), end.isoformat())
+
+
+def evaluate_alerts(patient_ids, start, end, chunk_size=ALERT_CHUNK_SIZE):
+    """
+    Run imported readings through the alert rules, oldest first per patient,
+    recording resolved alerts without notifications. Windowed rules start
+    from an empty state of their own. Returns the number of new alerts.
+    """
+    created = 0
+    store = LocalWindowStore()
+    for patient_id in patient_ids:
+        records = HeartRateRecord.objects.filter(patient_id=patient_id, recorded_at__gte=start, recorded_at__lte=end)
+        after = None
+        while True:
+            page = records
+            if after is not None:
+                page = page.filter(Q(recorded_at__gt=after[0]) | Q(recorded_at=after[0], id__gt=after[1]))
+            batch = list(page.order_by("recorded_at", "id")[:chunk_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                created += len(create_alerts(batch, history=True, store=store))
+            after = (batch[-1].recorded_at, batch[-1].id)
+    return created
@@ -0,0 +1,85 @@
+# apps/records/downsampling.py
+"""
+Shape-preserving downsampling of heart rate traces for charts.
+
+Both methods return indexes into the source arrays, so every plotted point
+is a real reading and spikes are never averaged away:
+
+* lttb: Largest-Triangle-Three-Buckets. Splits the series into equal-count
+  buckets and keeps, per bucket, the point forming the largest triangle
+  with the point kept before it and the mean of the next bucket. One NumPy
+  pass per bucket over that bucket's points.
+* minmax: splits the time range into equal-width buckets and keeps the
+  lowest and highest reading of each. Fully vectorised; empty buckets
+  (gaps in the trace) produce no points.
+"""
+
+import numpy as np
+from django.conf import settings
+
+LTTB = "lttb"
+MINMAX = "minmax"
+METHODS = (LTTB, MINMAX)
+CHART_MAX_POINTS = getattr(settings, "HEART_RATE_CHART_MAX_POINTS", 5000)
+
+
+def lttb(t, y, threshold):
+    """Indexes of at most `threshold` points chosen by LTTB."""
+    n = len(t)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:threshold], dtype=np.int64)
+
+    t = t - t[0]  # keep the triangle areas small enough for float precision
+    # the first and last points are always kept, the rest is split in threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    cum_t = np.concatenate(([0.0], np.cumsum(t)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = edges[1:] - edges[:-1]
+    mean_t = (cum_t[edges[1:]] - cum_t[edges[:-1]]) / sizes
+    mean_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / sizes
+    # the bucket after the last one is the final point
+    next_t = np.append(mean_t[1:], t[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ta, ya = t[a], y[a]
+        area = np.abs((ta - next_t[i]) * (y[lo:hi] - ya) - (ta - t[lo:hi]) * (next_y[i] - ya))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(t, y, threshold):
+    """Indexes of the min and max reading of threshold // 2 equal-time buckets, in time order."""
+    n = len(t)
+    if threshold >= n:
+        return np.arange(n)
+    buckets = max(threshold // 2, 1)
+    span = t[-1] - t[0]
+    if span <= 0:
+        return np.array([int(y.argmin()), int(y.argmax())]) if n else np.arange(0)
+    bucket = np.minimum(((t - t[0]) / span * buckets).astype(np.int64), buckets - 1)
+
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    lows = np.minimum.reduceat(y, starts)
+    highs = np.maximum.reduceat(y, starts)
+    group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+    # first index per bucket where the bucket's min / max is reached
+    low_at = np.flatnonzero(y == lows[group])
+    high_at = np.flatnonzero(y == highs[group])
+    low_at = low_at[np.unique(group[low_at], return_index=True)[1]]
+    high_at = high_at[np.unique(group[high_at], return_index=True)[1]]
+    return np.unique(np.concatenate((low_at, high_at)))
+
+
+def downsample(t, y, threshold, method=LTTB):
+    if method == MINMAX:
+        return minmax(t, y, threshold)
+    return lttb(t, y, threshold)
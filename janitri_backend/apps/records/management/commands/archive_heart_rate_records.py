@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.records import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move raw heart rate records older than the retention window into per patient-month "
+        "archive files and delete them from the table in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int, default=archive.AFTER_DAYS,
+            help="Archive months that ended at least this many days ago (default: HEART_RATE_ARCHIVE_AFTER_DAYS).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=archive.DELETE_BATCH,
+            help="Rows deleted per transaction.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only list the patient-months that would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        days = options["older_than_days"]
+        if days is None or days < 0:
+            raise CommandError("Pass --older-than-days or set HEART_RATE_ARCHIVE_AFTER_DAYS.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        before = archive.cutoff(days)
+        if options["dry_run"]:
+            months = archive.pending_months(before)
+            for patient_id, month in months:
+                self.stdout.write(f"patient {patient_id} {month:%Y-%m}")
+            self.stdout.write(f"{len(months)} patient-month(s) recorded before {before:%Y-%m-%d} would be archived")
+            return
+
+        def progress(patient_id, month, archived, deleted):
+            self.stdout.write(f"patient {patient_id} {month:%Y-%m}: {archived} archived, {deleted} deleted")
+
+        stats = archive.archive_records(before, options["batch_size"], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {stats['months']} patient-month(s): {stats['archived']} readings in archive files, "
+            f"{stats['deleted']} rows deleted"
+        ))
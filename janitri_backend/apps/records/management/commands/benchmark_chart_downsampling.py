@@ -0,0 +1,38 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.records.downsampling import METHODS, downsample
+
+
+class Command(BaseCommand):
+    help = "Measure chart downsampling speed on a synthetic heart rate trace (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source-points", type=int, default=1_000_000)
+        parser.add_argument("--points", type=int, default=1000, help="Points kept per chart.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        n = options["source_points"]
+        # one reading per second or so, slow baseline drift, noise and a few short spikes
+        t = 1.7e9 + np.cumsum(rng.uniform(0.5, 1.5, n))
+        bpm = 140 + 10 * np.sin(np.arange(n) / 5000) + rng.normal(0, 3, n)
+        spikes = rng.choice(n, size=20, replace=False)
+        bpm[spikes] = rng.choice([50.0, 210.0], size=20)
+
+        for method in METHODS:
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                keep = downsample(t, bpm, options["points"], method)
+                timings.append(time.perf_counter() - started)
+            kept_spikes = np.isin(spikes, keep).sum()
+            best = min(timings)
+            self.stdout.write(
+                f"{method}: {n} -> {len(keep)} points in {best * 1000:.1f} ms "
+                f"({n / best:,.0f} points/s), {kept_spikes}/{len(spikes)} spikes kept"
+            )
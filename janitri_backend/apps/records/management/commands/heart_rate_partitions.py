@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.records import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage PostgreSQL range partitions of heart rate records: convert the table, "
+        "create upcoming partitions and detach or drop expired ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert", action="store_true",
+            help="Convert the existing table to a partitioned table (one-off, locks the table).",
+        )
+        parser.add_argument(
+            "--interval", choices=partitioning.INTERVALS, default=partitioning.INTERVAL,
+            help="Partition width (default: HEART_RATE_PARTITION_INTERVAL).",
+        )
+        parser.add_argument(
+            "--ahead", type=int, default=partitioning.PREMAKE,
+            help="Number of future partitions to create.",
+        )
+        parser.add_argument(
+            "--retain", type=int, default=partitioning.RETENTION,
+            help="Keep this many past partitions; older ones are detached.",
+        )
+        parser.add_argument(
+            "--drop", action="store_true",
+            help="Drop expired partitions instead of only detaching them.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Heart rate partitioning requires PostgreSQL.")
+
+        interval = options["interval"]
+        if options["convert"]:
+            if partitioning.convert_to_partitioned(interval=interval):
+                self.stdout.write(self.style.SUCCESS(f"Converted {partitioning.TABLE} to {interval} partitions"))
+            else:
+                self.stdout.write(f"{partitioning.TABLE} is already partitioned")
+
+        if not partitioning.is_partitioned():
+            raise CommandError(f"{partitioning.TABLE} is not partitioned, run with --convert first.")
+
+        for name in partitioning.ensure_partitions(ahead=options["ahead"], interval=interval):
+            self.stdout.write(f"Created partition {name}")
+
+        for name in partitioning.expire_partitions(
+            retain=options["retain"], drop=options["drop"], interval=interval
+        ):
+            self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} partition {name}")
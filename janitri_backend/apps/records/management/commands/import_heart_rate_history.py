@@ -0,0 +1,74 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.records import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Import historical heart rate readings from CSV / NDJSON exports (optionally .gz). "
+        "Rows need patient, bpm and recorded_at, and may carry device and sequence. "
+        "Uses COPY on PostgreSQL; rows with a device and sequence are skipped when already imported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Files to import, in order.")
+        parser.add_argument("--format", choices=backfill.FORMATS, help="Default: from the file extension.")
+        parser.add_argument(
+            "--patient-map",
+            help="CSV with columns external_id, patient_id. Without it the patient column holds patient ids.",
+        )
+        parser.add_argument("--timezone", default="UTC", help="Zone of timestamps without an offset.")
+        parser.add_argument("--chunk-size", type=int, default=backfill.CHUNK_SIZE)
+        parser.add_argument(
+            "--alerts",
+            choices=backfill.ALERT_MODES,
+            default=backfill.SKIP,
+            help="skip: no alert evaluation. defer: evaluate in a Celery task afterwards, without notifications.",
+        )
+        parser.add_argument("--skip-rollups", action="store_true", help="Do not rebuild rollups of the imported days.")
+
+    def handle(self, *args, **options):
+        try:
+            tz = ZoneInfo(options["timezone"])
+        except (ZoneInfoNotFoundError, ValueError):
+            raise CommandError(f"Unknown time zone: {options['timezone']}")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        try:
+            patient_map = backfill.load_patient_map(options["patient_map"]) if options["patient_map"] else None
+            lookup = backfill.Lookup(patient_map)
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Invalid patient map: {e}")
+
+        try:
+            stats = backfill.run(
+                options["paths"],
+                lookup,
+                fmt=options["format"],
+                chunk_size=options["chunk_size"],
+                alerts=options["alerts"],
+                rollups=not options["skip_rollups"],
+                tz=tz,
+                progress=self._progress,
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in stats["errors"]:
+            self.stderr.write(f"{error['file']}:{error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['inserted']} reading(s) from {stats['rows']} row(s) in {stats['seconds']:.1f}s "
+            f"({self._rate(stats)} rows/s), {stats['duplicates']} duplicate(s), {stats['rejected']} rejected"
+        ))
+
+    def _rate(self, stats):
+        return f"{stats['rows'] / stats['seconds']:,.0f}" if stats["seconds"] else "-"
+
+    def _progress(self, stats):
+        self.stdout.write(
+            f"{stats['rows']} rows, {stats['inserted']} inserted, {stats['duplicates']} duplicate(s), "
+            f"{stats['rejected']} rejected, {self._rate(stats)} rows/s"
+        )
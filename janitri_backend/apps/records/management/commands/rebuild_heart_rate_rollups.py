@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from apps.records.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute 1m/1h/1d heart rate rollups from raw records for a time range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", required=True, help="Range start (ISO 8601).")
+        parser.add_argument("--to", dest="end", help="Range end (ISO 8601), defaults to now.")
+        parser.add_argument("--patient", type=int, action="append", help="Limit to patient id (repeatable).")
+
+    def handle(self, *args, **options):
+        start = self._parse(options["start"])
+        end = self._parse(options["end"]) if options["end"] else timezone.now()
+        if start > end:
+            raise CommandError("--from must be earlier than --to")
+
+        created = rebuild_rollups(start, end, options["patient"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} rollup bucket(s)"))
+
+    def _parse(self, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"Invalid datetime: {value}")
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_alter_patient_created_by'),
+        ('records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='heartraterecord',
+            index=models.Index(fields=['patient', 'recorded_at'], name='records_hr_patient_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='heartraterecord',
+            index=models.Index(fields=['recorded_at'], name='records_hr_recorded_at_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_alter_patient_created_by'),
+        ('records', '0002_heartraterecord_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeartRateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('min_bpm', models.PositiveIntegerField()),
+                ('max_bpm', models.PositiveIntegerField()),
+                ('sum_bpm', models.BigIntegerField()),
+                ('sum_sq_bpm', models.BigIntegerField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heart_rollups', to='patients.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'resolution', 'bucket_start'), name='records_rollup_unique_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_keyset_indexes'),
+        ('records', '0003_heartraterollup'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='heartraterecord',
+            name='records_hr_recorded_at_idx',
+        ),
+        migrations.AddIndex(
+            model_name='heartraterecord',
+            index=models.Index(fields=['recorded_at', 'id'], name='records_hr_time_id_idx'),
+        ),
+    ]
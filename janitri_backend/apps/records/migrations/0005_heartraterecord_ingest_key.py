@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_keyset_indexes'),
+        ('records', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='heartraterecord',
+            name='ingest_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AlterField(
+            model_name='heartraterecord',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='heartraterecord',
+            constraint=models.UniqueConstraint(fields=('ingest_key', 'recorded_at'), name='records_hr_ingest_key_uniq'),
+        ),
+    ]
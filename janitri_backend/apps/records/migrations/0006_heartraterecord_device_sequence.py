@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_device_api_key_hash'),
+        ('patients', '0004_keyset_indexes'),
+        ('records', '0005_heartraterecord_ingest_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='heartraterecord',
+            name='device',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='heart_records', to='devices.device'),
+        ),
+        migrations.AddField(
+            model_name='heartraterecord',
+            name='sequence',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='heartraterecord',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Measurement time, sent by the client or arrival time'),
+        ),
+        migrations.AddConstraint(
+            model_name='heartraterecord',
+            constraint=models.UniqueConstraint(fields=('device', 'sequence', 'recorded_at'), name='records_hr_device_seq_uniq'),
+        ),
+    ]
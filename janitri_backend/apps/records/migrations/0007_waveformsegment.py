@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_keyset_indexes'),
+        ('records', '0006_heartraterecord_device_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaveformSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_at', models.DateTimeField(help_text='Time of the first sample')),
+                ('end_at', models.DateTimeField(help_text='Time just after the last sample')),
+                ('sample_rate', models.FloatField(help_text='Samples per second')),
+                ('sample_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waveform_segments', to='patients.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'start_at'), name='records_waveform_unique_start')],
+            },
+        ),
+    ]
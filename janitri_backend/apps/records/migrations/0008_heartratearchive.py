@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_keyset_indexes'),
+        ('records', '0007_waveformsegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeartRateArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the archived month (UTC)')),
+                ('path', models.CharField(help_text='File name in the heart_rate_archive storage', max_length=255)),
+                ('count', models.PositiveIntegerField()),
+                ('start_at', models.DateTimeField(help_text='Oldest archived reading')),
+                ('end_at', models.DateTimeField(help_text='Newest archived reading')),
+                ('size', models.PositiveBigIntegerField(help_text='File size in bytes')),
+                ('checksum', models.CharField(help_text='SHA-256 of the file', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heart_archives', to='patients.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'month'), name='records_archive_unique_month')],
+            },
+        ),
+    ]
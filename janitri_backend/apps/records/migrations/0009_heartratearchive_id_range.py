@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def fill_id_ranges(apps, schema_editor):
+    """Read the id range of archives written before it was stored."""
+    from apps.records import archive
+
+    HeartRateArchive = apps.get_model("records", "HeartRateArchive")
+    for row in HeartRateArchive.objects.all():
+        ids = archive.read_file(row)["id"]
+        row.first_id, row.last_id = int(ids.min()), int(ids.max())
+        row.save(update_fields=["first_id", "last_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0008_heartratearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='heartratearchive',
+            name='first_id',
+            field=models.BigIntegerField(help_text='Lowest archived record id', null=True),
+        ),
+        migrations.AddField(
+            model_name='heartratearchive',
+            name='last_id',
+            field=models.BigIntegerField(help_text='Highest archived record id', null=True),
+        ),
+        migrations.RunPython(fill_id_ranges, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='heartratearchive',
+            name='first_id',
+            field=models.BigIntegerField(help_text='Lowest archived record id'),
+        ),
+        migrations.AlterField(
+            model_name='heartratearchive',
+            name='last_id',
+            field=models.BigIntegerField(help_text='Highest archived record id'),
+        ),
+    ]
@@ -1,11 +1,113 @@
+import math
 from django.db import models
+from django.utils import timezone
+from utils.constants.choices import ROLLUP_RESOLUTION_CHOICES
 
 # Create your models here.
 
 class HeartRateRecord(models.Model):
     patient = models.ForeignKey("patients.Patient", on_delete=models.CASCADE, related_name="heart_records")
     bpm = models.PositiveIntegerField(help_text="Beats per minute")
-    recorded_at = models.DateTimeField(auto_now_add=True)
+    recorded_at = models.DateTimeField(default=timezone.now, help_text="Measurement time, sent by the client or arrival time")
+    # stream entry id of readings written through the Redis write-behind buffer
+    ingest_key = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    # device and its per-reading sequence number, a retried reading has the same pair and time
+    device = models.ForeignKey(
+        "devices.Device", on_delete=models.SET_NULL, null=True, blank=True, related_name="heart_records"
+    )
+    sequence = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "recorded_at"], name="records_hr_patient_time_idx"),
+            models.Index(fields=["recorded_at", "id"], name="records_hr_time_id_idx"),
+        ]
+        constraints = [
+            # includes recorded_at so the constraint survives range partitioning
+            models.UniqueConstraint(fields=["ingest_key", "recorded_at"], name="records_hr_ingest_key_uniq"),
+            models.UniqueConstraint(fields=["device", "sequence", "recorded_at"], name="records_hr_device_seq_uniq"),
+        ]
 
     def __str__(self):
         return f"{self.patient.name} - {self.bpm} bpm"
+
+
+class WaveformSegment(models.Model):
+    """
+    A fixed-duration block of high-frequency heart rate samples, stored as
+    one delta/varint encoded byte string (see waveform.py) instead of one
+    HeartRateRecord row per sample.
+    """
+    patient = models.ForeignKey("patients.Patient", on_delete=models.CASCADE, related_name="waveform_segments")
+    start_at = models.DateTimeField(help_text="Time of the first sample")
+    end_at = models.DateTimeField(help_text="Time just after the last sample")
+    sample_rate = models.FloatField(help_text="Samples per second")
+    sample_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            # also the index range reads go through
+            models.UniqueConstraint(fields=["patient", "start_at"], name="records_waveform_unique_start"),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} {self.start_at:%Y-%m-%d %H:%M:%S} ({self.sample_count} samples)"
+
+
+class HeartRateArchive(models.Model):
+    """
+    One patient-month of raw readings moved out of HeartRateRecord into a
+    compressed columnar file (see archive.py) by the retention job.
+    """
+    patient = models.ForeignKey("patients.Patient", on_delete=models.CASCADE, related_name="heart_archives")
+    month = models.DateField(help_text="First day of the archived month (UTC)")
+    path = models.CharField(max_length=255, help_text="File name in the heart_rate_archive storage")
+    count = models.PositiveIntegerField()
+    start_at = models.DateTimeField(help_text="Oldest archived reading")
+    end_at = models.DateTimeField(help_text="Newest archived reading")
+    first_id = models.BigIntegerField(help_text="Lowest archived record id")
+    last_id = models.BigIntegerField(help_text="Highest archived record id")
+    size = models.PositiveBigIntegerField(help_text="File size in bytes")
+    checksum = models.CharField(max_length=64, help_text="SHA-256 of the file")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "month"], name="records_archive_unique_month"),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} {self.month:%Y-%m} ({self.count} readings)"
+
+
+class HeartRateRollup(models.Model):
+    """Per-patient heart rate aggregates for one time bucket at one resolution."""
+    patient = models.ForeignKey("patients.Patient", on_delete=models.CASCADE, related_name="heart_rollups")
+    resolution = models.CharField(max_length=2, choices=ROLLUP_RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    min_bpm = models.PositiveIntegerField()
+    max_bpm = models.PositiveIntegerField()
+    sum_bpm = models.BigIntegerField()
+    sum_sq_bpm = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["patient", "resolution", "bucket_start"], name="records_rollup_unique_bucket"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} {self.resolution} {self.bucket_start:%Y-%m-%d %H:%M}"
+
+    @property
+    def mean_bpm(self):
+        return self.sum_bpm / self.count
+
+    @property
+    def std_bpm(self):
+        variance = self.sum_sq_bpm / self.count - self.mean_bpm ** 2
+        return math.sqrt(max(variance, 0.0))
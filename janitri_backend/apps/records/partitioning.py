@@ -0,0 +1,237 @@
+# apps/records/partitioning.py
+"""
+Optional PostgreSQL range partitioning of HeartRateRecord by recorded_at.
+
+Converting the table is a one-off operation (see the `heart_rate_partitions`
+management command). Afterwards the table's primary key is (id, recorded_at),
+ids still come from a sequence, and the ORM keeps working unchanged.
+PostgreSQL cannot reference a partitioned table by `id` alone, so the
+database-level FK from alerts_alert.record_id is dropped; Django still
+enforces Alert.record on the application side.
+"""
+
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import HeartRateRecord
+
+logger = logging.getLogger(__name__)
+
+DAY = "day"
+MONTH = "month"
+INTERVALS = (DAY, MONTH)
+
+ENABLED = getattr(settings, "HEART_RATE_PARTITIONING", False)
+INTERVAL = getattr(settings, "HEART_RATE_PARTITION_INTERVAL", MONTH)
+PREMAKE = getattr(settings, "HEART_RATE_PARTITION_PREMAKE", 3)
+RETENTION = getattr(settings, "HEART_RATE_PARTITION_RETENTION", None)
+
+TABLE = HeartRateRecord._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+SEQUENCE = f"{TABLE}_pid_seq"
+
+_NAME_RE = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})(?:_(\d{{2}}))?$")
+
+
+# ---------------- partition arithmetic ----------------
+def partition_start(value, interval=INTERVAL):
+    """Return the first day of the partition that contains value (a date or datetime)."""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc).date() if value.tzinfo else value.date()
+    if interval == DAY:
+        return value
+    return value.replace(day=1)
+
+
+def next_partition_start(start, interval=INTERVAL):
+    if interval == DAY:
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def previous_partition_start(start, interval=INTERVAL):
+    if interval == DAY:
+        return start - timedelta(days=1)
+    return (start - timedelta(days=1)).replace(day=1)
+
+
+def partition_ranges(start, end, interval=INTERVAL):
+    """List (lower, upper) bounds of every partition overlapping [start, end]."""
+    lower = partition_start(start, interval)
+    end = partition_start(end, interval)
+    ranges = []
+    while lower <= end:
+        upper = next_partition_start(lower, interval)
+        ranges.append((lower, upper))
+        lower = upper
+    return ranges
+
+
+def partition_name(start, interval=INTERVAL):
+    if interval == DAY:
+        return f"{TABLE}_p{start:%Y_%m_%d}"
+    return f"{TABLE}_p{start:%Y_%m}"
+
+
+def parse_partition_name(name):
+    """Return (lower, upper) for a partition created by this module, else None."""
+    match = _NAME_RE.match(name)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    if day:
+        lower = date(int(year), int(month), int(day))
+        return lower, next_partition_start(lower, DAY)
+    lower = date(int(year), int(month), 1)
+    return lower, next_partition_start(lower, MONTH)
+
+
+def _bound(day):
+    return f"{day:%Y-%m-%d} 00:00:00+00"
+
+
+# ---------------- introspection ----------------
+def is_partitioned(using=connection):
+    if using.vendor != "postgresql":
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(using=connection):
+    """Names of the partitions currently attached to the heart rate table."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname",
+            [TABLE],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# ---------------- DDL ----------------
+def create_partition(cursor, lower, interval=INTERVAL):
+    upper = next_partition_start(lower, interval)
+    name = partition_name(lower, interval)
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{_bound(lower)}') TO ('{_bound(upper)}')"
+    )
+    return name
+
+
+def convert_to_partitioned(interval=INTERVAL, using=connection):
+    """
+    Rebuild the heart rate table as a range-partitioned table and copy the
+    existing rows across. Takes an exclusive lock for the duration of the
+    copy, so run it in a maintenance window.
+    """
+    if using.vendor != "postgresql":
+        raise RuntimeError("Partitioning requires PostgreSQL.")
+    if is_partitioned(using):
+        return False
+
+    legacy = f"{TABLE}_legacy"
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f"PARTITION BY RANGE (recorded_at)"
+        )
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_part_pkey" PRIMARY KEY (id, recorded_at)')
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS "{SEQUENCE}" OWNED BY "{TABLE}".id')
+        cursor.execute(f"SELECT setval('\"{SEQUENCE}\"', COALESCE(MAX(id), 0) + 1, false) FROM \"{legacy}\"")
+        cursor.execute(f"ALTER TABLE \"{TABLE}\" ALTER COLUMN id SET DEFAULT nextval('\"{SEQUENCE}\"')")
+
+        for name in ("patient", "device"):
+            field = HeartRateRecord._meta.get_field(name)
+            cursor.execute(
+                f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_{field.column}_fk" '
+                f'FOREIGN KEY ("{field.column}") '
+                f'REFERENCES "{field.related_model._meta.db_table}" (id) DEFERRABLE INITIALLY DEFERRED'
+            )
+
+        cursor.execute(f'SELECT MIN(recorded_at), MAX(recorded_at) FROM "{legacy}"')
+        oldest, newest = cursor.fetchone()
+        today = datetime.now(dt_timezone.utc)
+        for lower, _ in partition_ranges(oldest or today, today, interval):
+            create_partition(cursor, lower, interval)
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{legacy}"')
+        # CASCADE drops alerts_alert.record_id's FK, which cannot point at a partitioned table
+        cursor.execute(f'DROP TABLE "{legacy}" CASCADE')
+        # run the deferred patient FK checks now, CREATE INDEX refuses pending trigger events
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        with using.schema_editor(atomic=False) as schema_editor:
+            for index in HeartRateRecord._meta.indexes:
+                schema_editor.add_index(HeartRateRecord, index)
+            for constraint in HeartRateRecord._meta.constraints:
+                schema_editor.add_constraint(HeartRateRecord, constraint)
+
+    logger.info("Converted %s to %s range partitions", TABLE, interval)
+    return True
+
+
+def ensure_partitions(ahead=PREMAKE, interval=INTERVAL, now=None, using=connection):
+    """Create the current partition and the next `ahead` ones if missing."""
+    now = now or datetime.now(dt_timezone.utc)
+    existing = set(list_partitions(using))
+    lower = partition_start(now, interval)
+    created = []
+    with using.cursor() as cursor:
+        for _ in range(ahead + 1):
+            name = partition_name(lower, interval)
+            if name not in existing:
+                create_partition(cursor, lower, interval)
+                created.append(name)
+            lower = next_partition_start(lower, interval)
+    return created
+
+
+def expired_partitions(names, retain, interval=INTERVAL, now=None):
+    """Partitions whose upper bound is older than `retain` intervals before the current one."""
+    now = now or datetime.now(dt_timezone.utc)
+    cutoff = partition_start(now, interval)
+    for _ in range(retain):
+        cutoff = previous_partition_start(cutoff, interval)
+
+    expired = []
+    for name in names:
+        bounds = parse_partition_name(name)
+        if bounds and bounds[1] <= cutoff:
+            expired.append(name)
+    return expired
+
+
+def expire_partitions(retain=RETENTION, drop=False, interval=INTERVAL, now=None, using=connection):
+    """
+    Detach (and optionally drop) partitions older than the retention window.
+    Alerts pointing at rows in those partitions are detached from them first,
+    matching Alert.record's on_delete=SET_NULL.
+    """
+    if retain is None:
+        return []
+    expired = expired_partitions(list_partitions(using), retain, interval, now)
+    alert_table = HeartRateRecord._meta.get_field("alerts").related_model._meta.db_table
+    for name in expired:
+        with transaction.atomic(using=using.alias), using.cursor() as cursor:
+            cursor.execute(f'UPDATE "{alert_table}" SET record_id = NULL WHERE record_id IN (SELECT id FROM "{name}")')
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            if drop:
+                cursor.execute(f'DROP TABLE "{name}"')
+        logger.info("%s expired partition %s", "Dropped" if drop else "Detached", name)
+    return expired
@@ -0,0 +1,70 @@
+# apps/records/readings.py
+"""
+Raw readings of one patient as NumPy arrays.
+
+A window is fetched with a single values_list query that has the database
+turn recorded_at into epoch seconds, so no datetime objects are built per
+row, and rows are streamed straight into one structured array. Returns
+(t, bpm): float64 epoch seconds ascending and float64 bpm.
+
+Readings moved out of the table by the retention job are read back from
+their archive files (archive.load_archived) and merged in by id, so callers
+see the same series before and after archiving.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db.models import FloatField, Func
+
+from .archive import load_archived
+from .models import HeartRateRecord
+
+CHUNK_SIZE = 10000
+ROW = np.dtype([("id", np.int64), ("t", np.float64), ("bpm", np.float64)])
+
+
+class Epoch(Func):
+    """Seconds since 1970-01-01 UTC of a datetime column, as a float."""
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)::float8", **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template="((julianday(%(expressions)s) - 2440587.5) * 86400.0)", **extra_context
+        )
+
+    def as_sql(self, compiler, connection, template=None, **extra_context):
+        if template is None:
+            raise NotImplementedError(f"Epoch is not implemented for {connection.vendor}")
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+def to_datetimes(t):
+    return [datetime.fromtimestamp(value, tz=dt_timezone.utc) for value in t.tolist()]
+
+
+def load_readings(patient_id, start, end):
+    """Readings of a patient in [start, end), oldest first."""
+    rows = (
+        HeartRateRecord.objects.filter(patient_id=patient_id, recorded_at__gte=start, recorded_at__lt=end)
+        .order_by("recorded_at", "id")
+        .annotate(t=Epoch("recorded_at"))
+        .values_list("id", "t", "bpm")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    data = np.fromiter(rows, dtype=ROW)
+
+    archived = load_archived(patient_id, start, end)
+    if len(archived):
+        extra = np.empty(len(archived), dtype=ROW)
+        extra["id"] = archived["id"]
+        extra["t"] = archived["recorded_at"] / 1e6
+        extra["bpm"] = archived["bpm"]
+        # a month being archived can briefly be in both places
+        data = np.concatenate((extra, data))
+        data = data[np.unique(data["id"], return_index=True)[1]]
+        data = data[np.lexsort((data["id"], data["t"]))]
+    return np.ascontiguousarray(data["t"]), np.ascontiguousarray(data["bpm"])
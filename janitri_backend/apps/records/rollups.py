@@ -0,0 +1,185 @@
+# apps/records/rollups.py
+"""
+Incremental 1-minute / 1-hour / 1-day heart rate rollups.
+
+Every ingested batch is folded into HeartRateRollup rows with a single
+INSERT ... ON CONFLICT DO UPDATE, so charts read a bounded number of
+buckets no matter how many raw readings exist. Buckets are aligned to
+the project time zone (settings.TIME_ZONE).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .archive import archived_before
+from .models import HeartRateRecord, HeartRateRollup
+
+logger = logging.getLogger(__name__)
+
+MINUTE = "1m"
+HOUR = "1h"
+DAY = "1d"
+RESOLUTIONS = {
+    MINUTE: timedelta(minutes=1),
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+}
+TRUNC_KINDS = {MINUTE: "minute", HOUR: "hour", DAY: "day"}
+
+
+def bucket_start(value, resolution):
+    """Floor an aware datetime to the start of its bucket in the project time zone."""
+    local = timezone.localtime(value)
+    local = local.replace(second=0, microsecond=0)
+    if resolution in (HOUR, DAY):
+        local = local.replace(minute=0)
+    if resolution == DAY:
+        local = local.replace(hour=0)
+    return local
+
+
+def aggregate_records(records, resolutions=RESOLUTIONS):
+    """Fold records into {(patient_id, resolution, bucket_start): [count, min, max, sum, sum_sq]}."""
+    buckets = {}
+    for record in records:
+        bpm = record.bpm
+        for resolution in resolutions:
+            key = (record.patient_id, resolution, bucket_start(record.recorded_at, resolution))
+            stats = buckets.get(key)
+            if stats is None:
+                buckets[key] = [1, bpm, bpm, bpm, bpm * bpm]
+            else:
+                stats[0] += 1
+                stats[1] = min(stats[1], bpm)
+                stats[2] = max(stats[2], bpm)
+                stats[3] += bpm
+                stats[4] += bpm * bpm
+    return buckets
+
+
+def _upsert_sql(rows):
+    table = connection.ops.quote_name(HeartRateRollup._meta.db_table)
+    least, greatest = ("LEAST", "GREATEST") if connection.vendor == "postgresql" else ("MIN", "MAX")
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * rows)
+    return (
+        f"INSERT INTO {table} (patient_id, resolution, bucket_start, count, min_bpm, max_bpm, sum_bpm, sum_sq_bpm) "
+        f"VALUES {placeholders} "
+        f"ON CONFLICT (patient_id, resolution, bucket_start) DO UPDATE SET "
+        f"count = {table}.count + EXCLUDED.count, "
+        f"min_bpm = {least}({table}.min_bpm, EXCLUDED.min_bpm), "
+        f"max_bpm = {greatest}({table}.max_bpm, EXCLUDED.max_bpm), "
+        f"sum_bpm = {table}.sum_bpm + EXCLUDED.sum_bpm, "
+        f"sum_sq_bpm = {table}.sum_sq_bpm + EXCLUDED.sum_sq_bpm"
+    )
+
+
+def update_rollups(records, chunk_size=1000):
+    """Fold a batch of new records into the rollup tables with one upsert per chunk."""
+    buckets = aggregate_records(records)
+    if not buckets:
+        return 0
+
+    bucket_field = HeartRateRollup._meta.get_field("bucket_start")
+    # sorted keys keep lock order stable between concurrent ingests
+    keys = sorted(buckets)
+    with connection.cursor() as cursor:
+        for offset in range(0, len(keys), chunk_size):
+            chunk = keys[offset:offset + chunk_size]
+            params = []
+            for patient_id, resolution, start in chunk:
+                params.extend([
+                    patient_id,
+                    resolution,
+                    bucket_field.get_db_prep_value(start, connection),
+                    *buckets[(patient_id, resolution, start)],
+                ])
+            cursor.execute(_upsert_sql(len(chunk)), params)
+    return len(keys)
+
+
+def rebuild_rollups(start, end, patient_ids=None):
+    """
+    Recompute rollups covering [start, end] from raw records.
+    The range is widened to whole days so every resolution is rebuilt consistently.
+    Days in archived months are skipped, their raw records are gone.
+    """
+    start = bucket_start(start, DAY)
+    end = bucket_start(end, DAY) + RESOLUTIONS[DAY]
+    archived = archived_before(patient_ids)
+    if archived is not None and start < archived:
+        logger.warning("Keeping rollups before %s, those readings are archived", archived)
+        # first whole local day after the archived (UTC) months
+        start = bucket_start(archived - timedelta(microseconds=1), DAY) + RESOLUTIONS[DAY]
+        if start >= end:
+            return 0
+
+    records = HeartRateRecord.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+    rollups = HeartRateRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end)
+    if patient_ids is not None:
+        records = records.filter(patient_id__in=patient_ids)
+        rollups = rollups.filter(patient_id__in=patient_ids)
+
+    tz = timezone.get_current_timezone()
+    with transaction.atomic():
+        deleted, _ = rollups.delete()
+        created = 0
+        for resolution, kind in TRUNC_KINDS.items():
+            rows = (
+                records.annotate(bucket=Trunc("recorded_at", kind, tzinfo=tz))
+                .values("patient_id", "bucket")
+                .annotate(
+                    n=Count("id"),
+                    lo=Min("bpm"),
+                    hi=Max("bpm"),
+                    total=Sum("bpm"),
+                    total_sq=Sum(F("bpm") * F("bpm")),
+                )
+                .order_by()
+            )
+            created += len(HeartRateRollup.objects.bulk_create(
+                [
+                    HeartRateRollup(
+                        patient_id=row["patient_id"],
+                        resolution=resolution,
+                        bucket_start=row["bucket"],
+                        count=row["n"],
+                        min_bpm=row["lo"],
+                        max_bpm=row["hi"],
+                        sum_bpm=row["total"],
+                        sum_sq_bpm=row["total_sq"],
+                    )
+                    for row in rows.iterator()
+                ],
+                batch_size=1000,
+            ))
+    logger.info("Rebuilt rollups %s - %s: removed %s, created %s", start, end, deleted, created)
+    return created
+
+
+def pick_resolution(start, end):
+    """Choose the finest resolution that keeps a chart within a few thousand points."""
+    span = end - start
+    if span <= timedelta(hours=12):
+        return MINUTE
+    if span <= timedelta(days=60):
+        return HOUR
+    return DAY
+
+
+def get_series(patient_id, start, end, resolution):
+    """Rollup buckets of one patient for [start, end), oldest first."""
+    return (
+        HeartRateRollup.objects.filter(
+            patient_id=patient_id,
+            resolution=resolution,
+            bucket_start__gte=bucket_start(start, resolution),
+            bucket_start__lt=end,
+        )
+        .order_by("bucket_start")
+        .only("bucket_start", "count", "min_bpm", "max_bpm", "sum_bpm", "sum_sq_bpm")
+    )
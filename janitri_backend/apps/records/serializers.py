@@ -1,11 +1,166 @@
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
+from . import aggregation
+from .downsampling import CHART_MAX_POINTS, LTTB, METHODS
 from .models import HeartRateRecord
+from .services import check_recorded_at
+from utils.constants.choices import ROLLUP_RESOLUTION_CHOICES
+from apps.patients.models import Patient
 from apps.patients.serializers import PatientSerializer
+from apps.common.serializers import DynamicFieldsModelSerializer
 
-class HeartRateRecordSerializer(serializers.ModelSerializer):
+def validate_recorded_at(value):
+    try:
+        return check_recorded_at(value)
+    except ValueError as e:
+        raise serializers.ValidationError(str(e))
+
+
+class HeartRateRecordSerializer(DynamicFieldsModelSerializer):
     patient_detail = PatientSerializer(source="patient", read_only=True)
 
     class Meta:
         model = HeartRateRecord
-        fields = ["id", "patient", "patient_detail", "bpm", "recorded_at"]
-        read_only_fields = ["recorded_at"]
+        fields = ["id", "patient", "patient_detail", "bpm", "recorded_at", "device", "sequence"]
+        read_only_fields = ["device", "sequence"]
+        extra_kwargs = {"recorded_at": {"required": False, "validators": [validate_recorded_at]}}
+
+
+class HeartRateRecordItemSerializer(serializers.Serializer):
+    """Lightweight per-reading validation for bulk ingest (no DB lookups)."""
+    patient = serializers.IntegerField(min_value=1)
+    bpm = serializers.IntegerField(min_value=0, max_value=2147483647)
+    recorded_at = serializers.DateTimeField(required=False, validators=[validate_recorded_at])
+    device = serializers.IntegerField(min_value=1, required=False)
+    sequence = serializers.IntegerField(min_value=0, max_value=9223372036854775807, required=False)
+
+    def validate(self, attrs):
+        if "sequence" in attrs and "device" not in attrs:
+            raise serializers.ValidationError({"sequence": "Requires device."})
+        # a retry stamped with a new arrival time would not be recognised as one
+        if "sequence" in attrs and "recorded_at" not in attrs:
+            raise serializers.ValidationError({"sequence": "Requires recorded_at."})
+        return attrs
+
+
+class HeartRateRecordBulkSerializer(serializers.Serializer):
+    records = serializers.ListField(child=serializers.JSONField(), allow_empty=False)
+
+
+class TimeRangeQuerySerializer(serializers.Serializer):
+    """Query params `from` / `to` (ISO 8601). Defaults to the last 24 hours."""
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # `from` is a Python keyword, expose the fields under their query param names
+        fields["from"] = fields.pop("start")
+        fields["to"] = fields.pop("end")
+        return fields
+
+    def validate(self, attrs):
+        end = attrs.pop("to", None) or timezone.now()
+        start = attrs.pop("from", None) or end - timedelta(hours=24)
+        if start >= end:
+            raise serializers.ValidationError({"from": "Must be earlier than 'to'."})
+        attrs["start"], attrs["end"] = start, end
+        return attrs
+
+
+class HeartRateSeriesQuerySerializer(TimeRangeQuerySerializer):
+    patient = serializers.IntegerField(min_value=1)
+    resolution = serializers.ChoiceField(choices=ROLLUP_RESOLUTION_CHOICES, required=False)
+
+
+class HeartRateChartQuerySerializer(TimeRangeQuerySerializer):
+    patient = serializers.IntegerField(min_value=1)
+    points = serializers.IntegerField(min_value=10, max_value=CHART_MAX_POINTS, default=1000)
+    method = serializers.ChoiceField(choices=METHODS, default=LTTB)
+
+
+class HeartRateAnalyticsQuerySerializer(TimeRangeQuerySerializer):
+    patient = serializers.IntegerField(min_value=1)
+
+
+class HeartRateAggregateQuerySerializer(TimeRangeQuerySerializer):
+    place = serializers.IntegerField(min_value=1, required=False)
+    patient = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    bucket = serializers.ChoiceField(choices=list(aggregation.UNITS), default="hour")
+    bucket_seconds = serializers.IntegerField(
+        min_value=1, required=False, help_text="Fixed bucket width counted from `from`, overrides bucket."
+    )
+    group_by = serializers.ChoiceField(choices=aggregation.GROUPS, default=aggregation.PATIENT)
+    percentiles = serializers.CharField(default="50", help_text="Comma separated, e.g. 50,90,95.")
+    output = serializers.ChoiceField(choices=list(aggregation.OUTPUTS), default=aggregation.NDJSON)
+
+    def validate_percentiles(self, value):
+        try:
+            percentiles = sorted({int(q) for q in value.split(",") if q.strip()})
+        except ValueError:
+            raise serializers.ValidationError("Must be comma separated integers.")
+        if not 1 <= len(percentiles) <= aggregation.MAX_PERCENTILES or not all(0 < q < 100 for q in percentiles):
+            raise serializers.ValidationError(
+                f"Give 1 to {aggregation.MAX_PERCENTILES} percentiles between 1 and 99."
+            )
+        return percentiles
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        buckets = aggregation.bucket_count(attrs["start"], attrs["end"], attrs["bucket"], attrs.get("bucket_seconds"))
+        if buckets > aggregation.MAX_BUCKETS:
+            raise serializers.ValidationError(
+                {"bucket": f"Range is limited to {aggregation.MAX_BUCKETS} buckets, use a wider bucket."}
+            )
+        return attrs
+
+
+class WaveformUploadSerializer(serializers.Serializer):
+    """A run of evenly spaced samples; stored as fixed-duration segments."""
+    patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all())
+    start_at = serializers.DateTimeField(validators=[validate_recorded_at])
+    sample_rate = serializers.FloatField(min_value=0.1, max_value=1000, help_text="Samples per second")
+    samples = serializers.ListField(allow_empty=False, max_length=getattr(settings, "WAVEFORM_MAX_SAMPLES", 86400))
+
+    def validate_samples(self, value):
+        # checked as one array, not per item
+        try:
+            samples = np.asarray(value)
+        except (ValueError, OverflowError):
+            samples = None
+        if samples is None or samples.ndim != 1 or samples.dtype.kind not in "iu":
+            raise serializers.ValidationError("Samples must be a flat list of integers.")
+        if samples.min() < 0 or samples.max() > 65535:
+            raise serializers.ValidationError("Samples must be between 0 and 65535.")
+        return samples
+
+
+class WaveformQuerySerializer(TimeRangeQuerySerializer):
+    patient = serializers.IntegerField(min_value=1)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        max_range = getattr(settings, "WAVEFORM_MAX_RANGE_SECONDS", 6 * 3600)
+        if (attrs["end"] - attrs["start"]).total_seconds() > max_range:
+            raise serializers.ValidationError({"from": f"Range is limited to {max_range} seconds."})
+        return attrs
+
+
+class HeartRateSeriesPointSerializer(serializers.Serializer):
+    t = serializers.DateTimeField(source="bucket_start")
+    count = serializers.IntegerField()
+    min = serializers.IntegerField(source="min_bpm")
+    max = serializers.IntegerField(source="max_bpm")
+    mean = serializers.FloatField(source="mean_bpm")
+    std = serializers.FloatField(source="std_bpm")
+
+
+class LatestVitalSerializer(serializers.Serializer):
+    patient = serializers.IntegerField()
+    name = serializers.CharField()
+    bpm = serializers.IntegerField(allow_null=True)
+    recorded_at = serializers.DateTimeField(allow_null=True)
+    open_alert = serializers.BooleanField()
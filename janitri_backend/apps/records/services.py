@@ -0,0 +1,339 @@
+# apps/records/services.py
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.sql import InsertQuery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics import CACHE_GRANULARITY, invalidate_patients
+from .models import HeartRateRecord
+from .rollups import update_rollups
+from .vitals import update_latest_vitals
+from apps.common.events import group_by_place, publish
+from apps.alerts.services import create_alerts
+from apps.patients.models import Patient
+
+logger = logging.getLogger(__name__)
+
+BULK_MAX_ITEMS = getattr(settings, "HEART_RATE_BULK_MAX_ITEMS", 5000)
+BULK_BATCH_SIZE = getattr(settings, "HEART_RATE_BULK_BATCH_SIZE", 1000)
+STREAM_BATCH_SIZE = getattr(settings, "HEART_RATE_STREAM_BATCH_SIZE", 500)
+STREAM_FLUSH_INTERVAL = getattr(settings, "HEART_RATE_STREAM_FLUSH_INTERVAL", 1.0)
+STREAM_MAX_REPORTED_ERRORS = 20
+MAX_CLOCK_SKEW = timedelta(seconds=getattr(settings, "HEART_RATE_MAX_CLOCK_SKEW", 300))
+
+
+def on_records_created(records):
+    """
+    Hooks that run for every batch of freshly inserted HeartRateRecords,
+    whether they came from a single POST (via post_save) or a bulk insert.
+    """
+    update_rollups(records)
+    create_alerts(records)
+    transaction.on_commit(lambda: _refresh_latest_vitals(records))
+
+    # late readings can land in analytics windows that are already cached
+    cutoff = timezone.now() - timedelta(seconds=CACHE_GRANULARITY)
+    late = {record.patient_id for record in records if record.recorded_at < cutoff}
+    if late:
+        transaction.on_commit(lambda: invalidate_patients(late))
+
+
+def _refresh_latest_vitals(records):
+    """Fold a committed batch into the latest vitals cache and push it to place subscribers."""
+    try:
+        place_of = update_latest_vitals(records)
+    except Exception:
+        # the cache is a convenience, never fail ingest over it
+        logger.exception("Could not update latest vitals for %s record(s)", len(records))
+        return
+    publish(
+        (place_id, "reading", {"readings": [
+            {"patient": r.patient_id, "bpm": r.bpm, "recorded_at": r.recorded_at} for r in place_records
+        ]})
+        for place_id, place_records in group_by_place(records, lambda r: place_of.get(r.patient_id))
+    )
+
+
+def check_recorded_at(value, now=None):
+    """Raise ValueError for a client timestamp ahead of the server clock by more than MAX_CLOCK_SKEW."""
+    if value > (now or timezone.now()) + MAX_CLOCK_SKEW:
+        raise ValueError("recorded_at is in the future.")
+    return value
+
+
+def parse_recorded_at(value, tz=dt_timezone.utc):
+    """
+    A client timestamp (ISO 8601 string or epoch seconds) as an aware
+    datetime, or raise ValueError. Naive values are taken to be in tz.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            parsed = datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            # out of range for the platform, infinite or NaN
+            raise ValueError("recorded_at epoch seconds are out of range.")
+    elif isinstance(value, str):
+        parsed = parse_datetime(value)
+    else:
+        parsed = None
+    if parsed is None:
+        raise ValueError("recorded_at must be an ISO 8601 datetime or epoch seconds.")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, tz)
+    return check_recorded_at(parsed)
+
+
+def validate_readings(items, item_serializer_class):
+    """
+    Validate a batch of raw readings together.
+
+    Field validation runs per item, then every referenced patient and device
+    is checked with a single query each. Returns (valid, errors) where valid
+    is a list of (index, validated_data) and errors a list of {"index",
+    "errors"} dicts.
+    """
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        serializer = item_serializer_class(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+
+    from apps.devices.models import Device
+
+    patient_ids = {data["patient"] for _, data in valid}
+    existing = set(Patient.objects.filter(id__in=patient_ids).values_list("id", flat=True))
+    device_ids = {data["device"] for _, data in valid if data.get("device") is not None}
+    devices = set(Device.objects.filter(id__in=device_ids).values_list("id", flat=True)) if device_ids else set()
+
+    checked = []
+    for index, data in valid:
+        if data["patient"] not in existing:
+            errors.append({"index": index, "errors": {"patient": ["Patient does not exist."]}})
+        elif data.get("device") is not None and data["device"] not in devices:
+            errors.append({"index": index, "errors": {"device": ["Device does not exist."]}})
+        else:
+            checked.append((index, data))
+
+    errors.sort(key=lambda error: error["index"])
+    return checked, errors
+
+
+def _dedupe_key(record):
+    """Identity of a reading that may be delivered more than once, None if it has none."""
+    if record.ingest_key is None and (record.device_id is None or record.sequence is None):
+        return None
+    return record.device_id, record.sequence, record.ingest_key, record.recorded_at
+
+
+def _insert_ignore_returning(records, using):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING: rows hitting a unique
+    constraint are skipped by the database. Sets the pk of inserted records.
+    """
+    connection = connections[using]
+    opts = HeartRateRecord._meta
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    returning = [opts.pk] + [opts.get_field(name) for name in ("device", "sequence", "ingest_key", "recorded_at")]
+    by_key = {_dedupe_key(record): record for record in reversed(records)}  # the first of in-batch repeats wins
+    records = [record for record in records if by_key[_dedupe_key(record)] is record]
+
+    batch_size = max(min(BULK_BATCH_SIZE, connection.ops.bulk_batch_size(fields, records)), 1)
+    for start in range(0, len(records), batch_size):
+        query = InsertQuery(HeartRateRecord, on_conflict=OnConflict.IGNORE)
+        query.insert_values(fields, records[start:start + batch_size])
+        compiler = query.get_compiler(using)
+        compiler.returning_fields = returning
+        (sql, params), = compiler.as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        converters = compiler.get_converters([field.get_col(opts.db_table) for field in returning])
+        if converters:
+            rows = compiler.apply_converters(rows, converters)
+        for pk, *key in rows:
+            by_key[tuple(key)].pk = pk
+
+
+def _insert_skipping_existing(records, using):
+    """Fallback for databases without RETURNING on multi-row inserts: look the keys up first."""
+    sequenced = [r for r in records if r.device_id is not None and r.sequence is not None]
+    keyed = [r for r in records if r.ingest_key is not None]
+    seen = set(
+        HeartRateRecord.objects.using(using)
+        .filter(device_id__in={r.device_id for r in sequenced}, sequence__in={r.sequence for r in sequenced})
+        .values_list("device_id", "sequence", "recorded_at")
+    ) if sequenced else set()
+    seen |= set(
+        HeartRateRecord.objects.using(using)
+        .filter(ingest_key__in=[r.ingest_key for r in keyed])
+        .values_list("ingest_key", "recorded_at")
+    ) if keyed else set()
+
+    new = []
+    for record in records:
+        keys = []
+        if record.device_id is not None and record.sequence is not None:
+            keys.append((record.device_id, record.sequence, record.recorded_at))
+        if record.ingest_key is not None:
+            keys.append((record.ingest_key, record.recorded_at))
+        if not seen.intersection(keys):
+            seen.update(keys)
+            new.append(record)
+    HeartRateRecord.objects.using(using).bulk_create(new, batch_size=BULK_BATCH_SIZE)
+
+
+def insert_records(records):
+    """
+    Insert unsaved HeartRateRecords and return the ones actually written, in
+    order. A reading already stored under the same device + sequence +
+    recorded_at, or ingest_key + recorded_at, is skipped by the database
+    (ON CONFLICT DO NOTHING) so retried and replayed batches cost one
+    statement and no existence queries.
+    """
+    using = router.db_for_write(HeartRateRecord)
+    plain = [record for record in records if _dedupe_key(record) is None]
+    keyed = [record for record in records if _dedupe_key(record) is not None]
+    with transaction.atomic(using=using):
+        if plain:
+            HeartRateRecord.objects.using(using).bulk_create(plain, batch_size=BULK_BATCH_SIZE)
+        if keyed:
+            if connections[using].features.can_return_rows_from_bulk_insert:
+                _insert_ignore_returning(keyed, using)
+            else:
+                _insert_skipping_existing(keyed, using)
+    return [record for record in records if record.pk is not None]
+
+
+def build_record(data):
+    return HeartRateRecord(
+        patient_id=data["patient"],
+        bpm=data["bpm"],
+        recorded_at=data.get("recorded_at") or timezone.now(),
+        device_id=data.get("device"),
+        sequence=data.get("sequence"),
+    )
+
+
+def bulk_create_records(readings):
+    """
+    Insert validated readings ({"patient", "bpm"[, "recorded_at", "device",
+    "sequence"]}) with multi-row INSERTs and run the post-ingest hooks for
+    the readings that were new. Returns the inserted records; readings
+    already stored are left out.
+    """
+    with transaction.atomic():
+        records = insert_records([build_record(data) for data in readings])
+        on_records_created(records)
+    logger.info(
+        "Bulk inserted %s heart rate record(s), %s duplicate(s) skipped", len(records), len(readings) - len(records)
+    )
+    return records
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_stream_line(line):
+    """
+    Parse one newline-delimited reading: a JSON object like {"bpm": 82,
+    "recorded_at": "2025-01-01T10:00:00Z", "sequence": 17} or a bare
+    integer. recorded_at (ISO 8601 or epoch seconds) and sequence are
+    optional, but a sequence needs a recorded_at. Returns the reading dict
+    or raises ValueError.
+    """
+    reading = json.loads(line)
+    if _is_int(reading):
+        reading = {"bpm": reading}
+    if not isinstance(reading, dict):
+        raise ValueError("Expected a JSON object or an integer bpm.")
+    bpm = reading.get("bpm")
+    if not _is_int(bpm) or not 0 <= bpm <= 2147483647:
+        raise ValueError("bpm must be a non-negative integer.")
+
+    if reading.get("recorded_at") is not None:
+        reading["recorded_at"] = parse_recorded_at(reading["recorded_at"])
+
+    sequence = reading.get("sequence")
+    if sequence is not None and (not _is_int(sequence) or not 0 <= sequence <= 9223372036854775807):
+        raise ValueError("sequence must be a non-negative integer.")
+    if sequence is not None and reading.get("recorded_at") is None:
+        raise ValueError("sequence requires recorded_at.")
+    return reading
+
+
+def ingest_stream(lines, device, batch_size=None, flush_interval=None):
+    """
+    Consume newline-delimited readings from an authenticated device and
+    commit them in micro-batches to the device's currently assigned patient.
+
+    A batch is flushed when it reaches batch_size readings or when
+    flush_interval seconds have passed since the last flush. The device
+    assignment is re-resolved from cache on every flush, not per reading.
+    In stream ingest mode batches are queued to Redis instead of written.
+    """
+    from . import writebehind
+
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    flush_interval = flush_interval if flush_interval is not None else STREAM_FLUSH_INTERVAL
+    stats = {"accepted": 0, "duplicates": 0, "rejected": 0, "batches": 0, "errors": []}
+    buffer = []
+
+    def reject(line_no, message, count=1):
+        stats["rejected"] += count
+        if len(stats["errors"]) < STREAM_MAX_REPORTED_ERRORS:
+            stats["errors"].append({"line": line_no, "error": message})
+
+    def flush(line_no):
+        if not buffer:
+            return
+        patient_id = device.refresh().assigned_to_id
+        if patient_id is None:
+            reject(line_no, "Device is not assigned to a patient.", count=len(buffer))
+        else:
+            readings = [
+                {
+                    "patient": patient_id,
+                    "bpm": r["bpm"],
+                    "recorded_at": r.get("recorded_at"),
+                    "device": device.id,
+                    "sequence": r.get("sequence"),
+                }
+                for r in buffer
+            ]
+            if writebehind.enabled():
+                stats["accepted"] += len(writebehind.enqueue_readings(readings))
+            else:
+                records = bulk_create_records(readings)
+                stats["accepted"] += len(records)
+                stats["duplicates"] += len(readings) - len(records)
+            stats["batches"] += 1
+        buffer.clear()
+
+    last_flush = time.monotonic()
+    line_no = 0
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            buffer.append(parse_stream_line(line))
+        except ValueError as e:
+            reject(line_no, str(e))
+            continue
+
+        if len(buffer) >= batch_size or time.monotonic() - last_flush >= flush_interval:
+            flush(line_no)
+            last_flush = time.monotonic()
+
+    flush(line_no)
+    return stats
@@ -1,19 +1,29 @@
 # records/signals.py
 
 import logging
-from django.db.models.signals import post_save
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.conf import settings
 
+from . import archive
 from .models import HeartRateRecord
-from apps.alerts.models import Alert
-from apps.alerts.tasks import send_alert_email_task  # Celery task
-from apps.users.models import User  # Doctor model
+from .services import on_records_created
+from .analytics import invalidate_patients
+from .rollups import rebuild_rollups
+from .vitals import invalidate_place_vitals, update_latest_vitals
+from apps.patients.models import Patient
 
 logger = logging.getLogger(__name__)
 
-CRITICAL_HIGH = getattr(settings, "ALERT_CRITICAL_HIGH", 120)
-CRITICAL_LOW = getattr(settings, "ALERT_CRITICAL_LOW", 40)
+
+@receiver(pre_save, sender=HeartRateRecord)
+def remember_original_reading(sender, instance, **kwargs):
+    """Keep the stored patient and time of an edited reading, the edit may move it."""
+    if instance._state.adding or instance.pk is None:
+        return
+    instance._original = (
+        HeartRateRecord.objects.filter(pk=instance.pk).values_list("patient_id", "recorded_at").first()
+    )
 
 
 @receiver(post_save, sender=HeartRateRecord)
@@ -21,43 +31,47 @@ def create_critical_alert(sender, instance, created, **kwargs):
     """
     Create an Alert when a HeartRateRecord is critical.
     Send email to doctors asynchronously via Celery.
+    Bulk inserts skip post_save and call on_records_created themselves.
     """
-    print("hoo")
     if not created:
+        # an edited reading may have changed bpm or moved buckets, recompute its old and new day
+        original = getattr(instance, "_original", None)
+        rebuild_rollups(instance.recorded_at, instance.recorded_at, [instance.patient_id])
+        if original is None or original == (instance.patient_id, instance.recorded_at):
+            update_latest_vitals([instance])
+            invalidate_patients([instance.patient_id])
+            return
+        old_patient, old_recorded_at = original
+        rebuild_rollups(old_recorded_at, old_recorded_at, [old_patient])
+        # it may have been the latest reading of the old patient
+        patient_ids = {old_patient, instance.patient_id}
+        for place_id in set(Patient.objects.filter(id__in=patient_ids).values_list("place_id", flat=True)):
+            invalidate_place_vitals(place_id)
+        invalidate_patients(patient_ids)
         return
 
-    bpm = instance.bpm
-    patient = instance.patient
+    on_records_created([instance])
+
 
-    if bpm > CRITICAL_HIGH:
-        message = f"Critical high heart rate detected: {bpm} bpm"
-    elif bpm < CRITICAL_LOW:
-        message = f"Critical low heart rate detected: {bpm} bpm"
-    else:
-        # Not critical, nothing to do
-        logger.debug("HeartRateRecord not critical: %s bpm (patient=%s)", bpm, patient)
+@receiver(post_delete, sender=HeartRateRecord)
+def forget_deleted_reading(sender, instance, origin=None, **kwargs):
+    """Take a deleted reading out of the rollups, latest vitals and cached analytics."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and model is not HeartRateRecord:
+        # cascaded from deleting the patient or its place, their rollups go with them
         return
+    if archive.deleting():
+        # moved to an archive file, its rollups stay and it is still served from there
+        return
+    rebuild_rollups(instance.recorded_at, instance.recorded_at, [instance.patient_id])
+    place_id = Patient.objects.filter(id=instance.patient_id).values_list("place_id", flat=True).first()
+    if place_id is not None:
+        invalidate_place_vitals(place_id)
+    invalidate_patients([instance.patient_id])
 
-    # Create Alert (OneToOne ensures no duplicates)
-    alert, created_alert = Alert.objects.get_or_create(
-        record=instance,
-        defaults={"patient": patient, "message": message},
-    )
 
-    if created_alert:
-        logger.info("Created Alert(id=%s) for HeartRateRecord(id=%s)", alert.id, instance.id)
-
-        # Notify all doctors in the same place
-        doctors = User.objects.filter(place=patient.place, role="DOCTOR")
-        for doctor in doctors:
-            if doctor.email:
-                # Call Celery task to send email
-                send_alert_email_task.delay(
-                    to_email=doctor.email,
-                    patient_name=patient.name,
-                    patient_id=patient.id,
-                    bpm=bpm,
-                    recorded_at=instance.recorded_at
-                )
-    else:
-        logger.debug("Alert already exists for HeartRateRecord(id=%s)", instance.id)
+@receiver(post_save, sender=Patient)
+def refresh_place_vitals(sender, instance, created, **kwargs):
+    """A patient may have moved place, rebuild that place's latest vitals on next read."""
+    if not created:
+        invalidate_place_vitals(instance.place_id)
@@ -0,0 +1,49 @@
+# apps/records/tasks.py
+
+import logging
+from celery import shared_task
+from django.utils.dateparse import parse_datetime
+
+from . import archive, partitioning, writebehind
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def maintain_heart_rate_partitions():
+    """Periodic partition upkeep when HEART_RATE_PARTITIONING is enabled."""
+    if not partitioning.ENABLED or not partitioning.is_partitioned():
+        return
+    partitioning.ensure_partitions()
+    partitioning.expire_partitions()
+
+
+@shared_task
+def archive_heart_rate_records():
+    """Daily retention run when HEART_RATE_ARCHIVE_AFTER_DAYS is set, see archive.py."""
+    if archive.AFTER_DAYS is None:
+        return None
+    stats = archive.archive_records()
+    if stats["months"]:
+        logger.info("Heart rate archive run %s", stats)
+    return stats
+
+
+@shared_task
+def drain_heart_rate_ingest():
+    """Write buffered readings from the Redis ingest stream (HEART_RATE_INGEST_MODE = "stream")."""
+    stats = writebehind.drain()
+    lag = writebehind.stream_lag()
+    if stats["batches"] or lag["length"]:
+        logger.info("Heart rate ingest drain %s, backlog %s", stats, lag)
+    return {**stats, "lag": lag}
+
+
+@shared_task
+def evaluate_backfill_alerts(patient_ids, start, end):
+    """Record alerts for imported history (import_heart_rate_history --alerts defer) without notifying."""
+    from .backfill import evaluate_alerts
+
+    created = evaluate_alerts(patient_ids, parse_datetime(start), parse_datetime(end))
+    logger.info("Backfill alert evaluation for %s patient(s): %s alert(s)", len(patient_ids), created)
+    return created
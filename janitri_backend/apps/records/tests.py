@@ -1,4 +1,8 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 # Create your tests here.
 from django.urls import reverse
@@ -8,6 +12,9 @@ from apps.patients.models import Patient
 from apps.records.models import HeartRateRecord
 from apps.users.models import User
 from apps.places.models import Place
+from apps.alerts.models import Alert
+from apps.records import writebehind
+from utils.redis_client import redis_client
 
 class HeartRateRecordTests(APITestCase):
     def setUp(self):
@@ -50,3 +57,977 @@ class HeartRateRecordTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.record.refresh_from_db()
         self.assertEqual(self.record.bpm, 90)
+
+    def test_bulk_create_heart_rate_records(self):
+        url = reverse("heart-rate-record-bulk")
+        data = {"records": [{"patient": self.patient.id, "bpm": 70 + i} for i in range(50)]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["created"], 50)
+        self.assertEqual(HeartRateRecord.objects.filter(patient=self.patient).count(), 51)
+
+    def test_bulk_create_reports_item_errors(self):
+        url = reverse("heart-rate-record-bulk")
+        data = {"records": [
+            {"patient": self.patient.id, "bpm": 80},
+            {"patient": self.patient.id, "bpm": -1},
+            {"patient": 999999, "bpm": 80},
+            "not-a-reading",
+        ]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["created"], 1)
+        self.assertEqual([e["index"] for e in response.data["data"]["errors"]], [1, 2, 3])
+
+    def test_bulk_create_creates_alerts_for_critical_readings(self):
+        from apps.alerts.models import Alert
+
+        url = reverse("heart-rate-record-bulk")
+        data = {"records": [
+            {"patient": self.patient.id, "bpm": 150},
+            {"patient": self.patient.id, "bpm": 80},
+            {"patient": self.patient.id, "bpm": 20},
+        ]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Alert.objects.filter(patient=self.patient).count(), 2)
+
+    def test_bulk_retry_with_device_sequence_is_absorbed(self):
+        from apps.devices.models import Device
+        from apps.records.models import HeartRateRollup
+
+        device = Device.objects.create(device_id="DEV-SEQ", place=self.place)
+        measured = timezone.now() - timedelta(hours=3)
+        url = reverse("heart-rate-record-bulk")
+        data = {"records": [
+            {"patient": self.patient.id, "bpm": 80 + i, "device": device.id, "sequence": i,
+             "recorded_at": (measured + timedelta(seconds=i)).isoformat()}
+            for i in range(5)
+        ]}
+        first = self.client.post(url, data, format="json")
+        self.assertEqual((first.data["data"]["created"], first.data["data"]["duplicates"]), (5, 0))
+
+        # the device retries after a blip, with one new reading appended
+        data["records"].append({"patient": self.patient.id, "bpm": 90, "device": device.id, "sequence": 5,
+                                "recorded_at": (measured + timedelta(seconds=5)).isoformat()})
+        retry = self.client.post(url, data, format="json")
+        self.assertEqual((retry.data["data"]["created"], retry.data["data"]["duplicates"]), (1, 5))
+        self.assertEqual(HeartRateRecord.objects.filter(device=device).count(), 6)
+
+        # late readings are counted once, in the hour they were measured
+        hour = HeartRateRollup.objects.get(patient=self.patient, resolution="1h", bucket_start__lte=measured,
+                                           bucket_start__gt=measured - timedelta(hours=1))
+        self.assertEqual((hour.count, hour.sum_bpm), (6, sum(range(80, 85)) + 90))
+
+    def test_bulk_rejects_future_and_unsequenced_readings(self):
+        url = reverse("heart-rate-record-bulk")
+        data = {"records": [
+            {"patient": self.patient.id, "bpm": 80, "recorded_at": (timezone.now() + timedelta(hours=1)).isoformat()},
+            {"patient": self.patient.id, "bpm": 80, "sequence": 1},
+            {"patient": self.patient.id, "bpm": 80, "device": 999999, "sequence": 1},
+            {"patient": self.patient.id, "bpm": 80},
+        ]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.data["data"]["created"], 1)
+        self.assertEqual([e["index"] for e in response.data["data"]["errors"]], [0, 1, 2])
+
+    def test_bulk_retry_of_sequence_without_recorded_at_is_rejected(self):
+        from apps.devices.models import Device
+
+        device = Device.objects.create(device_id="DEV-SEQ", place=self.place)
+        url = reverse("heart-rate-record-bulk")
+        data = {"records": [{"patient": self.patient.id, "bpm": 80, "device": device.id, "sequence": 1}]}
+        for _ in range(2):
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("recorded_at", str(response.data["errors"]))
+        self.assertFalse(HeartRateRecord.objects.filter(device=device).exists())
+
+    def test_out_of_range_epoch_is_a_value_error(self):
+        from apps.records.services import parse_recorded_at
+
+        for value in (1e20, -1e20, float("inf"), float("nan"), 10 ** 30):
+            with self.assertRaises(ValueError):
+                parse_recorded_at(value)
+
+    def test_create_with_measurement_time(self):
+        measured = timezone.now() - timedelta(minutes=10)
+        response = self.client.post(
+            reverse("heart-rate-record-list"), {"patient": self.patient.id, "bpm": 85, "recorded_at": measured.isoformat()}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(HeartRateRecord.objects.get(bpm=85).recorded_at, measured)
+
+
+class HeartRateRollupTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+
+    def _rollups(self):
+        from apps.records.models import HeartRateRollup
+
+        return sorted(
+            HeartRateRollup.objects.values_list(
+                "resolution", "bucket_start", "count", "min_bpm", "max_bpm", "sum_bpm", "sum_sq_bpm"
+            )
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        from apps.records.rollups import rebuild_rollups
+        from apps.records.services import bulk_create_records
+
+        HeartRateRecord.objects.create(patient=self.patient, bpm=70)
+        bulk_create_records([{"patient": self.patient.id, "bpm": bpm} for bpm in (80, 90, 100)])
+        incremental = self._rollups()
+        daily = [row for row in incremental if row[0] == "1d"]
+        self.assertEqual(len(daily), 1)
+        self.assertEqual(daily[0][2:], (4, 70, 100, 340, 70 ** 2 + 80 ** 2 + 90 ** 2 + 100 ** 2))
+
+        now = timezone.now()
+        rebuild_rollups(now - timedelta(days=1), now)
+        self.assertEqual(self._rollups(), incremental)
+
+    def test_updating_record_rebuilds_rollups(self):
+        record = HeartRateRecord.objects.create(patient=self.patient, bpm=70)
+        record.bpm = 75
+        record.save()
+        self.assertEqual({row[3] for row in self._rollups()}, {75})
+
+    def test_moving_record_to_another_patient_rebuilds_both(self):
+        from apps.records.models import HeartRateRollup
+
+        other = Patient.objects.create(name="Jane Doe", age=28, gender="F", place=self.place)
+        HeartRateRecord.objects.create(patient=self.patient, bpm=70)
+        record = HeartRateRecord.objects.create(patient=self.patient, bpm=90)
+        response = self.client.patch(
+            reverse("heart-rate-record-detail", args=[record.id]), {"patient": other.id}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        daily = dict(HeartRateRollup.objects.filter(resolution="1d").values_list("patient_id", "count"))
+        self.assertEqual(daily, {self.patient.id: 1, other.id: 1})
+
+    def test_moving_recorded_at_to_another_day_rebuilds_both_days(self):
+        from apps.records.models import HeartRateRollup
+
+        HeartRateRecord.objects.create(patient=self.patient, bpm=70)
+        record = HeartRateRecord.objects.create(patient=self.patient, bpm=90)
+        earlier = record.recorded_at - timedelta(days=2)
+        response = self.client.patch(
+            reverse("heart-rate-record-detail", args=[record.id]), {"recorded_at": earlier.isoformat()}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        daily = sorted(HeartRateRollup.objects.filter(resolution="1d").values_list("bucket_start", "count"))
+        self.assertEqual([count for _, count in daily], [1, 1])
+        self.assertEqual(daily[0][0], timezone.localtime(earlier).replace(hour=0, minute=0, second=0, microsecond=0))
+
+    def test_deleting_record_updates_rollups_vitals_and_analytics(self):
+        from apps.records.analytics import get_analytics
+        from apps.records.models import HeartRateRollup
+        from apps.records.vitals import get_place_vitals
+
+        first = HeartRateRecord.objects.create(patient=self.patient, bpm=70)
+        last = HeartRateRecord.objects.create(patient=self.patient, bpm=90)
+        now = timezone.now()
+        self.assertEqual(get_analytics(self.patient.id, now - timedelta(hours=1), now)["count"], 2)
+        self.assertEqual(get_place_vitals(self.place.id)[self.patient.id][1], 90)
+
+        response = self.client.delete(reverse("heart-rate-record-detail", args=[last.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(HeartRateRollup.objects.get(resolution="1d").count, 1)
+        self.assertEqual(get_place_vitals(self.place.id)[self.patient.id][1], first.bpm)
+        self.assertEqual(get_analytics(self.patient.id, now - timedelta(hours=1), now)["count"], 1)
+
+    def test_series_endpoint(self):
+        from apps.records.rollups import rebuild_rollups
+
+        recorded_at = timezone.now().replace(minute=30) - timedelta(hours=2)
+        for bpm in (60, 80):
+            HeartRateRecord.objects.create(patient=self.patient, bpm=bpm)
+        HeartRateRecord.objects.update(recorded_at=recorded_at)
+        rebuild_rollups(recorded_at - timedelta(days=1), timezone.now())
+
+        url = reverse("heart-rate-record-series")
+        response = self.client.get(url, {"patient": self.patient.id, "resolution": "1h"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        points = response.data["data"]["points"]
+        self.assertEqual(len(points), 1)
+        self.assertEqual((points[0]["count"], points[0]["min"], points[0]["max"], points[0]["mean"]), (2, 60, 80, 70.0))
+        self.assertEqual(points[0]["std"], 10.0)
+
+    def test_series_rejects_too_many_points(self):
+        url = reverse("heart-rate-record-series")
+        start = (timezone.now() - timedelta(days=30)).isoformat()
+        response = self.client.get(url, {"patient": self.patient.id, "resolution": "1m", "from": start})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HeartRateChartTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+
+    def test_downsampling_keeps_spikes(self):
+        import numpy as np
+        from apps.records.downsampling import METHODS, downsample
+
+        t = np.arange(100_000, dtype=np.float64)
+        bpm = np.full(100_000, 140.0)
+        bpm[12_345] = 220.0
+        bpm[67_890] = 40.0
+        for method in METHODS:
+            keep = downsample(t, bpm, 100, method)
+            self.assertLessEqual(len(keep), 100)
+            self.assertTrue(np.all(np.diff(keep) > 0))
+            self.assertIn(12_345, keep)
+            self.assertIn(67_890, keep)
+
+    def test_chart_endpoint(self):
+        now = timezone.now()
+        HeartRateRecord.objects.bulk_create([
+            HeartRateRecord(patient=self.patient, bpm=200 if i == 500 else 140, recorded_at=now - timedelta(seconds=i))
+            for i in range(1000)
+        ])
+        url = reverse("heart-rate-record-chart")
+        response = self.client.get(url, {"patient": self.patient.id, "points": 50, "method": "minmax"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual(data["source_points"], 1000)
+        self.assertLessEqual(len(data["points"]), 50)
+        self.assertIn(200, [point["bpm"] for point in data["points"]])
+        times = [point["t"] for point in data["points"]]
+        self.assertEqual(times, sorted(times))
+
+    def test_chart_rejects_unknown_method(self):
+        url = reverse("heart-rate-record-chart")
+        response = self.client.get(url, {"patient": self.patient.id, "method": "average"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HeartRateAnalyticsTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+
+    def test_metrics(self):
+        import numpy as np
+        from apps.records.analytics import compute_metrics
+
+        # 10 minutes at 1 Hz around 140, one 20 s acceleration, one 5 s dip and a 10 s tachycardia
+        t = np.arange(600, dtype=np.float64)
+        bpm = np.where(np.arange(600) % 2, 141.0, 139.0)
+        bpm[100:120] = 160.0
+        bpm[300:305] = 120.0
+        bpm[400:410] = 170.0
+        metrics = compute_metrics(t, bpm)
+
+        self.assertEqual(metrics["count"], 600)
+        self.assertEqual(metrics["baseline"], 140)
+        self.assertEqual(metrics["percentiles"]["p50"], 141.0)
+        self.assertEqual((metrics["accelerations"], metrics["decelerations"]), (1, 0))
+        self.assertEqual(metrics["variability"]["short_term"], round(float(np.abs(np.diff(bpm)).mean()), 2))
+        in_range = metrics["time_in_range"]
+        self.assertEqual((in_range["below"], in_range["within"], in_range["above"]), (0.0, 590.0, 10.0))
+
+    def test_gaps_are_not_monitored_time(self):
+        import numpy as np
+        from apps.records.analytics import compute_metrics
+
+        t = np.array([0.0, 1.0, 2.0, 3600.0, 3601.0])
+        metrics = compute_metrics(t, np.full(5, 100.0))
+        self.assertEqual(metrics["time_in_range"]["below"], 64.0)
+        self.assertIsNone(compute_metrics(np.array([]), np.array([]))["mean"])
+
+    def test_endpoint_is_cached_until_a_reading_changes(self):
+        start = timezone.now() - timedelta(hours=2)
+        HeartRateRecord.objects.bulk_create([
+            HeartRateRecord(patient=self.patient, bpm=130 + i % 20, recorded_at=start + timedelta(seconds=i))
+            for i in range(600)
+        ])
+        url = reverse("heart-rate-record-analytics")
+        params = {"patient": self.patient.id, "from": start.isoformat(), "to": (start + timedelta(hours=1)).isoformat()}
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["data"]["count"], 600)
+        self.assertEqual(first.data["data"]["mean"], 139.5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, params).data["data"], first.data["data"])
+
+        record = HeartRateRecord.objects.filter(patient=self.patient).first()
+        record.bpm = 100
+        record.save()
+        self.assertEqual(self.client.get(url, params).data["data"]["min"], 100)
+
+
+class HeartRateAggregateTests(APITestCase):
+    def setUp(self):
+        from datetime import datetime, timezone as dt_timezone
+
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.other_place = Place.objects.create(name="Other Clinic")
+        self.patients = [
+            Patient.objects.create(name=f"Patient {i}", age=30, gender="F", place=self.place) for i in range(2)
+        ]
+        self.outsider = Patient.objects.create(name="Outsider", age=30, gender="F", place=self.other_place)
+        self.start = datetime(2025, 3, 1, 6, 30, tzinfo=dt_timezone.utc)  # 12:00 Asia/Kolkata
+        # one reading per minute for two hours: 120-179 bpm in the first hour, 60-119 in the second
+        HeartRateRecord.objects.bulk_create([
+            HeartRateRecord(patient=patient, bpm=180 - i if i < 60 else 180 - i - 1,
+                            recorded_at=self.start + timedelta(minutes=i))
+            for patient in (*self.patients, self.outsider)
+            for i in range(120)
+        ])
+        self.url = reverse("heart-rate-record-aggregate")
+
+    def _get(self, **params):
+        return self.client.get(
+            self.url, {"from": self.start.isoformat(), "to": (self.start + timedelta(hours=2)).isoformat(), **params}
+        )
+
+    def test_rejects_invalid_parameters(self):
+        self.assertEqual(self._get(percentiles="50,abc").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(percentiles="0").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(bucket_seconds=1, **{"from": "2020-01-01T00:00:00Z"}).status_code, 400)
+
+    def test_hourly_aggregates_per_patient_are_streamed(self):
+        import json
+        from django.db import connection
+
+        if connection.vendor != "postgresql":
+            self.assertEqual(self._get().status_code, status.HTTP_501_NOT_IMPLEMENTED)
+            self.skipTest("Aggregation needs PostgreSQL")
+
+        response = self._get(place=self.place.id, percentiles="50,90")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row["patient"], row["bucket"]) for row in rows], [
+            (self.patients[0].id, "2025-03-01T12:00:00+05:30"),
+            (self.patients[0].id, "2025-03-01T13:00:00+05:30"),
+            (self.patients[1].id, "2025-03-01T12:00:00+05:30"),
+            (self.patients[1].id, "2025-03-01T13:00:00+05:30"),
+        ])
+        self.assertEqual(
+            {key: rows[0][key] for key in ("count", "avg", "min", "max", "p50", "p90")},
+            {"count": 60, "avg": 150.5, "min": 121, "max": 180, "p50": 150.5, "p90": 174.1},
+        )
+
+        response = self._get(group_by="place", bucket_seconds=1800, output="csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "bucket,place,count,avg,min,max,p50")
+        self.assertEqual(len(lines), 1 + 2 * 4)
+        self.assertTrue(lines[1].startswith(f"2025-03-01T12:00:00+05:30,{self.place.id},60,"))
+
+    def _archive_february(self, patient):
+        from datetime import date, datetime, timezone as dt_timezone
+        from apps.records.models import HeartRateArchive
+
+        moment = datetime(2025, 2, 27, 4, 30, tzinfo=dt_timezone.utc)
+        HeartRateArchive.objects.create(
+            patient=patient, month=date(2025, 2, 1), path="heart_rate/february.npz", count=10,
+            start_at=moment, end_at=moment, first_id=1, last_id=10, size=1, checksum="0" * 64,
+        )
+
+    def test_archived_range_needs_day_or_coarser_buckets(self):
+        self._archive_february(self.patients[0])
+        february = {"from": "2025-02-20T00:00:00Z"}
+        response = self._get(place=self.place.id, bucket="hour", **february)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("archived", str(response.data["errors"]["from"]))
+        self.assertEqual(self._get(bucket_seconds=86400, **february).status_code, status.HTTP_400_BAD_REQUEST)
+        # the other clinic has nothing archived
+        response = self._get(place=self.other_place.id, bucket="hour", **february)
+        self.assertNotEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        b"".join(getattr(response, "streaming_content", []))  # close the server-side cursor
+
+    def test_archived_months_are_read_from_daily_rollups(self):
+        import json
+        from datetime import datetime, timezone as dt_timezone
+        from django.db import connection
+        from apps.records.models import HeartRateRollup
+        from apps.records.rollups import DAY, rebuild_rollups
+
+        if connection.vendor != "postgresql":
+            self.skipTest("Aggregation needs PostgreSQL")
+
+        rebuild_rollups(self.start, self.start + timedelta(hours=2))
+        HeartRateRollup.objects.create(
+            patient=self.patients[0], resolution=DAY, bucket_start=datetime(2025, 2, 26, 18, 30, tzinfo=dt_timezone.utc),
+            count=10, min_bpm=70, max_bpm=90, sum_bpm=800, sum_sq_bpm=64200,
+        )
+        self._archive_february(self.patients[0])
+        # 2 March (local) is past the archived months, read from the raw table
+        HeartRateRecord.objects.bulk_create([
+            HeartRateRecord(patient=self.patients[1], bpm=100, recorded_at=datetime(2025, 3, 2, 4, 30, tzinfo=dt_timezone.utc))
+        ])
+
+        response = self._get(**{
+            "place": self.place.id, "bucket": "month",
+            "from": "2025-02-01T00:00:00+05:30", "to": "2025-03-03T00:00:00+05:30",
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [(row["patient"], row["bucket"], row["count"], row["avg"], row["min"], row["max"], row["p50"]) for row in rows],
+            [
+                (self.patients[0].id, "2025-02-01T00:00:00+05:30", 10, 80.0, 70, 90, None),
+                (self.patients[0].id, "2025-03-01T00:00:00+05:30", 120, 120.0, 60, 180, None),
+                (self.patients[1].id, "2025-03-01T00:00:00+05:30", 121, 119.83, 60, 180, None),
+            ],
+        )
+
+
+class WaveformTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+
+    def test_codec_round_trip(self):
+        import numpy as np
+        from apps.records.waveform import decode, encode
+
+        rng = np.random.default_rng(0)
+        trace = 140 + np.cumsum(rng.integers(-3, 4, 10_000))
+        for samples in (trace, np.array([], dtype=np.int64), np.array([0, -7, 2 ** 63 - 1, -2 ** 63, 65535])):
+            packed = encode(samples)
+            np.testing.assert_array_equal(decode(memoryview(packed)), samples)
+        self.assertEqual(len(encode(trace)), 1 + 2 + len(trace) - 1)  # format byte, first sample, 1 byte per step
+        with self.assertRaises(ValueError):
+            decode(encode(trace)[:-1] + b"\x80")
+
+    def test_upload_and_read_range(self):
+        start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        samples = [140 + i % 7 for i in range(4 * 150)]  # 150 s at 4 Hz
+        payload = {"patient": self.patient.id, "start_at": start.isoformat(), "sample_rate": 4, "samples": samples}
+        response = self.client.post(reverse("waveform-list"), payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["segments"], 3)
+        self.assertLess(response.data["data"]["bytes"], len(samples) + 10)
+        # a retried upload does not duplicate segments
+        self.client.post(reverse("waveform-list"), payload, format="json")
+        self.assertEqual(self.patient.waveform_segments.count(), 3)
+
+        response = self.client.get(reverse("waveform-list"), {
+            "patient": self.patient.id,
+            "from": (start + timedelta(seconds=50)).isoformat(),
+            "to": (start + timedelta(seconds=130)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        segments = response.data["data"]["segments"]
+        self.assertEqual([s["start_at"] for s in segments], [start + timedelta(seconds=s) for s in (50, 60, 120)])
+        self.assertEqual(sum((s["samples"] for s in segments), []), samples[200:520])
+
+    def test_upload_rejects_non_integer_samples(self):
+        payload = {"patient": self.patient.id, "start_at": timezone.now().isoformat(), "sample_rate": 4}
+        for samples in ([140, 141.5], [140, "x"], [[140]], [-1]):
+            response = self.client.post(reverse("waveform-list"), {**payload, "samples": samples}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HistoryImportTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from apps.devices.models import Device
+
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+        self.device = Device.objects.create(device_id="EXT-DEV-1", place=self.place)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _write(self, name, text):
+        import os
+
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def _import(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out, err = StringIO(), StringIO()
+        call_command("import_heart_rate_history", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_is_rerunnable_and_skips_alerts(self):
+        from django.core import mail
+        from apps.records.models import HeartRateRollup
+
+        rows = ["patient,bpm,recorded_at,device,sequence"]
+        rows += [f"MRN-7,{130 + i % 3},2025-01-01T10:{i:02d}:00,EXT-DEV-1,{i}" for i in range(30)]
+        rows += ["MRN-7,abc,2025-01-01T11:00:00,,", "MRN-9,80,2025-01-01T11:00:00,,", "MRN-7,80,2025-01-01T11:00:00,,5"]
+        path = self._write("export.csv", "\n".join(rows) + "\n")
+        mapping = self._write("patients.csv", f"external_id,patient_id\nMRN-7,{self.patient.id}\n")
+
+        out, err = self._import(path, "--patient-map", mapping, "--timezone", "Asia/Kolkata", "--chunk-size", "7")
+        self.assertIn("Imported 30 reading(s) from 33 row(s)", out)
+        self.assertIn("3 rejected", out)
+        self.assertEqual(len(err.strip().splitlines()), 3)
+        first = HeartRateRecord.objects.filter(patient=self.patient).order_by("recorded_at").first()
+        self.assertEqual(first.recorded_at.isoformat(), "2025-01-01T04:30:00+00:00")
+        self.assertEqual(first.device, self.device)
+        self.assertEqual(Alert.objects.count(), 0)
+        self.assertEqual(HeartRateRollup.objects.filter(resolution="1d").get().count, 30)
+
+        out, _ = self._import(path, "--patient-map", mapping, "--timezone", "Asia/Kolkata")
+        self.assertIn("Imported 0 reading(s)", out)
+        self.assertIn("30 duplicate(s)", out)
+        self.assertEqual(HeartRateRecord.objects.count(), 30)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_out_of_range_epoch_row_is_rejected(self):
+        rows = ["patient,bpm,recorded_at"]
+        rows += [f"{self.patient.id},80,{1735725600 + i}" for i in range(5)]
+        rows.insert(3, f"{self.patient.id},80,1e20")
+        out, err = self._import(self._write("export.csv", "\n".join(rows) + "\n"), "--chunk-size", "2")
+        self.assertIn("Imported 5 reading(s) from 6 row(s)", out)
+        self.assertIn("1 rejected", out)
+        self.assertIn("out of range", err)
+        self.assertEqual(HeartRateRecord.objects.count(), 5)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_ndjson_import_with_deferred_alerts(self):
+        from django.core import mail
+
+        lines = [
+            f'{{"patient": {self.patient.id}, "bpm": 80, "recorded_at": 1735725600}}',
+            f'{{"patient": {self.patient.id}, "bpm": 190, "recorded_at": "2025-01-01T10:00:05Z"}}',
+            "[1, 2]",
+        ]
+        out, _ = self._import(self._write("export.ndjson", "\n".join(lines)), "--alerts", "defer")
+        self.assertIn("Imported 2 reading(s) from 3 row(s)", out)
+        alert = Alert.objects.get(patient=self.patient)
+        self.assertEqual(alert.peak_bpm, 190)
+        self.assertIsNone(alert.next_escalation_at)
+        self.assertIsNone(alert.last_notified_at)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_deferred_alerts_leave_live_alerts_alone(self):
+        HeartRateRecord.objects.create(patient=self.patient, bpm=190)
+        live = Alert.objects.get()
+
+        lines = [f'{{"patient": {self.patient.id}, "bpm": 195, "recorded_at": "2025-01-01T10:00:0{i}Z"}}' for i in range(3)]
+        self._import(self._write("export.ndjson", "\n".join(lines)), "--alerts", "defer")
+        history = Alert.objects.exclude(pk=live.pk).get()
+        self.assertTrue(history.resolved)
+        self.assertEqual((history.occurrences, history.peak_bpm), (3, 195))
+        self.assertIsNone(history.next_escalation_at)
+        live.refresh_from_db()
+        self.assertEqual((live.resolved, live.occurrences, live.peak_bpm), (False, 1, 190))
+
+        # later live readings still coalesce into the live alert, which keeps escalating
+        HeartRateRecord.objects.create(patient=self.patient, bpm=192)
+        live.refresh_from_db()
+        self.assertEqual((live.occurrences, live.peak_bpm), (2, 192))
+        self.assertIsNotNone(live.next_escalation_at)
+        self.assertEqual(Alert.objects.count(), 2)
+
+
+class HeartRateArchiveTests(APITestCase):
+    def setUp(self):
+        import tempfile
+        from datetime import datetime, timezone as dt_timezone
+        from django.conf import settings
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        storage = {"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": self.tmp.name}}
+        override = self.settings(STORAGES={**settings.STORAGES, "heart_rate_archive": storage})
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+        self.start = datetime(2025, 1, 31, 23, 0, tzinfo=dt_timezone.utc)
+        # two hours of readings every 30 s across a month boundary
+        HeartRateRecord.objects.bulk_create([
+            HeartRateRecord(patient=self.patient, bpm=120 + i % 20, recorded_at=self.start + timedelta(seconds=30 * i))
+            for i in range(240)
+        ])
+        self.recent = HeartRateRecord.objects.create(patient=self.patient, bpm=130)
+
+    def _archive(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("archive_heart_rate_records", "--older-than-days", "30", *args, stdout=out)
+        return out.getvalue()
+
+    def test_archive_moves_old_months_and_reads_them_back(self):
+        from datetime import date
+        from apps.records.models import HeartRateArchive, HeartRateRollup
+        from apps.records.readings import load_readings
+        from apps.records.rollups import rebuild_rollups
+
+        end = self.start + timedelta(hours=2)
+        rebuild_rollups(self.start, end, [self.patient.id])
+        rollups = sorted(HeartRateRollup.objects.values_list("resolution", "bucket_start", "count"))
+        old = HeartRateRecord.objects.filter(recorded_at__lt=end).order_by("recorded_at").first()
+        alert = Alert.objects.create(patient=self.patient, record=old, message="High heart rate detected: 200 bpm")
+        t, bpm = load_readings(self.patient.id, self.start, end)
+
+        self.assertIn("2 patient-month(s)", self._archive("--dry-run"))
+        out = self._archive("--batch-size", "50")
+        self.assertIn("240 readings in archive files, 240 rows deleted", out)
+        self.assertEqual(list(HeartRateRecord.objects.values_list("id", flat=True)), [self.recent.id])
+        self.assertEqual(
+            sorted(HeartRateArchive.objects.values_list("month", "count")),
+            [(date(2025, 1, 1), 120), (date(2025, 2, 1), 120)],
+        )
+        alert.refresh_from_db()
+        self.assertIsNone(alert.record)
+        # deleting archived rows leaves their rollups alone
+        self.assertEqual(sorted(HeartRateRollup.objects.values_list("resolution", "bucket_start", "count")), rollups)
+
+        archived_t, archived_bpm = load_readings(self.patient.id, self.start, end)
+        # SQLite's julianday based epoch is only accurate to a few microseconds
+        self.assertEqual(archived_t.round(3).tolist(), t.round(3).tolist())
+        self.assertEqual(archived_bpm.tolist(), bpm.tolist())
+        response = self.client.get(
+            reverse("heart-rate-record-chart"),
+            {"patient": self.patient.id, "from": self.start.isoformat(), "to": end.isoformat(), "points": 10},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["source_points"], 240)
+
+    def _walk(self, params):
+        """Follow next links from the first page, return every listed id and the last response."""
+        url, ids = reverse("heart-rate-record-list"), []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [row["id"] for row in response.data["data"]["results"]]
+            if not response.data["data"]["next"]:
+                return ids, response
+            response = self.client.get(response.data["data"]["next"])
+
+    def test_list_continues_into_archived_readings(self):
+        other = Patient.objects.create(name="Jane Doe", age=30, gender="F", place=self.place)
+        keys = list(HeartRateRecord.objects.values_list("recorded_at", "id"))
+        self._archive()
+        # a late import into an archived month, waiting for the next archive run
+        late = HeartRateRecord.objects.create(patient=self.patient, bpm=99, recorded_at=self.start + timedelta(days=1))
+        newest_first = [pk for _, pk in sorted(keys + [(late.recorded_at, late.id)], reverse=True)]
+
+        ids, response = self._walk({"patient": self.patient.id, "page_size": 100})
+        self.assertEqual(ids, newest_first)
+        self.assertEqual(response.data["data"]["count"], 242)
+        self.assertEqual(response["X-Archived-Before"], "2025-03-01T00:00:00+00:00")
+        archived = response.data["data"]["results"][-1]
+        self.assertEqual((archived["id"], archived["patient_detail"]["name"]), (newest_first[-1], "John Doe"))
+        response = self.client.get(reverse("heart-rate-record-list"), {"patient": self.patient.id, "ordering": "recorded_at"})
+        self.assertEqual([row["id"] for row in response.data["data"]["results"]], newest_first[::-1][:10])
+
+        ids, response = self._walk({"patient": self.patient.id, "pagination": "cursor", "page_size": 50})
+        self.assertEqual(ids, newest_first)
+        previous = self.client.get(response.data["data"]["previous"])
+        self.assertEqual([row["id"] for row in previous.data["data"]["results"]], newest_first[-92:-42])
+
+        # archived readings are only listed per patient
+        response = self.client.get(reverse("heart-rate-record-list"))
+        self.assertEqual(response.data["data"]["count"], 2)
+        self.assertEqual(response["X-Archived-Before"], "2025-03-01T00:00:00+00:00")
+        self.assertNotIn("X-Archived-Before", self.client.get(reverse("heart-rate-record-list"), {"patient": other.id}))
+
+    def test_merged_records_slice_before_count(self):
+        from apps.records import archive
+
+        self._archive()
+        boundary = archive.archived_before([self.patient.id])
+        queryset = HeartRateRecord.objects.filter(patient=self.patient)
+        self.assertEqual(archive.MergedRecords(queryset, self.patient.id, boundary)[0].id, self.recent.id)
+        merged = archive.MergedRecords(queryset, self.patient.id, boundary)[0:5]
+        self.assertEqual(len(merged), 5)
+        self.assertTrue(all(record._state.adding for record in merged[1:]))
+
+    def test_retrieve_reads_archived_record_of_the_patient(self):
+        other = Patient.objects.create(name="Jane Doe", age=30, gender="F", place=self.place)
+        old = HeartRateRecord.objects.order_by("recorded_at").first()
+        url = reverse("heart-rate-record-detail", args=[old.id])
+        self._archive()
+
+        response = self.client.get(url, {"patient": self.patient.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["data"]["id"], response.data["data"]["bpm"]), (old.id, old.bpm))
+        self.assertEqual(response["X-Archived-Before"], "2025-03-01T00:00:00+00:00")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("archived", response.data["message"])
+        self.assertEqual(response["X-Archived-Before"], "2025-03-01T00:00:00+00:00")
+        for response in (
+            self.client.get(url, {"patient": other.id}),
+            self.client.get(reverse("heart-rate-record-detail", args=[self.recent.id + 1000])),
+        ):
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertNotIn("archived", response.data["message"])
+            self.assertNotIn("X-Archived-Before", response)
+
+    def test_late_readings_are_merged_into_the_month_archive(self):
+        import os
+        from apps.records import archive
+        from apps.records.models import HeartRateArchive, HeartRateRollup
+        from apps.records.rollups import rebuild_rollups
+
+        self._archive()
+        month = HeartRateArchive.objects.get(month=self.start.date().replace(month=2, day=1))
+        late = HeartRateRecord.objects.create(patient=self.patient, bpm=99, recorded_at=self.start + timedelta(days=5))
+        rollups = HeartRateRollup.objects.count()
+        self.assertEqual(rebuild_rollups(self.start, self.start + timedelta(days=5), [self.patient.id]), 0)
+        self.assertEqual(HeartRateRollup.objects.count(), rollups)
+
+        self._archive()
+        merged = HeartRateArchive.objects.get(month=month.month)
+        self.assertEqual(merged.count, month.count + 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, month.path)))
+        rows = archive.read_file(merged)
+        self.assertEqual(len(set(rows["id"].tolist())), merged.count)
+        self.assertEqual(rows["id"][-1], late.id)
+        self.assertFalse(HeartRateRecord.objects.filter(id=late.id).exists())
+
+
+class PartitioningTests(TestCase):
+    def test_monthly_partition_ranges(self):
+        from datetime import date
+        from apps.records import partitioning
+
+        ranges = partitioning.partition_ranges(date(2025, 11, 15), date(2026, 1, 3), partitioning.MONTH)
+        self.assertEqual(ranges, [
+            (date(2025, 11, 1), date(2025, 12, 1)),
+            (date(2025, 12, 1), date(2026, 1, 1)),
+            (date(2026, 1, 1), date(2026, 2, 1)),
+        ])
+
+    def test_partition_name_round_trip(self):
+        from datetime import date
+        from apps.records import partitioning
+
+        for interval in partitioning.INTERVALS:
+            lower = partitioning.partition_start(date(2025, 2, 28), interval)
+            name = partitioning.partition_name(lower, interval)
+            self.assertEqual(partitioning.parse_partition_name(name), (lower, partitioning.next_partition_start(lower, interval)))
+        self.assertIsNone(partitioning.parse_partition_name(partitioning.DEFAULT_PARTITION))
+
+    def test_expired_partitions(self):
+        from datetime import date, datetime, timezone
+        from apps.records import partitioning
+
+        names = [partitioning.partition_name(date(2025, month, 1), partitioning.MONTH) for month in range(1, 7)]
+        now = datetime(2025, 6, 10, tzinfo=timezone.utc)
+        expired = partitioning.expired_partitions(names + [partitioning.DEFAULT_PARTITION], 2, partitioning.MONTH, now)
+        self.assertEqual(expired, names[:3])
+
+
+@skipUnless(connection.vendor == "postgresql", "range partitioning needs PostgreSQL")
+class PartitionedTableTests(TestCase):
+    def setUp(self):
+        from apps.records import partitioning
+
+        self.partitioning = partitioning
+        self.now = timezone.now()
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+        self.old = HeartRateRecord.objects.create(patient=self.patient, bpm=75, recorded_at=self.now - timedelta(days=400))
+        self.recent = HeartRateRecord.objects.create(patient=self.patient, bpm=80, recorded_at=self.now - timedelta(hours=1))
+        self.alert = Alert.objects.create(patient=self.patient, record=self.old, message="Checked by hand")
+        self.old_partition = partitioning.partition_name(
+            partitioning.partition_start(self.old.recorded_at, partitioning.MONTH), partitioning.MONTH
+        )
+        with connection.cursor() as cursor:
+            # the test transaction holds deferred FK checks, DROP ... CASCADE refuses pending trigger events
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        self.assertTrue(partitioning.convert_to_partitioned(partitioning.MONTH))
+
+    def _alert_fks(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM pg_constraint WHERE contype = 'f' "
+                "AND conrelid = 'alerts_alert'::regclass AND confrelid = %s::regclass",
+                [self.partitioning.TABLE],
+            )
+            return cursor.fetchone()[0]
+
+    def test_converted_table_keeps_rows_and_orm_access(self):
+        partitioning = self.partitioning
+        self.assertTrue(partitioning.is_partitioned())
+        self.assertFalse(partitioning.convert_to_partitioned(partitioning.MONTH))
+        partitions = partitioning.list_partitions()
+        self.assertIn(self.old_partition, partitions)
+        self.assertIn(partitioning.DEFAULT_PARTITION, partitions)
+        self.assertEqual(sorted(HeartRateRecord.objects.values_list("id", flat=True)), [self.old.id, self.recent.id])
+        # the legacy table went with CASCADE, and with it the database FK from alerts
+        self.assertEqual(self._alert_fks(), 0)
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.record, self.old)
+
+        # ids keep coming from the new sequence
+        new = HeartRateRecord.objects.create(patient=self.patient, bpm=90)
+        self.assertGreater(new.id, self.recent.id)
+        # an edit that moves a reading to another month moves it to another partition
+        self.recent.bpm = 85
+        self.recent.recorded_at = self.now - timedelta(days=60)
+        self.recent.save()
+        self.assertEqual(HeartRateRecord.objects.get(id=self.recent.id).bpm, 85)
+
+        self.old.delete()
+        self.alert.refresh_from_db()
+        self.assertIsNone(self.alert.record)
+        self.assertEqual(sorted(HeartRateRecord.objects.values_list("id", flat=True)), [self.recent.id, new.id])
+
+    def test_ensure_and_expire_partitions(self):
+        partitioning = self.partitioning
+        current = partitioning.partition_start(self.now, partitioning.MONTH)
+        first = partitioning.next_partition_start(current, partitioning.MONTH)
+        second = partitioning.next_partition_start(first, partitioning.MONTH)
+        created = partitioning.ensure_partitions(ahead=2, interval=partitioning.MONTH)
+        self.assertEqual(created, [partitioning.partition_name(lower, partitioning.MONTH) for lower in (first, second)])
+        self.assertEqual(partitioning.ensure_partitions(ahead=2, interval=partitioning.MONTH), [])
+
+        expired = partitioning.expire_partitions(retain=6, drop=True, interval=partitioning.MONTH)
+        self.assertIn(self.old_partition, expired)
+        self.assertNotIn(self.old_partition, partitioning.list_partitions())
+        self.assertNotIn(partitioning.partition_name(current, partitioning.MONTH), expired)
+        self.assertEqual(list(HeartRateRecord.objects.values_list("id", flat=True)), [self.recent.id])
+        self.alert.refresh_from_db()
+        self.assertIsNone(self.alert.record)
+
+
+@override_settings(HEART_RATE_INGEST_MODE="stream")
+class WriteBehindIngestTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email="admin@test.com", first_name="Admin", last_name="User", password="adminpass"
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.place = Place.objects.create(name="Test Clinic")
+        self.patient = Patient.objects.create(name="John Doe", age=30, gender="M", place=self.place)
+        redis_client.delete(writebehind.STREAM_KEY, writebehind.DEAD_LETTER_KEY)
+
+    def test_bulk_is_queued_then_drained(self):
+        url = reverse("heart-rate-record-bulk")
+        payload = {"records": [{"patient": self.patient.id, "bpm": bpm} for bpm in (70, 150, 80)]}
+        response = self.client.post(url, payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["data"]["queued"], 3)
+        self.assertFalse(HeartRateRecord.objects.exists())
+        lag = writebehind.stream_lag()
+        self.assertEqual((lag["length"], lag["lag"]), (3, 3))
+
+        stats = writebehind.drain(consumer="test")
+        self.assertEqual(stats["created"], 3)
+        self.assertEqual(HeartRateRecord.objects.count(), 3)
+        self.assertEqual(Alert.objects.count(), 1)
+        lag = writebehind.stream_lag()
+        self.assertEqual((lag["lag"], lag["pending"]), (0, 0))
+
+    def test_lag_without_the_redis_7_lag_field(self):
+        from unittest import mock
+
+        writebehind.enqueue_readings([{"patient": self.patient.id, "bpm": bpm} for bpm in (70, 75, 80)])
+        writebehind.ensure_group()
+        redis_client.xreadgroup(writebehind.GROUP, "test", {writebehind.STREAM_KEY: ">"}, count=1)
+        # XINFO GROUPS as Redis 6.2 answers it
+        groups = [
+            {key: value for key, value in group.items() if key not in ("lag", "entries-read")}
+            for group in redis_client.xinfo_groups(writebehind.STREAM_KEY)
+        ]
+        with mock.patch.object(redis_client, "xinfo_groups", return_value=groups):
+            lag = writebehind.stream_lag()
+        self.assertEqual((lag["length"], lag["pending"], lag["lag"]), (3, 1, 2))
+
+    def test_unacknowledged_entries_are_replayed_idempotently(self):
+        writebehind.enqueue_readings([{"patient": self.patient.id, "bpm": bpm} for bpm in (70, 75)])
+        writebehind.ensure_group()
+        # a worker that committed its batch but died before XACK
+        entries = redis_client.xreadgroup(writebehind.GROUP, "dead", {writebehind.STREAM_KEY: ">"})[0][1]
+        writebehind.persist_entries(entries)
+        self.assertEqual(writebehind.stream_lag()["pending"], 2)
+
+        stats = writebehind.drain(consumer="test", claim_idle_ms=0)
+        self.assertEqual((stats["claimed"], stats["created"], stats["duplicates"]), (2, 0, 2))
+        self.assertEqual(HeartRateRecord.objects.count(), 2)
+        self.assertEqual(writebehind.stream_lag()["pending"], 0)
+
+    def test_malformed_and_orphaned_entries_are_dropped(self):
+        writebehind.enqueue_readings([{"patient": 999999, "bpm": 70}])
+        redis_client.xadd(writebehind.STREAM_KEY, {"bpm": "x"})
+        stats = writebehind.drain(consumer="test")
+        self.assertEqual((stats["created"], stats["dropped"]), (0, 2))
+        # handled entries are deleted, not only acknowledged
+        self.assertEqual(writebehind.stream_lag()["length"], 0)
+        self.assertEqual(writebehind.stream_lag()["pending"], 0)
+
+    def test_entry_that_always_fails_is_dead_lettered(self):
+        from unittest import mock
+        from apps.records.services import insert_records
+
+        def insert(records):
+            if any(record.bpm == 66 for record in records):
+                raise RuntimeError("poisoned")
+            return insert_records(records)
+
+        poisoned = writebehind.enqueue_readings([{"patient": self.patient.id, "bpm": bpm} for bpm in (70, 66, 80)])[1]
+        with mock.patch.object(writebehind, "insert_records", side_effect=insert), \
+                mock.patch.object(writebehind, "MAX_DELIVERIES", 2):
+            stats = writebehind.drain(consumer="test", claim_idle_ms=0)
+            self.assertEqual((stats["created"], stats["failed"], stats["dead_lettered"]), (2, 1, 0))
+            self.assertEqual(sorted(HeartRateRecord.objects.values_list("bpm", flat=True)), [70, 80])
+            self.assertEqual(writebehind.stream_lag()["pending"], 1)
+
+            # reclaimed and failing again on its second delivery
+            writebehind.enqueue_readings([{"patient": self.patient.id, "bpm": 90}])
+            stats = writebehind.drain(consumer="test", claim_idle_ms=0)
+            self.assertEqual((stats["claimed"], stats["created"], stats["dead_lettered"]), (1, 1, 1))
+
+        lag = writebehind.stream_lag()
+        self.assertEqual((lag["length"], lag["pending"]), (0, 0))
+        [(_, fields)] = redis_client.xrange(writebehind.DEAD_LETTER_KEY)
+        self.assertEqual((fields["entry_id"], fields["bpm"], fields["deliveries"]), (poisoned, "66", "2"))
+        self.assertIn("poisoned", fields["error"])
+        self.assertEqual(HeartRateRecord.objects.count(), 3)
+
+    def test_full_backlog_is_refused_not_trimmed(self):
+        from unittest import mock
+
+        url = reverse("heart-rate-record-bulk")
+        payload = {"records": [{"patient": self.patient.id, "bpm": bpm} for bpm in (70, 75)]}
+        with mock.patch.object(writebehind, "MAX_BACKLOG", 3):
+            self.assertEqual(self.client.post(url, payload, format="json").status_code, status.HTTP_202_ACCEPTED)
+            response = self.client.post(url, payload, format="json")
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response["Retry-After"], str(writebehind.RETRY_AFTER_SECONDS))
+            self.assertEqual(writebehind.stream_lag()["length"], 2)
+
+            writebehind.drain(consumer="test")
+            self.assertEqual(self.client.post(url, payload, format="json").status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(HeartRateRecord.objects.count(), 2)
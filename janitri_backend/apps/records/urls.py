@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import HeartRateRecordViewSet
+from .views import HeartRateRecordViewSet, WaveformViewSet
 
 router = DefaultRouter()
 router.register(r'heart-rate-record', HeartRateRecordViewSet, basename='heart-rate-record')
+router.register(r'waveform', WaveformViewSet, basename='waveform')
 
 urlpatterns = [
     path('', include(router.urls))
@@ -1,21 +1,86 @@
+import itertools
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
 from utils.responses import success_response, error_response
-from .models import HeartRateRecord
-from .serializers import HeartRateRecordSerializer
+from .models import HeartRateRecord, WaveformSegment
+from .serializers import (
+    HeartRateRecordSerializer,
+    HeartRateRecordItemSerializer,
+    HeartRateRecordBulkSerializer,
+    HeartRateSeriesQuerySerializer,
+    HeartRateChartQuerySerializer,
+    HeartRateAnalyticsQuerySerializer,
+    HeartRateAggregateQuerySerializer,
+    HeartRateSeriesPointSerializer,
+    WaveformUploadSerializer,
+    WaveformQuerySerializer,
+)
+from .services import validate_readings, bulk_create_records, BULK_MAX_ITEMS
+from .rollups import RESOLUTIONS, get_series, pick_resolution
+from .analytics import get_analytics
+from .downsampling import downsample
+from .readings import load_readings, to_datetimes
+from . import aggregation, archive, waveform, writebehind
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
+from django.db.models import prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.decorators import action
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from apps.common.pagination import StandardResultsSetPagination
+from apps.common.pagination import StandardResultsSetPagination, KeysetPaginationMixin
+from apps.common.mixins import EagerLoadingMixin
+from apps.common.serializers import FIELD_SELECTION_PARAMETERS, get_eager_lookups, get_field_selection
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
+SERIES_MAX_POINTS = 5000
+ARCHIVED_BEFORE_HEADER = "X-Archived-Before"
+ARCHIVED_BEFORE_RESPONSE = OpenApiParameter(
+    name=ARCHIVED_BEFORE_HEADER,
+    location=OpenApiParameter.HEADER,
+    response=True,
+    type=str,
+    description=(
+        "Set when readings were archived: records recorded before this time were moved from "
+        "the table to archive files."
+    ),
+)
 
-class HeartRateRecordViewSet(viewsets.ModelViewSet):
+
+def mark_archive_boundary(response, patient_ids=None):
+    """Set X-Archived-Before when readings of these patients (all if None) were archived."""
+    archived = archive.archived_before(patient_ids)
+    if archived is not None:
+        response[ARCHIVED_BEFORE_HEADER] = archived.isoformat()
+    return response
+
+
+def maybe_archived_response():
+    """404 for an id inside an archive's id range, asked for without its patient."""
+    archived = archive.archived_before()
+    response = error_response(
+        message="Heart rate record not found, it may be archived: pass ?patient=<id> to read it",
+        status=status.HTTP_404_NOT_FOUND,
+    )
+    response[ARCHIVED_BEFORE_HEADER] = archived.isoformat()
+    return response
+
+
+def backlog_full_response(error):
+    """503 with Retry-After while the write-behind stream is at its backlog limit."""
+    response = error_response(str(error), status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response["Retry-After"] = str(writebehind.RETRY_AFTER_SECONDS)
+    return response
+
+
+class HeartRateRecordViewSet(EagerLoadingMixin, KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = HeartRateRecord.objects.all().order_by("-recorded_at")
     serializer_class = HeartRateRecordSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ("-recorded_at", "-id")
     filter_backends = [DjangoFilterBackend, OrderingFilter]
 
     filterset_fields = ['patient']  # filter by patient id
@@ -24,29 +89,108 @@ class HeartRateRecordViewSet(viewsets.ModelViewSet):
 
     
 
+    def archive_scope(self):
+        """(patient id, archive boundary) when the filtered patient has archived readings, else None."""
+        if not hasattr(self, "_archive_scope"):
+            patient = self.request.query_params.get("patient", "")
+            boundary = archive.archived_before([int(patient)]) if patient.isdigit() else None
+            self._archive_scope = (int(patient), boundary) if boundary else None
+        return self._archive_scope
+
+    def load_archived_relations(self, records):
+        """Attach what the serializer renders to records read from archive files."""
+        archived = [record for record in records if record._state.adding]
+        if archived:
+            selects, prefetches = get_eager_lookups(
+                self.get_serializer_class(), selection=get_field_selection(self.request)
+            )
+            prefetch_related_objects(archived, *selects, *prefetches)
+        return records
+
+    def merge_keyset_page(self, page, after, descending, limit):
+        """Keyset pages of one patient continue into the archived readings."""
+        scope = self.archive_scope()
+        if scope is None:
+            return page
+        patient_id, boundary = scope
+        if descending and len(page) == limit and page[-1].recorded_at >= boundary:
+            return page  # archived readings are all older than this page
+        archived = list(itertools.islice(archive.iter_records(patient_id, descending, after), limit))
+        ids = {record.id for record in page}
+        page = page + [record for record in archived if record.id not in ids]
+        page.sort(key=lambda record: (record.recorded_at, record.id), reverse=descending)
+        return page[:limit]
+
     @extend_schema(
+        description=(
+            "Raw heart rate records. With a patient filter and the default recorded_at ordering, "
+            "readings moved out by the archive job are read back from their archive files and "
+            "listed after (or, oldest first, before) the table's rows. Without a patient filter, "
+            "or ordered by bpm, archived readings are not listed and results stop at the "
+            "X-Archived-Before header."
+        ),
         parameters=[
+            *FIELD_SELECTION_PARAMETERS,
+            ARCHIVED_BEFORE_RESPONSE,
             OpenApiParameter(
                 name="ordering",
                 description="Order by: bpm, recorded_at. Use '-' prefix for descending.",
                 required=False,
                 type=str,
             ),
+            OpenApiParameter(
+                name="pagination",
+                description="Use 'cursor' for keyset pagination (no count, constant cost for deep pages).",
+                required=False,
+                type=str,
+                enum=["page", "cursor"],
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Cursor from a previous next/previous link (keyset pagination).",
+                required=False,
+                type=str,
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.filter_queryset(self.get_queryset())
+            scope = self.archive_scope()
+            ordering = request.query_params.get("ordering", "-recorded_at").strip() or "-recorded_at"
+            if scope and not self.use_keyset_pagination() and ordering.lstrip("-") == "recorded_at":
+                queryset = archive.MergedRecords(queryset, *scope, descending=ordering.startswith("-"))
             page = self.paginate_queryset(queryset)
             if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-
-            serializer = self.get_serializer(queryset, many=True)
-            return success_response("Heart rate records retrieved successfully", serializer.data)
+                serializer = self.get_serializer(self.load_archived_relations(page), many=True)
+                response = self.get_paginated_response(serializer.data)
+            else:
+                serializer = self.get_serializer(self.load_archived_relations(list(queryset)), many=True)
+                response = success_response("Heart rate records retrieved successfully", serializer.data)
+            patient = request.query_params.get("patient", "")
+            return mark_archive_boundary(response, [int(patient)] if patient.isdigit() else None)
+        except NotFound as e:
+            return error_response(str(e.detail), status=404)
         except Exception as e:
             return error_response("Error retrieving heart rate records", str(e), status=500)
 
+    @extend_schema(
+        description=(
+            "One raw heart rate record. An archived record is read back from its archive file when "
+            "the patient is given (?patient=<id>); without it such ids answer 404 with the "
+            "X-Archived-Before header. Archived records cannot be updated or deleted."
+        ),
+        parameters=[
+            *FIELD_SELECTION_PARAMETERS,
+            ARCHIVED_BEFORE_RESPONSE,
+            OpenApiParameter(
+                name="patient",
+                description="Patient of the record, needed to read an archived record.",
+                required=False,
+                type=int,
+            ),
+        ],
+    )
     def retrieve(self, request, *args, **kwargs):
         try:
             record = self.get_object()
@@ -55,8 +199,22 @@ class HeartRateRecordViewSet(viewsets.ModelViewSet):
                 message="Heart rate record retrieved successfully",
                 data=serializer.data,
             )
-        except ObjectDoesNotExist:
-            return error_response(message="Heart rate record not found", status=status.HTTP_404_NOT_FOUND)
+        except (ObjectDoesNotExist, Http404):
+            record_id = str(kwargs.get(self.lookup_field, ""))
+            patient = request.query_params.get("patient", "")
+            record = None
+            if record_id.isdigit() and archive.may_hold(int(record_id)):
+                if not patient.isdigit():
+                    return maybe_archived_response()
+                record = archive.find_record(int(record_id), int(patient))
+            if record is None:
+                return error_response(message="Heart rate record not found", status=status.HTTP_404_NOT_FOUND)
+            serializer = self.get_serializer(self.load_archived_relations([record])[0])
+            response = success_response(
+                message="Heart rate record retrieved from the archive",
+                data=serializer.data,
+            )
+            return mark_archive_boundary(response, [record.patient_id])
         except Exception as e:
             return error_response(message=str(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -68,12 +226,24 @@ class HeartRateRecordViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         try:
+            if writebehind.enabled():
+                data = {"patient": serializer.validated_data["patient"].id, "bpm": serializer.validated_data["bpm"]}
+                if serializer.validated_data.get("recorded_at"):
+                    data["recorded_at"] = serializer.validated_data["recorded_at"]
+                ingest_key = writebehind.enqueue_readings([data])[0]
+                return success_response(
+                    message="Heart rate queued",
+                    data={**data, "ingest_key": ingest_key},
+                    status=status.HTTP_202_ACCEPTED,
+                )
             serializer.save()
             return success_response(
                 message="Heart rate recorded successfully",
                 data=serializer.data,
                 status=status.HTTP_201_CREATED,
             )
+        except writebehind.IngestBacklogFull as e:
+            return backlog_full_response(e)
         except Exception as e:
             return error_response(message=str(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -123,3 +293,290 @@ class HeartRateRecordViewSet(viewsets.ModelViewSet):
             return error_response(message="Heart rate record not found", status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return error_response(message=str(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @extend_schema(
+        description=(
+            "Record a batch of heart rate readings in one call. Valid readings are inserted "
+            "together; invalid ones are reported by index without failing the batch. "
+            "Readings may carry their measurement time (recorded_at) and a device + sequence "
+            "pair, which requires recorded_at; a reading already stored with the same device, "
+            "sequence and recorded_at is skipped and counted in `duplicates`, so retried batches "
+            "are safe. "
+            "In stream ingest mode readings are queued and the response is 202, or 503 with "
+            "Retry-After while the queue is at HEART_RATE_INGEST_MAX_BACKLOG."
+        ),
+        request=HeartRateRecordBulkSerializer,
+    )
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        serializer = HeartRateRecordBulkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return error_response("Validation error", serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        items = serializer.validated_data["records"]
+        if len(items) > BULK_MAX_ITEMS:
+            return error_response(
+                f"A batch can contain at most {BULK_MAX_ITEMS} records",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        readings, errors = validate_readings(items, HeartRateRecordItemSerializer)
+        if not readings:
+            return error_response("No valid heart rate records in batch", errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if writebehind.enabled():
+                keys = writebehind.enqueue_readings([data for _, data in readings])
+                return success_response(
+                    message="Heart rate records queued",
+                    data={"queued": len(keys), "failed": len(errors), "ingest_keys": keys, "errors": errors},
+                    status=status.HTTP_202_ACCEPTED,
+                )
+            records = bulk_create_records([data for _, data in readings])
+            return success_response(
+                message="Heart rate records recorded successfully",
+                data={
+                    "created": len(records),
+                    "duplicates": len(readings) - len(records),
+                    "failed": len(errors),
+                    "ids": [record.id for record in records],
+                    "errors": errors,
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        except writebehind.IngestBacklogFull as e:
+            return backlog_full_response(e)
+        except Exception as e:
+            return error_response(message=str(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @extend_schema(
+        description=(
+            "Chart series for one patient served from the 1m/1h/1d rollups. "
+            "If resolution is omitted the finest one that fits the range is used."
+        ),
+        parameters=[HeartRateSeriesQuerySerializer],
+    )
+    @action(detail=False, methods=["get"], url_path="series")
+    def series(self, request):
+        query = HeartRateSeriesQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return error_response("Validation error", query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = query.validated_data
+        start, end = params["start"], params["end"]
+        resolution = params.get("resolution") or pick_resolution(start, end)
+        if (end - start) / RESOLUTIONS[resolution] > SERIES_MAX_POINTS:
+            return error_response(
+                f"Range too large for resolution {resolution}, at most {SERIES_MAX_POINTS} points are returned",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            points = get_series(params["patient"], start, end, resolution)
+            return success_response(
+                message="Heart rate series retrieved successfully",
+                data={
+                    "patient": params["patient"],
+                    "resolution": resolution,
+                    "from": start,
+                    "to": end,
+                    "points": HeartRateSeriesPointSerializer(points, many=True).data,
+                },
+            )
+        except Exception as e:
+            return error_response("Error retrieving heart rate series", str(e), status=500)
+
+    @extend_schema(
+        description=(
+            "Raw readings of one patient reduced to at most `points` points for charting. "
+            "Points are real readings picked by LTTB (default) or min/max per time bucket, "
+            "so spikes survive downsampling."
+        ),
+        parameters=[HeartRateChartQuerySerializer],
+        responses={200: dict},
+    )
+    @action(detail=False, methods=["get"], url_path="chart")
+    def chart(self, request):
+        query = HeartRateChartQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return error_response("Validation error", query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = query.validated_data
+        try:
+            t, bpm = load_readings(params["patient"], params["start"], params["end"])
+            keep = downsample(t, bpm, params["points"], params["method"])
+            times = to_datetimes(t[keep])
+            return success_response(
+                message="Heart rate chart retrieved successfully",
+                data={
+                    "patient": params["patient"],
+                    "from": params["start"],
+                    "to": params["end"],
+                    "method": params["method"],
+                    "source_points": len(t),
+                    "points": [{"t": when, "bpm": int(value)} for when, value in zip(times, bpm[keep].tolist())],
+                },
+            )
+        except Exception as e:
+            return error_response("Error retrieving heart rate chart", str(e), status=500)
+
+    @extend_schema(
+        description=(
+            "Statistics and variability of one patient's readings: mean, std, percentiles, "
+            "baseline, short and long term variability, accelerations / decelerations and "
+            "seconds below, within and above the normal range. The window is widened to whole "
+            "minutes and results are cached per patient and window."
+        ),
+        parameters=[HeartRateAnalyticsQuerySerializer],
+        responses={200: dict},
+    )
+    @action(detail=False, methods=["get"], url_path="analytics")
+    def analytics(self, request):
+        query = HeartRateAnalyticsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return error_response("Validation error", query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = query.validated_data
+        try:
+            data = get_analytics(params["patient"], params["start"], params["end"])
+            return success_response(
+                message="Heart rate analytics retrieved successfully",
+                data={"patient": params["patient"], **data},
+            )
+        except Exception as e:
+            return error_response("Error retrieving heart rate analytics", str(e), status=500)
+
+    @extend_schema(
+        description=(
+            "Hourly, daily, ... (or fixed `bucket_seconds`) count, avg, min, max and percentiles "
+            "of bpm per patient, per place or overall, computed by PostgreSQL in one query and "
+            "streamed as NDJSON (default) or CSV. Filter by place, patient (repeatable) and "
+            "from / to. Archived months are answered from the daily rollups for day, week and "
+            "month buckets, counting whole days, with null percentiles; finer buckets reaching "
+            "into archived months are rejected."
+        ),
+        parameters=[HeartRateAggregateQuerySerializer],
+        responses={(200, "application/x-ndjson"): str, (200, "text/csv"): str},
+    )
+    @action(detail=False, methods=["get"], url_path="aggregate")
+    def aggregate(self, request):
+        query = HeartRateAggregateQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return error_response("Validation error", query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        archived = aggregation.archived_before(params.get("patient"), params.get("place"))
+        if archived is not None and params["start"] < archived and (
+            params.get("bucket_seconds") or params["bucket"] not in aggregation.ROLLUP_UNITS
+        ):
+            return error_response(
+                "Validation error",
+                {"from": [f"Readings before {archived.isoformat()} are archived, use a day, week or month bucket."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if connection.vendor != "postgresql":
+            return error_response("Aggregation requires PostgreSQL", status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        try:
+            rows = aggregation.aggregate_rows(
+                params["start"],
+                params["end"],
+                unit=params["bucket"],
+                seconds=params.get("bucket_seconds"),
+                patients=params.get("patient"),
+                place=params.get("place"),
+                group=params["group_by"],
+                percentiles=params["percentiles"],
+                archived=archived,
+            )
+            # run the query now so database errors are reported as such, not as a cut off stream
+            first = next(rows, None)
+            rows = itertools.chain([first], rows) if first is not None else iter(())
+            if params["output"] == aggregation.CSV:
+                body = aggregation.to_csv(rows, aggregation.fieldnames(params["group_by"], params["percentiles"]))
+            else:
+                body = aggregation.to_ndjson(rows)
+            response = StreamingHttpResponse(body, content_type=aggregation.OUTPUTS[params["output"]])
+            response["X-Accel-Buffering"] = "no"
+            return response
+        except Exception as e:
+            return error_response("Error aggregating heart rate records", str(e), status=500)
+
+    @extend_schema(
+        description=(
+            "Backlog of the Redis write-behind ingest stream: unread entries (lag), "
+            "unacknowledged entries (pending) and age of the oldest waiting reading."
+        ),
+        responses={200: dict},
+    )
+    @action(detail=False, methods=["get"], url_path="ingest-status")
+    def ingest_status(self, request):
+        try:
+            mode = writebehind.STREAM if writebehind.enabled() else writebehind.SYNC
+            data = {"mode": mode, **writebehind.stream_lag()}
+            return success_response(message="Ingest status retrieved successfully", data=data)
+        except Exception as e:
+            return error_response("Error retrieving ingest status", str(e), status=500)
+
+
+class WaveformViewSet(viewsets.ViewSet):
+    """High-frequency heart rate samples stored as packed fixed-duration segments."""
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        description=(
+            "Store a run of evenly spaced samples starting at start_at. Samples are split into "
+            "segments of WAVEFORM_SEGMENT_SECONDS and packed as delta/varint encoded bytes. "
+            "Re-sending a run that was already stored is a no-op."
+        ),
+        request=WaveformUploadSerializer,
+        responses={201: dict},
+    )
+    def create(self, request):
+        serializer = WaveformUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return error_response("Validation error", serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        try:
+            segments = waveform.build_segments(data["patient"].id, data["start_at"], data["sample_rate"], data["samples"])
+            WaveformSegment.objects.bulk_create(segments, ignore_conflicts=True)
+            return success_response(
+                message="Waveform stored successfully",
+                data={
+                    "patient": data["patient"].id,
+                    "segments": len(segments),
+                    "samples": len(data["samples"]),
+                    "bytes": sum(len(segment.data) for segment in segments),
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        except Exception as e:
+            return error_response("Error storing waveform", str(e), status=500)
+
+    @extend_schema(
+        description="Decoded samples of one patient in [from, to), one entry per stored segment.",
+        parameters=[WaveformQuerySerializer],
+        responses={200: dict},
+    )
+    def list(self, request):
+        query = WaveformQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return error_response("Validation error", query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = query.validated_data
+        try:
+            segments = waveform.load_range(params["patient"], params["start"], params["end"])
+            return success_response(
+                message="Waveform retrieved successfully",
+                data={
+                    "patient": params["patient"],
+                    "from": params["start"],
+                    "to": params["end"],
+                    "segments": [
+                        {"start_at": start_at, "sample_rate": sample_rate, "samples": samples.tolist()}
+                        for start_at, sample_rate, samples in segments
+                    ],
+                },
+            )
+        except Exception as e:
+            return error_response("Error retrieving waveform", str(e), status=500)
@@ -0,0 +1,129 @@
+# apps/records/vitals.py
+"""
+Latest heart rate per patient, cached in one Redis hash per place.
+
+Each hash maps patient id -> "<recorded_at ms>:<bpm>". Writes go through a
+Lua script that only replaces an entry with a reading at least as recent,
+so out-of-order batches and replays never move a patient backwards. A
+"_warm" field marks hashes that were filled from the database; a hash
+without it is rebuilt on the next read.
+"""
+
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Exists, OuterRef, Subquery
+
+from utils.redis_client import redis_client
+from .models import HeartRateRecord
+from apps.alerts.models import Alert
+from apps.patients.models import Patient
+
+logger = logging.getLogger(__name__)
+
+KEY = "vitals:place:{}"
+WARM_FIELD = "_warm"
+
+_SET_IF_NEWER = redis_client.register_script("""
+for i = 1, #ARGV, 3 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or tonumber(string.match(current, '^(%d+)')) <= tonumber(ARGV[i + 1]) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1] .. ':' .. ARGV[i + 2])
+    end
+end
+return 1
+""")
+
+
+def _ms(value):
+    return int(value.timestamp() * 1000)
+
+
+def _set_latest(place_id, latest, warm=False):
+    """latest: {patient_id: (recorded_at, bpm)}"""
+    args = []
+    for patient_id, (recorded_at, bpm) in latest.items():
+        args.extend([patient_id, _ms(recorded_at), bpm])
+    if args:
+        _SET_IF_NEWER(keys=[KEY.format(place_id)], args=args)
+    if warm:
+        redis_client.hset(KEY.format(place_id), WARM_FIELD, 1)
+
+
+def update_latest_vitals(records):
+    """
+    Fold a batch of saved readings into the per-place hashes (one query, one
+    script call per place). Returns {patient_id: place_id} of the batch.
+    """
+    latest = {}
+    for record in records:
+        current = latest.get(record.patient_id)
+        if current is None or current[0] <= record.recorded_at:
+            latest[record.patient_id] = (record.recorded_at, record.bpm)
+    if not latest:
+        return {}
+
+    place_of = dict(Patient.objects.filter(id__in=latest).values_list("id", "place_id"))
+    by_place = {}
+    for patient_id, place_id in place_of.items():
+        by_place.setdefault(place_id, {})[patient_id] = latest[patient_id]
+    for place_id, place_latest in by_place.items():
+        _set_latest(place_id, place_latest)
+    return place_of
+
+
+def invalidate_place_vitals(place_id):
+    redis_client.delete(KEY.format(place_id))
+
+
+def warm_place_vitals(place_id):
+    """Load the latest reading of every patient in a place from the database."""
+    newest = HeartRateRecord.objects.filter(patient=OuterRef("pk")).order_by("-recorded_at", "-id")
+    rows = (
+        Patient.objects.filter(place_id=place_id)
+        .annotate(bpm=Subquery(newest.values("bpm")[:1]), recorded_at=Subquery(newest.values("recorded_at")[:1]))
+        .filter(recorded_at__isnull=False)
+        .values_list("id", "recorded_at", "bpm")
+    )
+    _set_latest(place_id, {patient_id: (recorded_at, bpm) for patient_id, recorded_at, bpm in rows}, warm=True)
+
+
+def get_place_vitals(place_id):
+    """{patient_id: (recorded_at, bpm)} for the patients of a place that have readings."""
+    cached = redis_client.hgetall(KEY.format(place_id))
+    if WARM_FIELD not in cached:
+        warm_place_vitals(place_id)
+        cached = redis_client.hgetall(KEY.format(place_id))
+
+    vitals = {}
+    for patient_id, value in cached.items():
+        if patient_id == WARM_FIELD:
+            continue
+        ms, bpm = value.split(":")
+        vitals[int(patient_id)] = (datetime.fromtimestamp(int(ms) / 1000, tz=dt_timezone.utc), int(bpm))
+    return vitals
+
+
+def latest_vitals_for_place(place_id):
+    """
+    One row per patient of the place with their latest bpm, its time and
+    whether they have an unresolved alert. One query plus one Redis read.
+    """
+    patients = (
+        Patient.objects.filter(place_id=place_id)
+        .annotate(open_alert=Exists(Alert.objects.filter(patient=OuterRef("pk"), resolved=False)))
+        .order_by("name", "id")
+        .values("id", "name", "open_alert")
+    )
+    vitals = get_place_vitals(place_id)
+    rows = []
+    for patient in patients:
+        recorded_at, bpm = vitals.get(patient["id"], (None, None))
+        rows.append({
+            "patient": patient["id"],
+            "name": patient["name"],
+            "bpm": bpm,
+            "recorded_at": recorded_at,
+            "open_alert": patient["open_alert"],
+        })
+    return rows
@@ -0,0 +1,116 @@
+# apps/records/waveform.py
+"""
+Packed storage of high-frequency heart rate waveforms.
+
+A segment's samples are stored as one byte string: a format byte, then
+every sample as the zigzag encoded difference to the previous one (the
+first to 0) in LEB128 varint form. Heart rate moves a few bpm between
+samples, so most samples take a single byte against 60-80 bytes for a
+HeartRateRecord row.
+
+encode / decode are vectorised with NumPy. decode reads its input through
+np.frombuffer, so bytes, bytearray and memoryview (what psycopg2 returns
+for bytea) are decoded without copying the buffer first.
+"""
+
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from .models import WaveformSegment
+
+FORMAT_VERSION = 1
+MAX_VARINT_BYTES = 10
+SEGMENT_SECONDS = getattr(settings, "WAVEFORM_SEGMENT_SECONDS", 60)
+
+_SHIFTS = (7 * np.arange(MAX_VARINT_BYTES)).astype(np.uint64)
+
+
+def encode(samples):
+    """Pack a 1-d sequence of integers into bytes."""
+    samples = np.asarray(samples)
+    if samples.ndim != 1 or (samples.size and samples.dtype.kind not in "iu"):
+        raise ValueError("Samples must be a 1-d array of integers.")
+    deltas = np.diff(samples.astype(np.int64), prepend=np.int64(0))
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+
+    sizes = np.ones(len(zigzag), dtype=np.int64)
+    for shift in _SHIFTS[1:]:
+        sizes += zigzag >= (np.uint64(1) << shift)
+    offsets = np.cumsum(sizes) - sizes
+    owner = np.repeat(np.arange(len(zigzag)), sizes)
+    position = np.arange(len(owner)) - offsets[owner]
+
+    out = ((zigzag[owner] >> _SHIFTS[position]) & np.uint64(0x7F)).astype(np.uint8)
+    out[position < sizes[owner] - 1] |= 0x80
+    return bytes([FORMAT_VERSION]) + out.tobytes()
+
+
+def decode(data):
+    """Unpack bytes produced by encode into an int64 array."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not len(buffer) or buffer[0] != FORMAT_VERSION:
+        raise ValueError("Unknown waveform format.")
+    buffer = buffer[1:]
+    if not len(buffer):
+        return np.empty(0, dtype=np.int64)
+    if buffer[-1] & 0x80:
+        raise ValueError("Truncated waveform data.")
+
+    ends = np.flatnonzero(buffer < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    sizes = ends - starts + 1
+    if sizes.max() > MAX_VARINT_BYTES:
+        raise ValueError("Corrupt waveform data.")
+    position = np.arange(len(buffer)) - np.repeat(starts, sizes)
+    zigzag = np.add.reduceat((buffer & 0x7F).astype(np.uint64) << _SHIFTS[position], starts)
+
+    deltas = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+    return np.cumsum(deltas)
+
+
+def build_segments(patient_id, start_at, sample_rate, samples):
+    """Split samples starting at start_at into unsaved segments of SEGMENT_SECONDS each."""
+    samples = np.asarray(samples)
+    per_segment = max(int(SEGMENT_SECONDS * sample_rate + 1e-9), 1)
+    segments = []
+    for first in range(0, len(samples), per_segment):
+        block = samples[first:first + per_segment]
+        segment_start = start_at + timedelta(seconds=first / sample_rate)
+        segments.append(WaveformSegment(
+            patient_id=patient_id,
+            start_at=segment_start,
+            end_at=segment_start + timedelta(seconds=len(block) / sample_rate),
+            sample_rate=sample_rate,
+            sample_count=len(block),
+            data=encode(block),
+        ))
+    return segments
+
+
+def load_range(patient_id, start, end):
+    """
+    Decoded samples of a patient in [start, end), one entry per stored
+    segment: [(first sample time, sample rate, int64 samples), ...].
+    """
+    segments = (
+        WaveformSegment.objects.filter(
+            patient_id=patient_id,
+            # bounds start_at on both sides so the (patient, start_at) index is used
+            start_at__gte=start - timedelta(seconds=SEGMENT_SECONDS),
+            start_at__lt=end,
+            end_at__gt=start,
+        )
+        .order_by("start_at")
+        .values_list("start_at", "sample_rate", "data")
+    )
+    result = []
+    for start_at, sample_rate, data in segments:
+        samples = decode(data)
+        first = max(math.ceil((start - start_at).total_seconds() * sample_rate), 0)
+        last = min(math.ceil((end - start_at).total_seconds() * sample_rate), len(samples))
+        if first < last:
+            result.append((start_at + timedelta(seconds=first / sample_rate), sample_rate, samples[first:last]))
+    return result
@@ -0,0 +1,286 @@
+# apps/records/writebehind.py
+"""
+Optional Redis-buffered write-behind ingest for heart rate readings.
+
+With HEART_RATE_INGEST_MODE = "stream" the API appends readings to a Redis
+stream and answers 202 straight away. A Celery task reads the stream
+through a consumer group and writes large batches into HeartRateRecord,
+running the usual post-ingest hooks (rollups, alerts) per batch.
+
+Delivery is at-least-once: entries are acknowledged only after their batch
+commits, and entries left pending by a crashed worker are reclaimed after
+HEART_RATE_INGEST_CLAIM_IDLE_MS. Replays are harmless because every row
+carries its stream entry id in ingest_key, which is unique, and batches are
+inserted with ON CONFLICT DO NOTHING (see services.insert_records).
+
+A batch that fails is retried one entry at a time, so one bad entry does
+not hold back the rest. An entry that still fails stays pending and is
+reclaimed like any other; once it has been delivered MAX_DELIVERIES times
+it is copied to the DEAD_LETTER_KEY stream (with its entry id and the
+error) and acknowledged.
+
+Entries are deleted once acknowledged, so the stream only holds readings
+that still have to be written. It is never trimmed: when it holds
+MAX_BACKLOG entries (e.g. workers down) enqueue_readings raises
+IngestBacklogFull and the API answers 503 instead of dropping readings.
+"""
+
+import logging
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import ResponseError
+
+from utils.redis_client import redis_client
+from .models import HeartRateRecord
+from .services import insert_records, on_records_created
+from apps.devices.models import Device
+from apps.patients.models import Patient
+
+logger = logging.getLogger(__name__)
+
+SYNC = "sync"
+STREAM = "stream"
+
+STREAM_KEY = getattr(settings, "HEART_RATE_INGEST_STREAM", "heart-rate:ingest")
+GROUP = getattr(settings, "HEART_RATE_INGEST_GROUP", "heart-rate-writers")
+DRAIN_BATCH = getattr(settings, "HEART_RATE_INGEST_DRAIN_BATCH", 2000)
+DRAIN_MAX_BATCHES = getattr(settings, "HEART_RATE_INGEST_DRAIN_MAX_BATCHES", 50)
+CLAIM_IDLE_MS = getattr(settings, "HEART_RATE_INGEST_CLAIM_IDLE_MS", 60000)
+MAX_BACKLOG = getattr(settings, "HEART_RATE_INGEST_MAX_BACKLOG", 1000000)
+MAX_DELIVERIES = getattr(settings, "HEART_RATE_INGEST_MAX_DELIVERIES", 5)
+DEAD_LETTER_KEY = getattr(settings, "HEART_RATE_INGEST_DEAD_LETTER_STREAM", "heart-rate:ingest:dead")
+RETRY_AFTER_SECONDS = 30
+
+
+class IngestBacklogFull(Exception):
+    """The stream holds MAX_BACKLOG unwritten readings, the client should retry later."""
+
+
+def enabled():
+    return getattr(settings, "HEART_RATE_INGEST_MODE", SYNC) == STREAM
+
+
+def consumer_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def ensure_group(client=redis_client):
+    try:
+        client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+# ---------------- producer ----------------
+def enqueue_readings(readings, client=redis_client):
+    """
+    Append readings ({"patient", "bpm"[, "recorded_at", "device",
+    "sequence"]}) to the stream with one pipelined round trip. recorded_at
+    defaults to now, so the reading keeps its arrival time however long it
+    waits. Returns the entry ids. Raises IngestBacklogFull when the backlog
+    is at MAX_BACKLOG.
+    """
+    if client.xlen(STREAM_KEY) + len(readings) > MAX_BACKLOG:
+        raise IngestBacklogFull(f"Ingest backlog is full, retry in {RETRY_AFTER_SECONDS} seconds.")
+    now = timezone.now()
+    pipe = client.pipeline(transaction=False)
+    for reading in readings:
+        fields = {
+            "patient": reading["patient"],
+            "bpm": reading["bpm"],
+            "recorded_at": (reading.get("recorded_at") or now).isoformat(),
+        }
+        for name in ("device", "sequence"):
+            if reading.get(name) is not None:
+                fields[name] = reading[name]
+        # no MAXLEN: trimming would drop readings nobody has written yet
+        pipe.xadd(STREAM_KEY, fields)
+    return pipe.execute()
+
+
+# ---------------- consumer ----------------
+def parse_entry(entry_id, fields):
+    """Build an unsaved HeartRateRecord from a stream entry, or raise ValueError."""
+    if not fields:
+        raise ValueError("Entry has no fields.")
+    recorded_at = parse_datetime(fields.get("recorded_at", ""))
+    if recorded_at is None:
+        raise ValueError("Invalid recorded_at.")
+    return HeartRateRecord(
+        ingest_key=entry_id,
+        patient_id=int(fields["patient"]),
+        bpm=int(fields["bpm"]),
+        recorded_at=recorded_at,
+        device_id=int(fields["device"]) if "device" in fields else None,
+        sequence=int(fields["sequence"]) if "sequence" in fields else None,
+    )
+
+
+def persist_entries(entries):
+    """
+    Write a batch of stream entries. Malformed entries and readings for
+    deleted patients are dropped, entries already written by an earlier
+    delivery (same ingest_key) or readings a device already sent (same
+    device, sequence and recorded_at) are skipped by the insert. Returns
+    (created, duplicates, dropped).
+    """
+    records = []
+    dropped = 0
+    for entry_id, fields in entries:
+        try:
+            records.append(parse_entry(entry_id, fields))
+        except (KeyError, TypeError, ValueError) as e:
+            dropped += 1
+            logger.warning("Dropping heart rate stream entry %s: %s", entry_id, e)
+
+    existing_patients = set(
+        Patient.objects.filter(id__in={r.patient_id for r in records}).values_list("id", flat=True)
+    )
+    kept = [r for r in records if r.patient_id in existing_patients]
+    dropped += len(records) - len(kept)
+    device_ids = {r.device_id for r in kept if r.device_id is not None}
+    if device_ids:
+        # a device deleted since the reading was queued, keep the reading without it
+        existing_devices = set(Device.objects.filter(id__in=device_ids).values_list("id", flat=True))
+        for record in kept:
+            if record.device_id not in existing_devices:
+                record.device_id = None
+
+    with transaction.atomic():
+        created = insert_records(kept)
+        on_records_created(created)
+    return len(created), len(kept) - len(created), dropped
+
+
+def _acknowledge(client, ids, dead=()):
+    pipe = client.pipeline()
+    for entry_id, fields, error, deliveries in dead:
+        pipe.xadd(DEAD_LETTER_KEY, {**fields, "entry_id": entry_id, "error": error[:500], "deliveries": deliveries})
+    pipe.xack(STREAM_KEY, GROUP, *ids)
+    # written, the stream keeps only what is still to do
+    pipe.xdel(STREAM_KEY, *ids)
+    pipe.execute()
+
+
+def _deliveries(client, entry_id):
+    pending = client.xpending_range(STREAM_KEY, GROUP, min=entry_id, max=entry_id, count=1)
+    return pending[0]["times_delivered"] if pending else 0
+
+
+def _count(stats, result):
+    created, duplicates, dropped = result
+    stats["created"] += created
+    stats["duplicates"] += duplicates
+    stats["dropped"] += dropped
+
+
+def _process(client, entries, stats):
+    try:
+        result = persist_entries(entries)
+    except Exception as e:
+        if len(entries) == 1:
+            _failed(client, entries[0], e, stats)
+            return
+        if isinstance(e, IntegrityError):
+            # e.g. another consumer wrote part of this batch concurrently
+            logger.warning("Conflict writing %s heart rate stream entries, retrying one by one", len(entries))
+        else:
+            logger.exception("Could not write %s heart rate stream entries, retrying one by one", len(entries))
+        for entry in entries:
+            _process(client, [entry], stats)
+        return
+    _acknowledge(client, [entry_id for entry_id, _ in entries])
+    _count(stats, result)
+    stats["batches"] += 1
+
+
+def _failed(client, entry, error, stats):
+    """Leave a failed entry pending for a retry, or dead-letter it after MAX_DELIVERIES."""
+    entry_id, fields = entry
+    deliveries = _deliveries(client, entry_id)
+    if deliveries < MAX_DELIVERIES:
+        logger.warning("Heart rate stream entry %s failed (delivery %s): %s", entry_id, deliveries, error)
+        stats["failed"] += 1
+        return
+    logger.error("Dead-lettering heart rate stream entry %s after %s deliveries: %s", entry_id, deliveries, error)
+    _acknowledge(client, [entry_id], dead=[(entry_id, fields, f"{type(error).__name__}: {error}", deliveries)])
+    stats["dead_lettered"] += 1
+
+
+def drain(consumer=None, count=DRAIN_BATCH, max_batches=DRAIN_MAX_BATCHES, claim_idle_ms=CLAIM_IDLE_MS,
+          client=redis_client):
+    """
+    Reclaim entries idle in pending lists (including entries that failed
+    before), then read new entries in batches of `count` until the stream is
+    empty or max_batches batches have been read.
+    """
+    ensure_group(client)
+    consumer = consumer or consumer_name()
+    stats = {
+        "created": 0, "duplicates": 0, "dropped": 0, "batches": 0, "claimed": 0, "failed": 0, "dead_lettered": 0,
+    }
+
+    start = "0-0"
+    while True:
+        start, claimed, *_ = client.xautoclaim(
+            STREAM_KEY, GROUP, consumer, claim_idle_ms, start_id=start, count=count
+        )
+        if claimed:
+            stats["claimed"] += len(claimed)
+            _process(client, claimed, stats)
+        if start == "0-0":
+            break
+
+    for _ in range(max_batches):
+        response = client.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=count)
+        if not response or not response[0][1]:
+            break
+        _process(client, response[0][1], stats)
+    return stats
+
+
+# ---------------- metrics ----------------
+def _entry_age(entry_id, now_ms):
+    return max(now_ms - int(entry_id.split("-")[0]), 0) / 1000
+
+
+def stream_lag(client=redis_client):
+    """
+    Backlog of the write-behind stream: entries not yet read by the group
+    (lag), entries read but not acknowledged (pending) and the age in
+    seconds of the oldest reading still waiting to be written.
+    """
+    now_ms = int(time.time() * 1000)
+    metrics = {"length": 0, "lag": 0, "pending": 0, "oldest_seconds": 0.0}
+    try:
+        groups = client.xinfo_groups(STREAM_KEY)
+    except ResponseError:
+        return metrics  # stream not created yet
+    metrics["length"] = client.xlen(STREAM_KEY)
+
+    group = next((g for g in groups if g["name"] == GROUP), None)
+    last_delivered = group["last-delivered-id"] if group else "0-0"
+    undelivered = client.xrange(STREAM_KEY, min=f"({last_delivered}", count=1)
+
+    oldest = []
+    if group and group["pending"]:
+        metrics["pending"] = group["pending"]
+        oldest.append(client.xpending(STREAM_KEY, GROUP)["min"])
+    lag = group.get("lag") if group else metrics["length"]
+    if lag is None:
+        # Redis < 7 has no lag field (and 7 reports none after deletions). Handled
+        # entries are XDEL'd, so whatever is in the stream and not pending is unread.
+        lag = max(metrics["length"] - metrics["pending"], 0)
+    metrics["lag"] = lag
+    if undelivered:
+        oldest.append(undelivered[0][0])
+    if oldest:
+        metrics["oldest_seconds"] = max(_entry_age(entry_id, now_ms) for entry_id in oldest)
+    return metrics
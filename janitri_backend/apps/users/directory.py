@@ -0,0 +1,58 @@
+# apps/users/directory.py
+"""
+Notifiable staff per place, cached so alert fan-out does not query users.
+
+Each place maps to a list of (email, role) of its active staff with an
+email address, stored under one cache key per place. Lists are loaded for
+all missing places with one query and dropped whenever a user's place,
+role, email or active flag changes (see signals.py). USER_DIRECTORY_TTL
+bounds how long a missed invalidation (e.g. a queryset .update()) lasts.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+
+KEY = "users:directory:place:{}"
+TTL = getattr(settings, "USER_DIRECTORY_TTL", 3600)
+
+# changes to these fields can move a user in or out of a place's list
+DIRECTORY_FIELDS = {"place", "place_id", "role", "email", "is_active"}
+
+
+def get_place_staff(place_ids):
+    """{place_id: [(email, role), ...]} for every given place, empty lists included."""
+    place_ids = {place_id for place_id in place_ids if place_id is not None}
+    keys = {KEY.format(place_id): place_id for place_id in place_ids}
+    cached = cache.get_many(keys)
+    staff = {keys[key]: value for key, value in cached.items()}
+
+    missing = place_ids - set(staff)
+    if missing:
+        loaded = {place_id: [] for place_id in missing}
+        rows = (
+            User.objects.filter(place_id__in=missing, is_active=True)
+            .exclude(email="")
+            .order_by("id")
+            .values_list("place_id", "email", "role")
+        )
+        for place_id, email, role in rows:
+            loaded[place_id].append((email, role))
+        cache.set_many({KEY.format(place_id): value for place_id, value in loaded.items()}, TTL)
+        staff.update(loaded)
+    return staff
+
+
+def get_recipients(place_ids, roles=("DOCTOR",)):
+    """{place_id: [email, ...]} of the staff with one of the given roles."""
+    return {
+        place_id: [email for email, role in members if role in roles]
+        for place_id, members in get_place_staff(place_ids).items()
+    }
+
+
+def invalidate_places(place_ids):
+    keys = [KEY.format(place_id) for place_id in place_ids if place_id is not None]
+    if keys:
+        cache.delete_many(keys)
@@ -5,9 +5,10 @@ from apps.places.models import Place
 from apps.common.validators import phone_validator
 from utils.constants.choices import ROLE_CHOICES
 from apps.places.serializers import PlaceSerializer
+from apps.common.serializers import DynamicFieldsModelSerializer
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsModelSerializer):
     phone = serializers.CharField(required=False, validators=[phone_validator])
     place_detail = PlaceSerializer(source="place", read_only=True)
     class Meta:
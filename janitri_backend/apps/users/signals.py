@@ -0,0 +1,45 @@
+# apps/users/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .directory import DIRECTORY_FIELDS, invalidate_places
+from .models import User
+from apps.places.models import Place
+
+
+def _touches_directory(update_fields):
+    return update_fields is None or bool(DIRECTORY_FIELDS & set(update_fields))
+
+
+@receiver(pre_save, sender=User)
+def remember_directory_place(sender, instance, update_fields=None, **kwargs):
+    """Keep the place a user is moving away from, its list has to be dropped too."""
+    if instance.pk and _touches_directory(update_fields):
+        instance._directory_previous_place_id = (
+            User.objects.filter(pk=instance.pk).values_list("place_id", flat=True).first()
+        )
+
+
+def _invalidate(place_ids):
+    invalidate_places(place_ids)
+    # again after commit, a concurrent read may have cached the old rows meanwhile
+    transaction.on_commit(lambda: invalidate_places(place_ids))
+
+
+@receiver(post_save, sender=User)
+def invalidate_directory_on_save(sender, instance, update_fields=None, **kwargs):
+    if _touches_directory(update_fields):
+        _invalidate({instance.place_id, getattr(instance, "_directory_previous_place_id", None)})
+
+
+@receiver(post_delete, sender=User)
+def invalidate_directory_on_delete(sender, instance, **kwargs):
+    _invalidate({instance.place_id})
+
+
+@receiver(post_delete, sender=Place)
+def invalidate_directory_on_place_delete(sender, instance, **kwargs):
+    # staff are detached with a bulk SET NULL that sends no signals
+    _invalidate({instance.pk})
@@ -6,6 +6,7 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from apps.users.models import User
 from apps.places.models import Place
+from apps.users.directory import get_place_staff, get_recipients, invalidate_places
 
 class UserTests(APITestCase):
     def setUp(self):
@@ -72,3 +73,51 @@ class UserTests(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(User.objects.filter(email="doctor2@test.com").exists())
+
+
+class RecipientDirectoryTests(TestCase):
+    def setUp(self):
+        self.ward = Place.objects.create(name="Ward")
+        self.icu = Place.objects.create(name="ICU")
+        invalidate_places([self.ward.id, self.icu.id])
+        self.doctor = User.objects.create_user(
+            email="doc@test.com", first_name="Doc", password="x", role="DOCTOR", place=self.ward
+        )
+        User.objects.create_user(email="nurse@test.com", first_name="Nurse", password="x", role="NURSE", place=self.ward)
+
+    def test_lists_are_cached_per_place(self):
+        with self.assertNumQueries(1):
+            staff = get_place_staff([self.ward.id, self.icu.id])
+        self.assertEqual(staff[self.ward.id], [("doc@test.com", "DOCTOR"), ("nurse@test.com", "NURSE")])
+        self.assertEqual(staff[self.icu.id], [])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_recipients([self.ward.id, self.icu.id]), {self.ward.id: ["doc@test.com"], self.icu.id: []})
+
+    def test_role_change_invalidates(self):
+        get_recipients([self.ward.id])
+        self.doctor.role = "NURSE"
+        self.doctor.save()
+        self.assertEqual(get_recipients([self.ward.id]), {self.ward.id: []})
+
+    def test_place_change_invalidates_both_places(self):
+        get_recipients([self.ward.id, self.icu.id])
+        self.doctor.place = self.icu
+        self.doctor.save()
+        self.assertEqual(get_recipients([self.ward.id, self.icu.id]), {self.ward.id: [], self.icu.id: ["doc@test.com"]})
+
+    def test_deactivated_and_deleted_users_are_dropped(self):
+        get_recipients([self.ward.id])
+        self.doctor.is_active = False
+        self.doctor.save()
+        self.assertEqual(get_recipients([self.ward.id]), {self.ward.id: []})
+        self.doctor.is_active = True
+        self.doctor.save()
+        self.doctor.delete()
+        self.assertEqual(get_recipients([self.ward.id]), {self.ward.id: []})
+
+    def test_unrelated_update_keeps_cache(self):
+        get_recipients([self.ward.id])
+        with self.assertNumQueries(1):
+            self.doctor.save(update_fields=["last_login"])
+        with self.assertNumQueries(0):
+            get_recipients([self.ward.id])
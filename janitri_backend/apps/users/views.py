@@ -4,7 +4,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.utils.crypto import get_random_string
-from django.db import DatabaseError
+from django.db import DatabaseError, transaction
 
 from .serializers import (
     UserSerializer,
@@ -16,18 +16,19 @@ from .serializers import (
 from apps.common.serializers import StatusUpdateSerializer
 from .permissions import IsAdminRole, IsSelfOrAdmin
 from utils.responses import success_response, error_response
-from utils.services.email.send_mail import send_email
+from apps.common.outbox import queue_email
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from apps.common.pagination import StandardResultsSetPagination
+from apps.common.mixins import EagerLoadingMixin
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
 
 User = get_user_model()
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     User management API:
     - Default actions: list, retrieve, create, update, partial_update, destroy
@@ -115,21 +116,22 @@ class UserViewSet(viewsets.ModelViewSet):
             return error_response(message="Invalid input", errors=serializer.errors, status=400)
 
         try:
-            user = serializer.save()
-            password = get_random_string(8)
-            user.set_password(password)
-            user.save()
-
-            send_email(
-                subject="Welcome to Janitri - Your Account Details",
-                to_email=user.email,
-                template_name="welcome_email_with_credentials",
-                context={
-                    "user": user,
-                    "email": user.email,
-                    "password": password
-                    },
-                )
+            with transaction.atomic():
+                user = serializer.save()
+                password = get_random_string(8)
+                user.set_password(password)
+                user.save()
+
+                queue_email(
+                    subject="Welcome to Janitri - Your Account Details",
+                    to_email=user.email,
+                    template_name="welcome_email_with_credentials",
+                    context={
+                        "user": user,
+                        "email": user.email,
+                        "password": password
+                        },
+                    )
             return success_response(message="User created", data=UserSerializer(user).data, status=201)
         except Exception as e:
             return error_response(message="Error creating user", errors=str(e), status=500)
@@ -175,13 +177,14 @@ class UserViewSet(viewsets.ModelViewSet):
             return error_response(message="Invalid input", errors=serializer.errors, status=400)
 
         try:
-            user = serializer.save()
-            send_email(
-                subject="Welcome to Janitri",
-                to_email=user.email,
-                template_name="welcome_email",
-                context={"user": user, "company_name": "Janitri"},
-            )
+            with transaction.atomic():
+                user = serializer.save()
+                queue_email(
+                    subject="Welcome to Janitri",
+                    to_email=user.email,
+                    template_name="welcome_email",
+                    context={"user": user, "company_name": "Janitri"},
+                )
             return success_response(message="Registered successfully", data=UserSerializer(user).data, status=201)
         except Exception as e:
             return error_response(message="Error during registration", errors=str(e), status=500)
@@ -209,17 +212,18 @@ class UserViewSet(viewsets.ModelViewSet):
             return error_response(message="Invalid input", errors=serializer.errors, status=400)
 
         try:
-            user = serializer.save()
-            password = get_random_string(8)
-            user.set_password(password)
-            user.save()
-
-            send_email(
-                subject="Welcome to Janitri - Your Account Details",
-                to_email=user.email,
-                template_name="welcome_email_with_credentials",
-                context={"user": user, "email": user.email, "password": password},
-            )
+            with transaction.atomic():
+                user = serializer.save()
+                password = get_random_string(8)
+                user.set_password(password)
+                user.save()
+
+                queue_email(
+                    subject="Welcome to Janitri - Your Account Details",
+                    to_email=user.email,
+                    template_name="welcome_email_with_credentials",
+                    context={"user": user, "email": user.email, "password": password},
+                )
             return success_response(message="User created", data=UserSerializer(user).data, status=201)
         except Exception as e:
             return error_response(message="Error creating user", errors=str(e), status=500)
@@ -169,6 +169,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    # archived heart rate readings (apps/records/archive.py), swap for an object store backend in production
+    "heart_rate_archive": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": config("HEART_RATE_ARCHIVE_ROOT", default=str(BASE_DIR / "archive"))},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -279,6 +289,9 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# list views (by class name) that use keyset pagination even without ?pagination=cursor
+KEYSET_PAGINATION_VIEWS = []
+
 
 # SMTP CONFIGURATION
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -288,6 +301,15 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 EMAIL_USE_TLS = config("EMAIL_USE_TLS", cast=bool, default=True)
 DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default=EMAIL_HOST_USER)
+# Workers keep one SMTP connection open between sends (utils/services/email/pool.py)
+EMAIL_POOL_MAX_MESSAGES = config("EMAIL_POOL_MAX_MESSAGES", cast=int, default=50)
+EMAIL_POOL_IDLE_SECONDS = config("EMAIL_POOL_IDLE_SECONDS", cast=int, default=30)
+# Outgoing email is queued in EmailOutbox and sent by a Celery drainer (apps/common/outbox.py)
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_BATCHES = 20  # per task run
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8  # then the message is marked DEAD
+EMAIL_OUTBOX_BACKOFF_SECONDS = 30  # doubled after every failed attempt
+EMAIL_OUTBOX_BACKOFF_MAX_SECONDS = 3600
 
 
 # redis
@@ -299,6 +321,70 @@ REDIS_PASSWORD = config("REDIS_PASSWORD", None)
 
 ALERT_CRITICAL_HIGH = 120
 ALERT_CRITICAL_LOW = 40
+ALERT_RENOTIFY_COOLDOWN = 900  # seconds before an open alert notifies again
+USER_DIRECTORY_TTL = 3600  # seconds a cached per-place staff list may live (apps/users/directory.py)
+# Unresolved alerts escalate one tier per SLA period. A new alert already emails the doctors (the first tier),
+# escalation goes to the tiers after it (apps/alerts/escalation.py)
+ALERT_ESCALATION_TIERS = ["DOCTOR", "ADMIN"]
+ALERT_ESCALATION_SLA = {"CRITICAL": 300, "HIGH": 900, "MEDIUM": 1800, "LOW": 3600}  # seconds
+ALERT_ESCALATION_BATCH_SIZE = 200
+ALERT_ESCALATION_MAX_BATCHES = 25  # per task run
+
+# windowed alert rules keep per patient state: "redis" (shared) or "local" (per process)
+ALERT_WINDOW_STATE = config("ALERT_WINDOW_STATE", default="redis")
+ALERT_WINDOW_STATE_TTL = 86400  # seconds without readings before a patient's state is dropped
+ALERT_WINDOW_TIME_BUCKETS = 12  # slots per time window, ~200 bytes of state per rule and patient
+
+# bulk heart rate ingestion
+HEART_RATE_BULK_MAX_ITEMS = 5000
+HEART_RATE_BULK_BATCH_SIZE = 1000
+HEART_RATE_MAX_CLOCK_SKEW = 300  # seconds a client supplied recorded_at may be ahead of server time
+HEART_RATE_BACKFILL_CHUNK_SIZE = 50000  # rows per COPY in import_heart_rate_history
+HEART_RATE_CHART_MAX_POINTS = 5000  # upper bound of ?points= on the chart endpoint
+HEART_RATE_AGGREGATE_MAX_BUCKETS = 100000  # buckets per group on the aggregate endpoint
+
+# packed high-frequency waveforms (apps/records/waveform.py)
+WAVEFORM_SEGMENT_SECONDS = 60  # duration of one stored segment
+WAVEFORM_MAX_SAMPLES = 86400  # per upload
+WAVEFORM_MAX_RANGE_SECONDS = 6 * 3600  # per range read
+
+# per patient analytics (apps/records/analytics.py)
+HEART_RATE_NORMAL_RANGE = (110, 160)  # bpm, time in range is reported against it
+HEART_RATE_EXCURSION_BPM = 15  # distance from baseline of an acceleration / deceleration
+HEART_RATE_EXCURSION_SECONDS = 15  # minimum duration of an acceleration / deceleration
+HEART_RATE_ANALYTICS_MAX_GAP_SECONDS = 60  # longer gaps between readings are signal loss
+HEART_RATE_ANALYTICS_CACHE_GRANULARITY = 60  # windows are widened to whole minutes
+HEART_RATE_ANALYTICS_CACHE_TTL = 3600  # closed windows
+HEART_RATE_ANALYTICS_LIVE_TTL = 60  # windows that reach the present
+
+# device streaming ingest
+HEART_RATE_STREAM_BATCH_SIZE = 500
+HEART_RATE_STREAM_FLUSH_INTERVAL = 1.0  # seconds
+DEVICE_ASSIGNMENT_CACHE_TTL = 300  # seconds
+
+# optional range partitioning of heart rate records (PostgreSQL only)
+# convert once with `python manage.py heart_rate_partitions --convert`
+HEART_RATE_PARTITIONING = config("HEART_RATE_PARTITIONING", default=False, cast=bool)
+HEART_RATE_PARTITION_INTERVAL = config("HEART_RATE_PARTITION_INTERVAL", default="month")  # "day" or "month"
+HEART_RATE_PARTITION_PREMAKE = 3  # future partitions kept ready
+HEART_RATE_PARTITION_RETENTION = config("HEART_RATE_PARTITION_RETENTION", default=None, cast=lambda v: int(v) if v else None)
+
+# heart rate ingest mode: "sync" writes in the request, "stream" buffers
+# readings in a Redis stream drained by Celery (apps/records/writebehind.py)
+HEART_RATE_INGEST_MODE = config("HEART_RATE_INGEST_MODE", default="sync")
+HEART_RATE_INGEST_STREAM = "heart-rate:ingest"
+HEART_RATE_INGEST_GROUP = "heart-rate-writers"
+HEART_RATE_INGEST_DRAIN_BATCH = 2000
+HEART_RATE_INGEST_DRAIN_MAX_BATCHES = 50  # per task run
+HEART_RATE_INGEST_CLAIM_IDLE_MS = 60000  # reclaim entries a dead worker left unacknowledged
+HEART_RATE_INGEST_MAX_BACKLOG = 1000000  # unwritten entries before ingest answers 503
+HEART_RATE_INGEST_MAX_DELIVERIES = 5  # failed deliveries before an entry goes to the dead-letter stream
+HEART_RATE_INGEST_DEAD_LETTER_STREAM = "heart-rate:ingest:dead"
+
+# retention: raw readings older than this many days are moved into per patient-month
+# archive files and deleted from the table (apps/records/archive.py), None keeps everything
+HEART_RATE_ARCHIVE_AFTER_DAYS = config("HEART_RATE_ARCHIVE_AFTER_DAYS", default=None, cast=lambda v: int(v) if v else None)
+HEART_RATE_ARCHIVE_DELETE_BATCH = 5000  # archived rows deleted per transaction
 
 
 CELERY_BROKER_URL = "redis://localhost:6379/0"
@@ -306,7 +392,31 @@ CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 
 # Optional: retry failed tasks automatically
 CELERY_TASK_ACKS_LATE = True
-CELERY_BEAT_SCHEDULE = {}
+CELERY_BEAT_SCHEDULE = {
+    "drain-email-outbox": {
+        "task": "apps.common.tasks.drain_email_outbox",
+        "schedule": timedelta(seconds=30),
+    },
+    "escalate-alerts": {
+        "task": "apps.alerts.tasks.escalate_alerts",
+        "schedule": timedelta(seconds=30),
+    },
+}
+if HEART_RATE_INGEST_MODE == "stream":
+    CELERY_BEAT_SCHEDULE["drain-heart-rate-ingest"] = {
+        "task": "apps.records.tasks.drain_heart_rate_ingest",
+        "schedule": timedelta(seconds=2),
+    }
+if HEART_RATE_PARTITIONING:
+    CELERY_BEAT_SCHEDULE["maintain-heart-rate-partitions"] = {
+        "task": "apps.records.tasks.maintain_heart_rate_partitions",
+        "schedule": timedelta(hours=6),
+    }
+if HEART_RATE_ARCHIVE_AFTER_DAYS is not None:
+    CELERY_BEAT_SCHEDULE["archive-heart-rate-records"] = {
+        "task": "apps.records.tasks.archive_heart_rate_records",
+        "schedule": timedelta(days=1),
+    }
 
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
@@ -18,6 +18,41 @@ GENDER_CHOICES = (
     ("O", "Other"),
 )
 
+ROLLUP_RESOLUTION_CHOICES = (
+    ("1m", "1 minute"),
+    ("1h", "1 hour"),
+    ("1d", "1 day"),
+)
+
+# ordered from least to most severe
+ALERT_SEVERITY_CHOICES = (
+    ("LOW", "Low"),
+    ("MEDIUM", "Medium"),
+    ("HIGH", "High"),
+    ("CRITICAL", "Critical"),
+)
+
+ALERT_OPERATOR_CHOICES = (
+    ("gt", "Greater than"),
+    ("gte", "Greater than or equal"),
+    ("lt", "Less than"),
+    ("lte", "Less than or equal"),
+    ("eq", "Equal"),
+    ("ne", "Not equal"),
+)
+
+ALERT_WINDOW_CHOICES = (
+    ("sample", "Single reading"),
+    ("count", "Matches in last N readings"),
+    ("time", "Mean over last N seconds"),
+)
+
+EMAIL_OUTBOX_STATUS_CHOICES = (
+    ("PENDING", "Pending"),
+    ("SENT", "Sent"),
+    ("DEAD", "Dead"),
+)
+
 
 
 
@@ -33,4 +68,7 @@ CHOICES_MAP = {
     "role": ROLE_CHOICES,
     "gender": GENDER_CHOICES,
     "relation": RELATION_CHOICES,
+    "alert_severity": ALERT_SEVERITY_CHOICES,
+    "alert_operator": ALERT_OPERATOR_CHOICES,
+    "alert_window": ALERT_WINDOW_CHOICES,
 }
\ No newline at end of file
@@ -0,0 +1,86 @@
+# utils/services/email/pool.py
+"""
+A per-process email connection kept open between sends.
+
+Consecutive sends in one worker (a burst of alerts) share a connection
+instead of paying a TCP + TLS + AUTH handshake per message. The connection
+is recycled after EMAIL_POOL_MAX_MESSAGES messages or once it has been idle
+for EMAIL_POOL_IDLE_SECONDS, and reopened once if the server dropped it.
+"""
+
+import logging
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGES = getattr(settings, "EMAIL_POOL_MAX_MESSAGES", 50)
+IDLE_SECONDS = getattr(settings, "EMAIL_POOL_IDLE_SECONDS", 30)
+
+
+class PooledConnection:
+    def __init__(self, max_messages=MAX_MESSAGES, idle_seconds=IDLE_SECONDS, **backend_kwargs):
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+        self.backend_kwargs = backend_kwargs
+        self.opened = 0
+        self._backend = None
+        self._sent = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self._backend = get_connection(**self.backend_kwargs)
+        self._backend.open()
+        self._sent = 0
+        self.opened += 1
+
+    def _close(self):
+        if self._backend is None:
+            return
+        try:
+            self._backend.close()
+        except Exception as e:
+            logger.debug("Error closing pooled email connection: %s", e)
+        self._backend = None
+
+    def _expired(self):
+        return self._sent >= self.max_messages or time.monotonic() - self._last_used > self.idle_seconds
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def send_messages(self, messages):
+        """Send messages over the pooled connection. Returns the number sent."""
+        sent = 0
+        with self._lock:
+            for message in messages:
+                if self._backend is not None and self._expired():
+                    self._close()
+                if self._backend is None:
+                    self._open()
+                try:
+                    sent += self._backend.send_messages([message])
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # the server dropped the connection while it sat idle, retry once on a fresh one
+                    self._close()
+                    self._open()
+                    sent += self._backend.send_messages([message])
+                self._sent += 1
+                self._last_used = time.monotonic()
+        return sent
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = PooledConnection()
+    return _pool
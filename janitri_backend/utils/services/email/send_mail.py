@@ -7,13 +7,13 @@ from utils.constants.const import (
     YEAR
 )
 
-def send_email(subject, to_email, template_name, context):
+
+def render_email(template_name, context):
     """
-    Send email using both HTML and plain text templates.
+    Render the plain text and HTML templates of an email once.
+    Returns (text_content, html_content).
     """
-    
-    if context is None:
-        context = {}
+    context = dict(context or {})
 
     # Add default values if not already present
     context.setdefault("company_name", COMPANY_NAME)
@@ -23,12 +23,28 @@ def send_email(subject, to_email, template_name, context):
     text_content = render_to_string(f"emails/{template_name}.txt", context)
     # HTML template
     html_content = render_to_string(f"emails/{template_name}.html", context)
+    return text_content, html_content
 
+
+def build_email(subject, to_email, text_content, html_content, connection=None):
+    """
+    Build a message from already rendered content, one per recipient so
+    recipients never see each other's addresses.
+    """
     email = EmailMultiAlternatives(
         subject=subject,
         body=text_content,
         from_email=settings.DEFAULT_FROM_EMAIL,
         to=[to_email],
+        connection=connection,
     )
     email.attach_alternative(html_content, "text/html")
-    email.send()
+    return email
+
+
+def send_email(subject, to_email, template_name, context):
+    """
+    Send email using both HTML and plain text templates.
+    """
+    text_content, html_content = render_email(template_name, context)
+    build_email(subject, to_email, text_content, html_content).send()
@@ -0,0 +1,99 @@
+# utils/services/email/sink.py
+"""
+A local SMTP stand-in that accepts and discards mail.
+
+It speaks just enough SMTP (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT)
+for Django's SMTP backend, and counts connections, messages and recipients
+so email throughput can be measured offline. Not for production use.
+"""
+
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def read_data(self):
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                return bool(line)
+
+    def handle(self):
+        sink = self.server.sink
+        sink.count("connections")
+        recipients = 0
+        self.reply("220 localhost SMTP sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].decode("ascii", "replace").upper()
+            if command == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 8BITMIME")
+            elif command == "HELO":
+                self.reply("250 localhost")
+            elif command == "MAIL":
+                recipients = 0
+                self.reply("250 OK")
+            elif command == "RCPT":
+                recipients += 1
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                if not self.read_data():
+                    return
+                sink.count("messages")
+                sink.count("recipients", recipients)
+                self.reply("250 OK")
+            elif command in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SMTPSink:
+    """Run with serve_forever() in the foreground or start() / stop() in a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = _Server((host, port), _Handler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address[:2]
+        self.stats = {"connections": 0, "messages": 0, "recipients": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()